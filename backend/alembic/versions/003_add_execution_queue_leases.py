@@ -0,0 +1,34 @@
+"""Add durable execution queue columns to workflow_executions
+
+Revision ID: 003_add_execution_queue_leases
+Revises: 002_add_workflow_id_to_documents
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '003_add_execution_queue_leases'
+down_revision = '002_add_workflow_id_to_documents'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Queue and lease bookkeeping for executions
+    op.add_column('workflow_executions', sa.Column('mode', sa.String(), nullable=True, server_default='sync'))
+    op.add_column('workflow_executions', sa.Column('attempts', sa.Integer(), nullable=True, server_default='0'))
+    op.add_column('workflow_executions', sa.Column('lease_owner', sa.String(), nullable=True))
+    op.add_column('workflow_executions', sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=True))
+    
+    # Workers poll for pending executions and sweep expired running ones by status
+    op.create_index('ix_workflow_executions_status', 'workflow_executions', ['status'])
+
+
+def downgrade():
+    op.drop_index('ix_workflow_executions_status', table_name='workflow_executions')
+    op.drop_column('workflow_executions', 'lease_expires_at')
+    op.drop_column('workflow_executions', 'lease_owner')
+    op.drop_column('workflow_executions', 'attempts')
+    op.drop_column('workflow_executions', 'mode')
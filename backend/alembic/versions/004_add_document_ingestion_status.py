@@ -0,0 +1,39 @@
+"""Add ingestion status and progress to documents
+
+Revision ID: 004_add_document_ingestion_status
+Revises: 003_add_execution_queue_leases
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '004_add_document_ingestion_status'
+down_revision = '003_add_execution_queue_leases'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing documents were ingested synchronously, so they start out completed
+    op.add_column('documents', sa.Column('status', sa.String(), nullable=True, server_default='completed'))
+    op.add_column('documents', sa.Column('progress', sa.Integer(), nullable=True, server_default='100'))
+    op.add_column('documents', sa.Column('error_message', sa.Text(), nullable=True))
+    op.add_column('documents', sa.Column('ingest_job_id', postgresql.UUID(as_uuid=True), nullable=True))
+    op.add_column('documents', sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True, server_default=sa.func.now()))
+    
+    # Workers look documents up by job and sweep unfinished ones by status
+    op.create_index('ix_documents_status', 'documents', ['status'])
+    op.create_index('ix_documents_ingest_job_id', 'documents', ['ingest_job_id'])
+
+
+def downgrade():
+    op.drop_index('ix_documents_ingest_job_id', table_name='documents')
+    op.drop_index('ix_documents_status', table_name='documents')
+    op.drop_column('documents', 'updated_at')
+    op.drop_column('documents', 'ingest_job_id')
+    op.drop_column('documents', 'error_message')
+    op.drop_column('documents', 'progress')
+    op.drop_column('documents', 'status')
@@ -0,0 +1,36 @@
+"""Add content-addressed blobs for uploaded documents
+
+Revision ID: 005_add_content_blobs
+Revises: 004_add_document_ingestion_status
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005_add_content_blobs'
+down_revision = '004_add_document_ingestion_status'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Uploaded files stored once per sha256, reference-counted by the documents using them
+    op.create_table(
+        'content_blobs',
+        sa.Column('sha256', sa.String(length=64), primary_key=True),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now())
+    )
+    
+    # Existing documents keep their own files and have no content hash
+    op.add_column('documents', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_index('ix_documents_content_hash', 'documents', ['content_hash'])
+
+
+def downgrade():
+    op.drop_index('ix_documents_content_hash', table_name='documents')
+    op.drop_column('documents', 'content_hash')
+    op.drop_table('content_blobs')
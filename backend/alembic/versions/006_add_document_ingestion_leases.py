@@ -0,0 +1,26 @@
+"""Add ingestion lease columns to documents
+
+Revision ID: 006_add_document_ingestion_leases
+Revises: 005_add_content_blobs
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '006_add_document_ingestion_leases'
+down_revision = '005_add_content_blobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The ingestion worker holding a claimed document, renewed by its heartbeat
+    op.add_column('documents', sa.Column('lease_owner', sa.String(), nullable=True))
+    op.add_column('documents', sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    op.drop_column('documents', 'lease_expires_at')
+    op.drop_column('documents', 'lease_owner')
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.database import get_db
 from app.schemas.api_keys import ApiKeyCreate, ApiKeyUpdate, ApiKeyResponse, ApiKeysListResponse
 from app.services.api_key_service import ApiKeyService
@@ -13,12 +13,12 @@ router = APIRouter(prefix="/api-keys", tags=["api-keys"])
 async def create_or_update_api_key(
     api_key_data: ApiKeyCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Create or update an API key for the current user"""
     api_key_service = ApiKeyService(db)
     try:
-        return api_key_service.create_api_key(str(current_user.id), api_key_data)
+        return await api_key_service.create_api_key(str(current_user.id), api_key_data)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -29,11 +29,11 @@ async def create_or_update_api_key(
 @router.get("/", response_model=ApiKeysListResponse)
 async def get_api_keys(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get all API keys for the current user (without actual key values)"""
     api_key_service = ApiKeyService(db)
-    api_keys = api_key_service.get_api_keys(str(current_user.id))
+    api_keys = await api_key_service.get_api_keys(str(current_user.id))
     return ApiKeysListResponse(api_keys=api_keys)
 
 
@@ -41,11 +41,11 @@ async def get_api_keys(
 async def get_api_key_value(
     key_name: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get the decrypted value of a specific API key (for internal use)"""
     api_key_service = ApiKeyService(db)
-    api_key = api_key_service.get_decrypted_api_key(str(current_user.id), key_name)
+    api_key = await api_key_service.get_decrypted_api_key(str(current_user.id), key_name)
     
     if not api_key:
         raise HTTPException(
@@ -61,11 +61,11 @@ async def update_api_key(
     key_name: str,
     api_key_data: ApiKeyUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Update an existing API key"""
     api_key_service = ApiKeyService(db)
-    updated_key = api_key_service.update_api_key(str(current_user.id), key_name, api_key_data)
+    updated_key = await api_key_service.update_api_key(str(current_user.id), key_name, api_key_data)
     
     if not updated_key:
         raise HTTPException(
@@ -80,11 +80,11 @@ async def update_api_key(
 async def delete_api_key(
     key_name: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Delete an API key"""
     api_key_service = ApiKeyService(db)
-    success = api_key_service.delete_api_key(str(current_user.id), key_name)
+    success = await api_key_service.delete_api_key(str(current_user.id), key_name)
     
     if not success:
         raise HTTPException(
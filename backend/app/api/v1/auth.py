@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 
 from app.core.database import get_db
@@ -16,12 +16,12 @@ security = HTTPBearer()
 
 
 @router.post("/register", response_model=UserResponse)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     """Register a new user"""
     auth_service = AuthService(db)
     
     try:
-        user = auth_service.create_user(user_data)
+        user = await auth_service.create_user(user_data)
         # Ensure UUID is returned as string
         user_dict = user.__dict__.copy()
         user_dict['id'] = str(user_dict['id'])
@@ -34,11 +34,11 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=Token)
-async def login(user_data: UserLogin, db: Session = Depends(get_db)):
+async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
     """Authenticate user and return access token"""
     auth_service = AuthService(db)
     
-    user = auth_service.authenticate_user(user_data.email, user_data.password)
+    user = await auth_service.authenticate_user(user_data.email, user_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -1,5 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from typing import List
 from datetime import datetime
 
@@ -15,8 +17,13 @@ from app.utils.dependencies import get_current_user
 router = APIRouter(prefix="/chat", tags=["chat"])
 
 @router.get("/sessions", response_model=List[ChatSessionResponse])
-async def get_sessions(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    sessions = db.query(ChatSession).filter(ChatSession.user_id == current_user.id).all()
+async def get_sessions(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+    result = await db.execute(
+        select(ChatSession)
+        .filter(ChatSession.user_id == current_user.id)
+        .options(selectinload(ChatSession.messages))
+    )
+    sessions = result.scalars().all()
     return [ChatSessionResponse(
         id=str(s.id),
         user_id=str(s.user_id),
@@ -33,7 +40,7 @@ async def get_sessions(db: Session = Depends(get_db), current_user: User = Depen
     ) for s in sessions]
 
 @router.post("/sessions", response_model=ChatSessionResponse)
-async def create_session(session: ChatSessionCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def create_session(session: ChatSessionCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
     db_session = ChatSession(
         user_id=current_user.id,
         workflow_id=session.workflow_id,
@@ -41,8 +48,8 @@ async def create_session(session: ChatSessionCreate, db: Session = Depends(get_d
         created_at=datetime.utcnow()
     )
     db.add(db_session)
-    db.commit()
-    db.refresh(db_session)
+    await db.commit()
+    await db.refresh(db_session)
     return ChatSessionResponse(
         id=str(db_session.id),
         user_id=str(db_session.user_id),
@@ -53,8 +60,13 @@ async def create_session(session: ChatSessionCreate, db: Session = Depends(get_d
     )
 
 @router.get("/sessions/{session_id}/messages", response_model=List[ChatMessageResponse])
-async def get_messages(session_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    session = db.query(ChatSession).filter(ChatSession.id == session_id, ChatSession.user_id == current_user.id).first()
+async def get_messages(session_id: str, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+    result = await db.execute(
+        select(ChatSession)
+        .filter(ChatSession.id == session_id, ChatSession.user_id == current_user.id)
+        .options(selectinload(ChatSession.messages))
+    )
+    session = result.scalars().first()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     return [ChatMessageResponse(
@@ -66,8 +78,11 @@ async def get_messages(session_id: str, db: Session = Depends(get_db), current_u
     ) for m in session.messages]
 
 @router.post("/messages", response_model=ChatMessageResponse)
-async def create_message(message: ChatMessageCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    session = db.query(ChatSession).filter(ChatSession.id == message.session_id, ChatSession.user_id == current_user.id).first()
+async def create_message(message: ChatMessageCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+    result = await db.execute(
+        select(ChatSession).filter(ChatSession.id == message.session_id, ChatSession.user_id == current_user.id)
+    )
+    session = result.scalars().first()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     db_message = ChatMessage(
@@ -77,8 +92,8 @@ async def create_message(message: ChatMessageCreate, db: Session = Depends(get_d
         timestamp=datetime.utcnow()
     )
     db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    await db.commit()
+    await db.refresh(db_message)
     return ChatMessageResponse(
         id=str(db_message.id),
         session_id=str(db_message.session_id),
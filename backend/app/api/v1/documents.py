@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
 from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 import os
 
 from app.core.database import get_db
@@ -11,9 +12,10 @@ from app.schemas.document import (
     TextExtractionRequest,
     TextExtractionResponse
 )
-from app.services.document_service import DocumentService
+from app.services.document_service import DocumentService, FileTooLargeError
 from app.models.user import User
 from app.models.document import Document
+from app.models.workflow import Workflow
 from app.utils.dependencies import get_current_user
 from app.core.config import settings
 
@@ -24,7 +26,7 @@ router = APIRouter(prefix="/documents", tags=["documents"])
 async def upload_document(
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Upload a document"""
     try:
@@ -33,10 +35,15 @@ async def upload_document(
         
         return DocumentUploadResponse(
             message=f"File '{file.filename}' uploaded successfully",
-            document_id=document.id,
+            document_id=str(document.id),
             filename=document.filename
         )
         
+    except FileTooLargeError as e:
+        raise HTTPException(
+            status_code=413,
+            detail=str(e)
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -54,18 +61,18 @@ async def get_documents(
     skip: int = 0,
     limit: int = 100,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get user's documents"""
     document_service = DocumentService(db)
-    return document_service.get_user_documents(current_user.id, skip, limit)
+    return await document_service.get_user_documents(current_user.id, skip, limit)
 
 
 @router.post("/extract-text", response_model=TextExtractionResponse)
 async def extract_text(
     request: TextExtractionRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Extract text from document"""
     try:
@@ -93,13 +100,23 @@ async def extract_text(
 async def search_documents(
     query: str,
     limit: int = 5,
+    workflow_id: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Search documents using vector similarity"""
+    """Search documents using hybrid BM25 + vector retrieval"""
+    if workflow_id:
+        # Verify workflow exists and belongs to user
+        result = await db.execute(select(Workflow).filter(
+            Workflow.id == workflow_id,
+            Workflow.user_id == current_user.id
+        ))
+        if not result.scalars().first():
+            raise HTTPException(status_code=404, detail="Workflow not found")
+    
     try:
         document_service = DocumentService(db)
-        results = await document_service.search_documents(query, current_user.id, limit)
+        results = await document_service.search_documents_hybrid(query, str(current_user.id), workflow_id, limit)
         
         return {
             "query": query,
@@ -118,14 +135,15 @@ async def search_documents(
 async def download_document(
     document_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Download a document file"""
     # Get document from database
-    document = db.query(Document).filter(
+    result = await db.execute(select(Document).filter(
         Document.id == document_id,
         Document.user_id == current_user.id
-    ).first()
+    ))
+    document = result.scalars().first()
     
     if not document:
         raise HTTPException(
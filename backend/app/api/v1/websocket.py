@@ -1,5 +1,6 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from app.services.execution_service import execution_engine
+from app.utils.websocket_manager import ingestion_websocket_manager
 
 router = APIRouter(prefix="/ws", tags=["websockets"])
 
@@ -21,3 +22,22 @@ async def websocket_execution_progress(websocket: WebSocket, execution_id: str):
         print(f"WebSocket error: {e}")
     finally:
         execution_engine.websocket_manager.disconnect(websocket, execution_id)
+
+
+@router.websocket("/ingestion/{job_id}")
+async def websocket_ingestion_progress(websocket: WebSocket, job_id: str):
+    """WebSocket endpoint for real-time progress of a background ingestion job"""
+    await ingestion_websocket_manager.connect(websocket, job_id)
+    
+    try:
+        # Keep connection alive and handle disconnection
+        while True:
+            try:
+                # Wait for any message (client can send ping to keep alive)
+                await websocket.receive_text()
+            except WebSocketDisconnect:
+                break
+    except Exception as e:
+        print(f"WebSocket error: {e}")
+    finally:
+        ingestion_websocket_manager.disconnect(websocket, job_id)
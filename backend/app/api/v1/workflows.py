@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
 import json
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 
 from app.core.database import get_db
 from app.models.workflow import Workflow, WorkflowExecution
@@ -14,9 +15,15 @@ from app.schemas.workflow import (
     WorkflowExecuteRequest, WorkflowExecuteResponse,
     WorkflowBuildRequest, WorkflowBuildResponse
 )
-from app.services.workflow_service import WorkflowService
+from app.services.workflow_service import WorkflowService, ExecutionTimeoutError
+from app.services.execution_service import execution_engine
+from app.services.execution_scheduler import execution_scheduler, ExecutionQueueFullError
+from app.services.execution_queue import execution_queue
 from app.services.document_service import DocumentService
+from app.services.ingestion_pipeline import ingestion_pipeline
+from app.services.ingestion_jobs import ingestion_jobs
 from app.services.api_key_service import ApiKeyService
+from app.schemas.api_keys import ApiKeyCreate
 
 router = APIRouter(prefix="/workflows", tags=["workflows"])
 
@@ -24,7 +31,7 @@ router = APIRouter(prefix="/workflows", tags=["workflows"])
 @router.post("/", response_model=WorkflowResponse)
 async def create_workflow(
     workflow: WorkflowCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Create a new workflow"""
@@ -43,8 +50,8 @@ async def create_workflow(
         updated_at=datetime.utcnow()
     )
     db.add(db_workflow)
-    db.commit()
-    db.refresh(db_workflow)
+    await db.commit()
+    await db.refresh(db_workflow)
     return WorkflowResponse(
         id=str(db_workflow.id),
         user_id=str(db_workflow.user_id),
@@ -60,11 +67,12 @@ async def create_workflow(
 
 @router.get("/", response_model=List[WorkflowResponse])
 async def get_workflows(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get all workflows for the current user"""
-    workflows = db.query(Workflow).filter(Workflow.user_id == current_user.id).all()
+    result = await db.execute(select(Workflow).filter(Workflow.user_id == current_user.id))
+    workflows = result.scalars().all()
     return [
         WorkflowResponse(
             id=str(w.id),
@@ -83,14 +91,15 @@ async def get_workflows(
 @router.get("/{workflow_id}", response_model=WorkflowResponse)
 async def get_workflow(
     workflow_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get a specific workflow"""
-    workflow = db.query(Workflow).filter(
+    result = await db.execute(select(Workflow).filter(
         Workflow.id == workflow_id,
         Workflow.user_id == current_user.id
-    ).first()
+    ))
+    workflow = result.scalars().first()
     
     if not workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
@@ -112,7 +121,7 @@ async def get_workflow(
 async def update_workflow(
     workflow_id: str,
     workflow_update: WorkflowUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Update a workflow"""
@@ -124,10 +133,11 @@ async def update_workflow(
             node_dict = node.dict() if hasattr(node, 'dict') else node
             print(f"DEBUG: Node {i} data: {node_dict.get('data', {})}")
     
-    workflow = db.query(Workflow).filter(
+    result = await db.execute(select(Workflow).filter(
         Workflow.id == workflow_id,
         Workflow.user_id == current_user.id
-    ).first()
+    ))
+    workflow = result.scalars().first()
     
     if not workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
@@ -136,8 +146,8 @@ async def update_workflow(
         setattr(workflow, field, value)
     
     workflow.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(workflow)
+    await db.commit()
+    await db.refresh(workflow)
     
     return WorkflowResponse(
         id=str(workflow.id),
@@ -155,20 +165,28 @@ async def update_workflow(
 @router.delete("/{workflow_id}")
 async def delete_workflow(
     workflow_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Delete a workflow"""
-    workflow = db.query(Workflow).filter(
+    result = await db.execute(select(Workflow).filter(
         Workflow.id == workflow_id,
         Workflow.user_id == current_user.id
-    ).first()
+    ))
+    workflow = result.scalars().first()
     
     if not workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
     
-    db.delete(workflow)
-    db.commit()
+    # Its documents go first, releasing the stored files they reference
+    document_service = DocumentService(db)
+    await document_service.remove_workflow_documents(workflow_id)
+    
+    await db.delete(workflow)
+    await db.commit()
+    
+    # Drop the workflow's document chunks from the vector store and BM25 index
+    document_service.delete_workflow_documents(workflow_id)
     
     return {"message": "Workflow deleted successfully"}
 
@@ -177,14 +195,15 @@ async def delete_workflow(
 async def build_workflow(
     workflow_id: str,
     build_request: WorkflowBuildRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Build and validate a workflow"""
-    workflow = db.query(Workflow).filter(
+    result = await db.execute(select(Workflow).filter(
         Workflow.id == workflow_id,
         Workflow.user_id == current_user.id
-    ).first()
+    ))
+    workflow = result.scalars().first()
     
     if not workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
@@ -216,7 +235,7 @@ async def build_workflow(
         workflow.edges = [edge.dict() for edge in build_request.edges]
         workflow.status = "ready"
         workflow.updated_at = datetime.utcnow()
-        db.commit()
+        await db.commit()
         
         return WorkflowBuildResponse(
             success=True,
@@ -236,16 +255,22 @@ async def build_workflow(
 async def execute_workflow(
     workflow_id: str,
     execute_request: WorkflowExecuteRequest,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Execute a workflow with user query"""
+    """
+    Execute a workflow with user query.
+    In async mode the run is submitted and its id returned immediately (202); progress is
+    available through /ws/execution/{execution_id} and /workflows/executions/{execution_id}.
+    """
     print(f"DEBUG: Executing workflow {workflow_id}")
     
-    workflow = db.query(Workflow).filter(
+    result = await db.execute(select(Workflow).filter(
         Workflow.id == workflow_id,
         Workflow.user_id == current_user.id
-    ).first()
+    ))
+    workflow = result.scalars().first()
     
     if not workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
@@ -258,6 +283,27 @@ async def execute_workflow(
     if workflow.status != "ready":
         raise HTTPException(status_code=400, detail="Workflow must be in ready status before execution")
     
+    if execute_request.mode == "async":
+        try:
+            execution_id = await execution_engine.execute_workflow(
+                {"id": workflow.id, "nodes": workflow.nodes, "edges": workflow.edges},
+                execute_request.query,
+                current_user.id
+            )
+        except ExecutionQueueFullError as e:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+        response.status_code = status.HTTP_202_ACCEPTED
+        return WorkflowExecuteResponse(
+            execution_id=execution_id,
+            status="pending",
+            message="Workflow execution submitted"
+        )
+    
+    try:
+        execution_scheduler.check_admission(str(current_user.id))
+    except ExecutionQueueFullError as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+    
     # Create execution record
     execution = WorkflowExecution(
         id=str(uuid.uuid4()),
@@ -265,30 +311,38 @@ async def execute_workflow(
         user_id=current_user.id,
         status="running",
         input_query=execute_request.query,
-        started_at=datetime.utcnow()
+        started_at=datetime.now(timezone.utc),
+        # Leased to this process so the run is failed if the process dies mid-request
+        mode="sync",
+        lease_owner=execution_queue.worker_id,
+        lease_expires_at=execution_queue.lease_expiry()
     )
     
     db.add(execution)
-    db.commit()
+    await db.commit()
     
     workflow_service = WorkflowService(db)
     
     try:
-        # Execute workflow
-        result = await workflow_service.execute_workflow(
-            workflow.nodes,
-            workflow.edges,
-            execute_request.query,
-            execution.id,
-            str(current_user.id),  # Pass user_id for API key retrieval
-            workflow_id  # Pass workflow_id for document retrieval
+        # Execute workflow once the scheduler grants a slot; sync runs count against the same limits
+        result = await execution_scheduler.submit(
+            str(current_user.id),
+            str(execution.id),
+            lambda: workflow_service.execute_workflow(
+                workflow.nodes,
+                workflow.edges,
+                execute_request.query,
+                execution.id,
+                str(current_user.id),  # Pass user_id for API key retrieval
+                workflow_id  # Pass workflow_id for document retrieval
+            )
         )
         
         # Update execution record
         execution.status = "completed"
         execution.result = result
-        execution.completed_at = datetime.utcnow()
-        db.commit()
+        execution.completed_at = datetime.now(timezone.utc)
+        await db.commit()
         
         return WorkflowExecuteResponse(
             execution_id=str(execution.id),
@@ -300,22 +354,32 @@ async def execute_workflow(
     except Exception as e:
         execution.status = "failed"
         execution.error_message = str(e)
-        execution.completed_at = datetime.utcnow()
-        db.commit()
+        execution.completed_at = datetime.now(timezone.utc)
+        await db.commit()
         
+        if isinstance(e, ExecutionQueueFullError):
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+        if isinstance(e, ExecutionTimeoutError):
+            raise HTTPException(status_code=504, detail=f"Workflow execution timed out: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Workflow execution failed: {str(e)}")
 
 
 @router.post("/{workflow_id}/upload-documents")
 async def upload_documents(
     workflow_id: str,
+    response: Response,
     files: List[UploadFile] = File(...),
     embedding_model: Optional[str] = None,
     api_key: Optional[str] = None,
-    db: Session = Depends(get_db),
+    mode: Literal["sync", "async"] = "sync",
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Upload documents for knowledge base component, with embedding model and API key support"""
+    """
+    Upload documents for knowledge base component, with embedding model and API key support.
+    In async mode the files are stored and a job id returned immediately (202); ingestion runs
+    in the background, with progress on /ws/ingestion/{job_id} and /workflows/{id}/ingestion-jobs/{job_id}.
+    """
     from app.models.document import Document
     from app.schemas.document import DocumentCreate
     from app.services.api_key_service import ApiKeyService
@@ -323,10 +387,11 @@ async def upload_documents(
     import os
     from app.core.config import settings
 
-    workflow = db.query(Workflow).filter(
+    result = await db.execute(select(Workflow).filter(
         Workflow.id == workflow_id,
         Workflow.user_id == current_user.id
-    ).first()
+    ))
+    workflow = result.scalars().first()
     if not workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
 
@@ -334,7 +399,7 @@ async def upload_documents(
     if api_key:
         key_name = "huggingface" if embedding_model == "all-MiniLM-L6-v2" else "openai"
         api_key_data = ApiKeyCreate(key_name=key_name, api_key=api_key)
-        api_key_service.create_api_key(str(current_user.id), api_key_data)
+        await ApiKeyService(db).create_api_key(str(current_user.id), api_key_data)
 
     # Get stored API keys as fallback
     # Only get API key from database if not provided in request
@@ -343,61 +408,61 @@ async def upload_documents(
         api_key_service = ApiKeyService(db)
         # Determine which API key to use based on embedding model
         if embedding_model == "all-MiniLM-L6-v2":
-            stored_api_key = api_key_service.get_decrypted_api_key(str(current_user.id), "huggingface")
+            stored_api_key = await api_key_service.get_decrypted_api_key(str(current_user.id), "huggingface")
         else:
-            stored_api_key = api_key_service.get_decrypted_api_key(str(current_user.id), "openai")
+            stored_api_key = await api_key_service.get_decrypted_api_key(str(current_user.id), "openai")
     
     final_api_key = api_key or stored_api_key
 
+    # Files are processed concurrently; each one reports its own status
     document_service = DocumentService(db)
-    uploaded_files = []
-    try:
-        for file in files:
-            # Reset file position to beginning
-            await file.seek(0)
-            
-            # Process document using the service (handles everything: saving, text extraction, embedding generation)
-            result = await document_service.process_document(file, workflow_id, str(current_user.id))
-            
-            uploaded_files.append({
-                "filename": file.filename,
-                "content_type": file.content_type,
-                "message": result.get("message", "Processed successfully"),
-                "doc_id": result.get("doc_id", "unknown")
-            })
-            
+    if mode == "async":
+        job_id = uuid.uuid4()
+        items = await ingestion_pipeline.save_uploads(document_service, files, workflow_id, str(current_user.id), job_id)
+        if any(item.document is not None for item in items):
+            ingestion_jobs.submit(str(job_id))
+        response.status_code = status.HTTP_202_ACCEPTED
         return {
-            "message": f"Successfully uploaded {len(uploaded_files)} documents",
-            "files": uploaded_files
+            "message": f"Queued {len(files)} documents for ingestion",
+            "job_id": str(job_id),
+            "files": [item.result for item in items]
         }
-    except Exception as e:
-        print(f"Upload error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to upload documents: {str(e)}")
+    
+    items = await ingestion_pipeline.save_uploads(document_service, files, workflow_id, str(current_user.id))
+    result = await ingestion_pipeline.ingest(document_service, items, str(current_user.id))
+    stats = result["stats"]
+    return {
+        "message": f"Successfully uploaded {stats['succeeded']} of {stats['files']} documents",
+        "files": result["files"],
+        "stats": stats
+    }
 
 
 @router.get("/{workflow_id}/documents")
 async def get_workflow_documents(
     workflow_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get all documents uploaded for a specific workflow"""
     from app.models.document import Document
     
     # Verify workflow exists and belongs to user
-    workflow = db.query(Workflow).filter(
+    result = await db.execute(select(Workflow).filter(
         Workflow.id == workflow_id,
         Workflow.user_id == current_user.id
-    ).first()
+    ))
+    workflow = result.scalars().first()
     
     if not workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
     
     # Get documents for this specific workflow
-    documents = db.query(Document).filter(
+    result = await db.execute(select(Document).filter(
         Document.user_id == current_user.id,
         Document.workflow_id == workflow_id
-    ).all()
+    ))
+    documents = result.scalars().all()
     
     return [
         {
@@ -407,30 +472,52 @@ async def get_workflow_documents(
             "file_size": doc.file_size,
             "file_path": doc.file_path,
             "upload_date": doc.upload_date.isoformat(),
-            "processed": doc.processed
+            "processed": doc.processed,
+            "status": doc.status,
+            "progress": doc.progress,
+            "error_message": doc.error_message
         }
         for doc in documents
     ]
 
 
+@router.get("/{workflow_id}/ingestion-jobs/{job_id}")
+async def get_ingestion_job(
+    workflow_id: str,
+    job_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get the status and per-document progress of a background ingestion job"""
+    try:
+        job = await ingestion_jobs.get_job(db, job_id, workflow_id, current_user.id)
+    except ValueError:
+        job = None
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return job
+
+
 @router.get("/{workflow_id}/executions")
 async def get_workflow_executions(
     workflow_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get execution history for a workflow"""
-    workflow = db.query(Workflow).filter(
+    result = await db.execute(select(Workflow).filter(
         Workflow.id == workflow_id,
         Workflow.user_id == current_user.id
-    ).first()
+    ))
+    workflow = result.scalars().first()
     
     if not workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
     
-    executions = db.query(WorkflowExecution).filter(
+    result = await db.execute(select(WorkflowExecution).filter(
         WorkflowExecution.workflow_id == workflow_id
-    ).order_by(WorkflowExecution.started_at.desc()).all()
+    ).order_by(WorkflowExecution.started_at.desc()))
+    executions = result.scalars().all()
     
     return [
         {
@@ -449,22 +536,54 @@ async def get_workflow_executions(
 @router.get("/executions/{execution_id}")
 async def get_execution_status(
     execution_id: str,
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get execution status"""
+    """Get execution status, live while the run is active in this process and from the database otherwise"""
     status_info = execution_engine.get_execution_status(execution_id)
     
-    if not status_info:
+    if status_info:
+        # Check if user owns this execution
+        if status_info.get("user_id") != str(current_user.id):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Access denied"
+            )
+        return status_info
+    
+    try:
+        execution_uuid = uuid.UUID(execution_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Execution not found"
+        )
+    
+    result = await db.execute(select(WorkflowExecution).filter(WorkflowExecution.id == execution_uuid))
+    execution = result.scalars().first()
+    
+    if not execution:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Execution not found"
         )
     
     # Check if user owns this execution
-    if status_info.get("user_id") != current_user.id:
+    if execution.user_id != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied"
         )
     
-    return status_info
+    return {
+        "execution_id": str(execution.id),
+        "workflow_id": str(execution.workflow_id),
+        "user_id": str(execution.user_id),
+        "status": execution.status,
+        "progress": 1.0 if execution.status == "completed" else None,
+        "input_query": execution.input_query,
+        "result": execution.result,
+        "error_message": execution.error_message,
+        "started_at": execution.started_at,
+        "completed_at": execution.completed_at
+    }
@@ -16,11 +16,37 @@ class Settings(BaseSettings):
     
     # Database
     database_url: str
+    async_database_url: Optional[str] = None  # defaults to database_url with the asyncpg driver
+    db_pool_size: int = 10  # persistent connections of the async (API) engine
+    db_max_overflow: int = 20  # extra connections opened under burst load
+    db_pool_timeout: float = 30.0  # seconds to wait for a free connection
+    db_pool_recycle: int = 1800  # seconds before a connection is replaced
+    db_pool_pre_ping: bool = True  # check connections on checkout to survive database restarts
+    
+    # Workflow execution
+    execution_timeout: float = 300.0  # seconds a workflow run may take before its nodes are cancelled
+    execution_log_batch_size: int = 200  # rows per multi-row insert
+    execution_log_flush_interval: float = 0.5  # seconds before a partial batch is written
+    execution_log_queue_size: int = 10000  # queued rows before event emitters are made to wait
+    execution_max_concurrent: int = 20  # workflow runs executing at once across all users
+    execution_max_concurrent_per_user: int = 3  # runs one user may have executing at once
+    execution_queue_size: int = 200  # runs waiting for a slot before new submissions are rejected (429)
+    execution_user_queue_size: int = 20  # runs one user may have waiting
+    execution_worker_enabled: bool = True  # claim queued async runs in this process (off for API-only replicas)
+    execution_poll_interval: float = 2.0  # seconds between checks for queued runs when idle
+    execution_lease_duration: float = 60.0  # seconds a run stays claimed without a heartbeat
+    execution_heartbeat_interval: float = 15.0  # seconds between lease renewals and orphan sweeps
+    execution_max_attempts: int = 3  # claims of an async run before an interrupted run is failed
     
     # Security
     secret_key: str
     access_token_expire_minutes: int = 1440
     api_key_encryption_key: str
+    api_key_cache_ttl: float = 60.0  # seconds decrypted API keys are cached per user (0 disables)
+    api_key_cache_max_users: int = 10000
+    user_cache_ttl: float = 30.0  # seconds an authenticated user is served without a database lookup (0 disables)
+    user_cache_max_size: int = 10000
+    password_hash_concurrency: int = 4  # bcrypt hash/verify calls running at once; the rest wait their turn
     
     # ChromaDB (Embedded Mode)
     chroma_persist_directory: str = "./chroma_db"
@@ -31,8 +57,49 @@ class Settings(BaseSettings):
     # File Upload
     upload_dir: str = "uploaded_docs"
     max_file_size: int = 10 * 1024 * 1024  # 10MB
+    upload_chunk_size: int = 1024 * 1024  # bytes read and written per step when streaming uploads to disk
+    extraction_workers: int = 0  # text extraction processes (0 = one per CPU core)
+    pdf_pages_per_task: int = 16  # PDF pages extracted per worker task; larger PDFs fan out over several workers
+    ingest_file_concurrency: int = 4  # files of one upload request saved and extracted at once
+    ingest_embed_concurrency: int = 2  # documents of one upload request embedded at once
+    ingest_queue_size: int = 4  # documents buffered between ingestion stages
+    ingest_job_workers: int = 2  # background ingestion jobs run at once
+    ingest_job_timeout: int = 1800  # seconds without progress before an interrupted document without a lease is queued again
+    ingest_lease_duration: float = 120.0  # seconds a claimed document stays leased without a heartbeat
+    ingest_heartbeat_interval: float = 30.0  # seconds between lease renewals and sweeps for stalled documents
     allowed_file_types: Union[List[str], str] = ".pdf,.txt,.docx"
     
+    # Document chunking and embedding
+    chunk_size: int = 1000  # characters
+    chunk_overlap: int = 200  # characters
+    openai_embedding_batch_size: int = 256  # texts per /embeddings request
+    huggingface_embedding_batch_size: int = 32  # texts per inference request
+    embedding_max_concurrency: int = 4  # embedding batches in flight per call
+    local_embeddings_enabled: bool = True  # serve all-MiniLM-L6-v2 in-process instead of via HuggingFace
+    local_embedding_workers: int = 2
+    local_embedding_batch_size: int = 64
+    knowledge_base_top_k: int = 5  # chunks retrieved per knowledgeBase node
+    knowledge_base_max_tokens: int = 2000  # token budget for retrieved document context
+    retrieval_rrf_k: int = 60  # reciprocal rank fusion constant for hybrid BM25 + vector search
+    retrieval_candidate_multiplier: int = 4  # candidates fetched per ranking, as a multiple of the result count
+    retrieval_lexical_refresh_interval: float = 30.0  # seconds a BM25 partition is served before re-checking ChromaDB for chunks other workers changed
+    embedding_cache_enabled: bool = True
+    embedding_cache_memory_size: int = 10000  # vectors kept in the in-memory LRU
+    embedding_cache_path: str = "./embedding_cache/embeddings.db"  # empty disables the on-disk tier
+    
+    # Outbound HTTP (LLM, embedding and search providers)
+    http2_enabled: bool = True
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry: float = 30.0  # seconds
+    http_connect_timeout: float = 5.0
+    http_default_timeout: float = 30.0
+    openai_timeout: float = 60.0
+    gemini_timeout: float = 60.0
+    huggingface_timeout: float = 60.0
+    search_timeout: float = 15.0
+    llm_streaming_enabled: bool = True  # stream LLM output and forward it as llm_token WebSocket events
+    
     # Monitoring
     prometheus_enabled: bool = True
     log_level: str = "INFO"
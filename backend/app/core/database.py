@@ -1,23 +1,102 @@
-from sqlalchemy import create_engine
+import time
+import threading
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.core.config import settings
+from app.utils.metrics import metrics
 
-engine = create_engine(settings.database_url)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def get_async_database_url(database_url: str) -> str:
+    """Same database, reached through the asyncpg driver"""
+    url = make_url(database_url)
+    if url.get_backend_name() == "postgresql":
+        url = url.set(drivername="postgresql+asyncpg")
+    return url.render_as_string(hide_password=False)
+
+
+class _CheckoutTimingMixin:
+    """Records how long callers wait for a pooled connection"""
+
+    pool_name = "default"
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            metrics.track_db_pool_timeout(self.pool_name)
+            raise
+        finally:
+            metrics.track_db_checkout_wait(self.pool_name, time.perf_counter() - start)
+
+
+class InstrumentedAsyncQueuePool(_CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    pool_name = "async"
+
+
+def _instrument_pool(engine, pool_name: str):
+    """Keep the active/idle connection gauges current from pool events"""
+    # Counted from the events themselves: checkin fires before the connection is back in
+    # the queue, so the pool's own checkedout()/checkedin() lag behind at that point
+    counts = {"open": 0, "active": 0}
+    lock = threading.Lock()
+
+    def track(open_delta: int, active_delta: int):
+        with lock:
+            counts["open"] += open_delta
+            counts["active"] += active_delta
+            active = max(0, counts["active"])
+            idle = max(0, counts["open"] - counts["active"])
+        metrics.update_db_connections(pool_name, active, idle)
+
+    handlers = {
+        "connect": lambda *args: track(1, 0),
+        "close": lambda *args: track(-1, 0),
+        "checkout": lambda *args: track(0, 1),
+        "checkin": lambda *args: track(0, -1),
+        "detach": lambda *args: track(-1, -1),
+    }
+    for event_name, handler in handlers.items():
+        event.listen(engine.pool, event_name, handler)
+
+
+# Async engine used by the API routes and services
+async_engine = create_async_engine(
+    settings.async_database_url or get_async_database_url(settings.database_url),
+    poolclass=InstrumentedAsyncQueuePool,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping
+)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+_instrument_pool(async_engine.sync_engine, InstrumentedAsyncQueuePool.pool_name)
 
 Base = declarative_base()
 
 
-def get_db():
+async def get_db():
     """Database dependency"""
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-def init_db():
+async def init_db():
     """Initialize database tables"""
-    Base.metadata.create_all(bind=engine)
+    async with async_engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+
+async def close_db():
+    """Dispose of pooled connections"""
+    await async_engine.dispose()
@@ -0,0 +1,90 @@
+import httpx
+import logging
+from typing import Dict
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Base URL of every upstream provider; one connection pool is kept per host
+PROVIDER_BASE_URLS = {
+    "openai": "https://api.openai.com/v1",
+    "gemini": "https://generativelanguage.googleapis.com/v1beta",
+    "huggingface": "https://api-inference.huggingface.co",
+    "brave": "https://api.search.brave.com",
+    "serpapi": "https://serpapi.com",
+}
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional h2 package (installed with httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class HTTPClientManager:
+    """App-lifetime pooled httpx clients, one per provider host"""
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _provider_timeout(self, provider: str) -> float:
+        timeouts = {
+            "openai": settings.openai_timeout,
+            "gemini": settings.gemini_timeout,
+            "huggingface": settings.huggingface_timeout,
+            "brave": settings.search_timeout,
+            "serpapi": settings.search_timeout,
+        }
+        return timeouts.get(provider, settings.http_default_timeout)
+
+    def _create_client(self, provider: str) -> httpx.AsyncClient:
+        http2 = settings.http2_enabled and _http2_available()
+        if settings.http2_enabled and not http2:
+            logger.warning("h2 is not installed, falling back to HTTP/1.1 for provider clients")
+
+        return httpx.AsyncClient(
+            base_url=PROVIDER_BASE_URLS.get(provider, ""),
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_keepalive_connections,
+                keepalive_expiry=settings.http_keepalive_expiry
+            ),
+            timeout=httpx.Timeout(
+                self._provider_timeout(provider),
+                connect=settings.http_connect_timeout
+            )
+        )
+
+    def startup(self):
+        """Open a client for every known provider"""
+        for provider in PROVIDER_BASE_URLS:
+            self.get_client(provider)
+        logger.info(f"HTTP client pools ready for: {', '.join(self._clients)}")
+
+    def get_client(self, provider: str) -> httpx.AsyncClient:
+        """Get the shared client for a provider, creating it on first use"""
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            client = self._create_client(provider)
+            self._clients[provider] = client
+        return client
+
+    async def shutdown(self):
+        """Close all pooled connections"""
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+
+# Global HTTP client manager instance
+http_clients = HTTPClientManager()
+
+
+def get_http_client(provider: str) -> httpx.AsyncClient:
+    """Shortcut for the shared client of a provider"""
+    return http_clients.get_client(provider)
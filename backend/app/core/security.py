@@ -1,13 +1,21 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from typing import Optional, Union, Any
+from typing import Callable, Optional, Union, Any
 from app.core.config import settings
+from app.utils.metrics import metrics
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 ALGORITHM = "HS256"
 
+# bcrypt is deliberately slow (~100-300ms per call), so it never runs on the event loop.
+# A fixed number of workers caps how much CPU a login storm can take; excess calls queue.
+_password_executor: Optional[ThreadPoolExecutor] = None
+
 
 def create_access_token(
     subject: Union[str, Any], expires_delta: Optional[timedelta] = None
@@ -41,3 +49,43 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     """Hash password"""
     return pwd_context.hash(password)
+
+
+def _get_password_executor() -> ThreadPoolExecutor:
+    global _password_executor
+    if _password_executor is None:
+        _password_executor = ThreadPoolExecutor(
+            max_workers=settings.password_hash_concurrency,
+            thread_name_prefix="password-hashing"
+        )
+    return _password_executor
+
+
+async def _run_password_operation(operation: str, func: Callable, *args):
+    """Run a bcrypt call on the password worker pool, recording how long it queued"""
+    loop = asyncio.get_running_loop()
+    queued_at = time.perf_counter()
+
+    def run():
+        metrics.track_password_hash_wait(operation, time.perf_counter() - queued_at)
+        return func(*args)
+
+    return await loop.run_in_executor(_get_password_executor(), run)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify password against hash without blocking the event loop"""
+    return await _run_password_operation("verify", verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash password without blocking the event loop"""
+    return await _run_password_operation("hash", get_password_hash, password)
+
+
+def shutdown_password_executor():
+    """Stop the password worker pool"""
+    global _password_executor
+    if _password_executor is not None:
+        _password_executor.shutdown(wait=False, cancel_futures=True)
+        _password_executor = None
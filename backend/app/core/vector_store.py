@@ -0,0 +1,77 @@
+import os
+import logging
+import threading
+from typing import Dict, Optional
+
+import chromadb
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COLLECTION = "documents"
+
+
+class VectorStore:
+    """Process-wide ChromaDB client with cached collection handles"""
+
+    def __init__(self):
+        self._client = None
+        self._collections: Dict[str, chromadb.Collection] = {}
+        self._lock = threading.Lock()
+
+    def init(self):
+        """Create the client and warm the default collection (called once at startup)"""
+        self.get_collection(DEFAULT_COLLECTION)
+        logger.info(f"ChromaDB ready with collection: {DEFAULT_COLLECTION}")
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    # Ensure ChromaDB persist directory exists
+                    os.makedirs(settings.chroma_persist_directory, exist_ok=True)
+                    # Initialize ChromaDB in embedded mode
+                    self._client = chromadb.Client(chromadb.config.Settings(
+                        persist_directory=settings.chroma_persist_directory,
+                        anonymized_telemetry=False
+                    ))
+        return self._client
+
+    def get_collection(self, name: str = DEFAULT_COLLECTION, force_recreate: bool = False):
+        """Get a cached collection handle, creating the collection on first use"""
+        if not force_recreate:
+            collection = self._collections.get(name)
+            if collection is not None:
+                return collection
+
+        client = self.client
+        with self._lock:
+            if force_recreate:
+                self._collections.pop(name, None)
+                # Delete existing collection if it exists
+                try:
+                    client.delete_collection(name)
+                    logger.info(f"Deleted existing collection: {name}")
+                except Exception:
+                    pass
+
+            collection = self._collections.get(name)
+            if collection is None:
+                # Let ChromaDB use its default embedding function when none is supplied
+                collection = client.get_or_create_collection(name)
+                self._collections[name] = collection
+            return collection
+
+    def reset_cache(self, name: Optional[str] = None):
+        """Forget cached collection handles (e.g. after a collection is dropped elsewhere)"""
+        with self._lock:
+            if name:
+                self._collections.pop(name, None)
+            else:
+                self._collections.clear()
+
+
+# Global vector store instance
+vector_store = VectorStore()
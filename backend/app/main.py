@@ -7,7 +7,17 @@ import os
 from datetime import datetime
 
 from app.core.config import settings
-from app.core.database import init_db
+from app.core.database import init_db, close_db
+from app.core.http_client import http_clients
+from app.core.security import shutdown_password_executor
+from app.core.vector_store import vector_store
+from app.services.local_embedding_service import local_embeddings
+from app.services.embedding_cache import embedding_cache
+from app.services.text_extraction import text_extractor
+from app.services.execution_log_writer import execution_log_writer
+from app.services.execution_queue import execution_queue
+from app.services.execution_service import execution_engine
+from app.services.ingestion_jobs import ingestion_jobs
 from app.api.v1 import api_router
 from app.utils.logging import setup_logging, log_request
 from app.utils.metrics import setup_metrics, metrics
@@ -21,7 +31,7 @@ async def lifespan(app: FastAPI):
     """Application lifespan events"""
     # Startup
     logger.info("Starting Flowgenix application")
-    init_db()
+    await init_db()
     logger.info("Database initialized")
     
     # Ensure upload directory exists
@@ -32,10 +42,38 @@ async def lifespan(app: FastAPI):
     os.makedirs(settings.chroma_persist_directory, exist_ok=True)
     logger.info(f"ChromaDB persist directory ensured: {settings.chroma_persist_directory}")
     
+    # Create the shared ChromaDB client and collection handles once
+    vector_store.init()
+    
+    # Open pooled HTTP clients for LLM, embedding and search providers
+    http_clients.startup()
+    
+    # Batch execution log inserts in the background
+    execution_log_writer.start()
+    
+    # Recover runs orphaned by a previous process and start claiming queued ones
+    await execution_queue.start(execution_engine.run_claimed)
+    
+    # Run background document ingestion, resuming jobs a previous process left unfinished
+    await ingestion_jobs.start()
+    
     yield
     
     # Shutdown
     logger.info("Shutting down Flowgenix application")
+    # Stopped first: running jobs and workflow runs still use the HTTP clients and worker pools
+    # below, and interrupted runs must be handed back to the queue before those close under them
+    await ingestion_jobs.shutdown()
+    await execution_queue.shutdown(list(execution_engine.active_executions.values()))
+    await http_clients.shutdown()
+    logger.info("HTTP client pools closed")
+    local_embeddings.shutdown()
+    shutdown_password_executor()
+    text_extractor.shutdown()
+    embedding_cache.close()
+    await execution_log_writer.shutdown()
+    logger.info("Execution log writer flushed")
+    await close_db()
 
 
 app = FastAPI(
@@ -1,7 +1,7 @@
 from .user import User
 from .workflow import Workflow, WorkflowExecution
 from .chat import ChatSession, ChatMessage
-from .document import Document, ExecutionLog
+from .document import Document, ContentBlob, ExecutionLog
 from .api_keys import UserApiKey
 
 __all__ = [
@@ -11,6 +11,7 @@ __all__ = [
     "ChatSession",
     "ChatMessage",
     "Document",
+    "ContentBlob",
     "ExecutionLog",
     "UserApiKey"
 ]
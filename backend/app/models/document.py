@@ -18,12 +18,31 @@ class Document(Base):
     workflow_id = Column(UUID(as_uuid=True), ForeignKey("workflows.id"), nullable=True)  # Added workflow association
     upload_date = Column(DateTime(timezone=True), server_default=func.now())
     processed = Column(Boolean, default=False)
+    # Ingestion progress: queued, extracting, chunking, embedding, storing, completed, failed
+    status = Column(String, default="completed", index=True)
+    progress = Column(Integer, default=100)  # percent
+    error_message = Column(Text, nullable=True)
+    ingest_job_id = Column(UUID(as_uuid=True), nullable=True, index=True)  # background ingestion job, if any
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    content_hash = Column(String(64), nullable=True, index=True)  # sha256 of the file, key of its ContentBlob (cleared when a failed document releases it)
+    lease_owner = Column(String, nullable=True)  # ingestion worker currently processing this document
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
 
     # Relationships
     user = relationship("User")
     workflow = relationship("Workflow")
 
 
+class ContentBlob(Base):
+    __tablename__ = "content_blobs"
+
+    # An uploaded file stored once by content, shared by every document with the same bytes
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)  # documents referencing this blob
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
 class ExecutionLog(Base):
     __tablename__ = "execution_logs"
 
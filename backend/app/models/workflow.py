@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import Column, String, DateTime, ForeignKey, Text, JSON, Integer
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
@@ -31,12 +31,17 @@ class WorkflowExecution(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True, unique=True, nullable=False)
     workflow_id = Column(UUID(as_uuid=True), ForeignKey("workflows.id"), nullable=False)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
-    status = Column(String, default="draft")  # draft, ready, running, paused, completed, failed
+    status = Column(String, default="draft", index=True)  # draft, ready, pending, running, paused, completed, failed
     input_query = Column(Text, nullable=False)
     result = Column(JSON, nullable=True)
     error_message = Column(Text, nullable=True)
     started_at = Column(DateTime(timezone=True), server_default=func.now())
     completed_at = Column(DateTime(timezone=True), nullable=True)
+    # Durable execution queue: async runs wait as "pending" rows until a worker claims them
+    mode = Column(String, default="sync")  # sync (runs inside the request) or async (queued)
+    attempts = Column(Integer, default=0)
+    lease_owner = Column(String, nullable=True)  # worker currently running this execution
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
 
     # Relationships
     workflow = relationship("Workflow", back_populates="executions")
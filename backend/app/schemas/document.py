@@ -19,6 +19,9 @@ class DocumentResponse(DocumentBase):
     file_path: str
     upload_date: datetime
     processed: bool = False
+    status: Optional[str] = None
+    progress: Optional[int] = None
+    error_message: Optional[str] = None
     
     class Config:
         from_attributes = True
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Literal
 from datetime import datetime
 
 
@@ -63,6 +63,7 @@ class WorkflowBuildResponse(BaseModel):
 
 class WorkflowExecuteRequest(BaseModel):
     query: str
+    mode: Literal["sync", "async"] = "sync"  # async returns the execution id without waiting for the result
 
 
 class WorkflowExecuteResponse(BaseModel):
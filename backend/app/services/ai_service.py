@@ -1,6 +1,11 @@
-import httpx
 import asyncio
-from typing import Optional, Dict, Any, List
+import json
+from typing import Optional, Dict, Any, List, AsyncIterator
+
+from app.core.config import settings
+from app.core.http_client import get_http_client
+from app.services.local_embedding_service import local_embeddings
+from app.services.embedding_cache import embedding_cache
 
 
 class AIService:
@@ -43,31 +48,31 @@ class AIService:
             return {"content": "OpenAI API key not configured", "model": model}
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.openai_base_url}/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": model,
-                        "messages": messages,
-                        "temperature": temperature,
-                        "max_tokens": max_tokens
-                    }
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    return {
-                        "content": data["choices"][0]["message"]["content"],
-                        "model": model,
-                        "usage": data.get("usage", {})
-                    }
-                else:
-                    return {"content": f"OpenAI API error: {response.status_code}", "model": model}
-                    
+            client = get_http_client("openai")
+            response = await client.post(
+                f"{self.openai_base_url}/chat/completions",
+                headers={
+                    "Authorization": f"Bearer {key}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "model": model,
+                    "messages": messages,
+                    "temperature": temperature,
+                    "max_tokens": max_tokens
+                }
+            )
+
+            if response.status_code == 200:
+                data = response.json()
+                return {
+                    "content": data["choices"][0]["message"]["content"],
+                    "model": model,
+                    "usage": data.get("usage", {})
+                }
+            else:
+                return {"content": f"OpenAI API error: {response.status_code}", "model": model}
+
         except Exception as e:
             return {"content": f"OpenAI API error: {str(e)}", "model": model}
 
@@ -90,34 +95,145 @@ class AIService:
         prompt = self._convert_messages_to_prompt(messages)
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/models/{model}:generateContent",
-                    params={"key": key},
-                    json={
-                        "contents": [{
-                            "parts": [{"text": prompt}]
-                        }],
-                        "generationConfig": {
-                            "temperature": temperature,
-                            "maxOutputTokens": max_tokens
-                        }
-                    }
-                )
-                
-                print('response', response.json())
-                if response.status_code == 200:
-                    data = response.json()
-                    return {
-                        "content": data["candidates"][0]["content"]["parts"][0]["text"],
-                        "model": model
+            client = get_http_client("gemini")
+            response = await client.post(
+                f"{self.base_url}/models/{model}:generateContent",
+                params={"key": key},
+                json={
+                    "contents": [{
+                        "parts": [{"text": prompt}]
+                    }],
+                    "generationConfig": {
+                        "temperature": temperature,
+                        "maxOutputTokens": max_tokens
                     }
-                else:
-                    return {"content": f"Gemini API error: {response.status_code}", "model": model}
-                    
+                }
+            )
+
+            print('response', response.json())
+            if response.status_code == 200:
+                data = response.json()
+                return {
+                    "content": data["candidates"][0]["content"]["parts"][0]["text"],
+                    "model": model
+                }
+            else:
+                return {"content": f"Gemini API error: {response.status_code}", "model": model}
+
         except Exception as e:
             return {"content": f"Gemini API error: {str(e)}", "model": model}
 
+    async def stream_response(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = "gemini-pro",
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        api_key: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Generate AI response as it is produced, yielding text chunks from Gemini or OpenAI"""
+        if model.startswith("gpt-"):
+            stream = self._stream_openai_response(messages, model, temperature, max_tokens, api_key=api_key)
+        else:
+            stream = self._stream_gemini_response(messages, model, temperature, max_tokens, api_key=api_key)
+        async for chunk in stream:
+            yield chunk
+
+    async def _stream_openai_response(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        api_key: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Stream response deltas from the OpenAI chat completions API (server-sent events)"""
+        if not api_key:
+            yield "OpenAI API key not configured"
+            return
+
+        try:
+            client = get_http_client("openai")
+            async with client.stream(
+                "POST",
+                f"{self.openai_base_url}/chat/completions",
+                headers={
+                    "Authorization": f"Bearer {api_key}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "model": model,
+                    "messages": messages,
+                    "temperature": temperature,
+                    "max_tokens": max_tokens,
+                    "stream": True
+                }
+            ) as response:
+                if response.status_code != 200:
+                    yield f"OpenAI API error: {response.status_code}"
+                    return
+                async for data in self._iter_sse_data(response):
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices") or [{}]
+                    content = choices[0].get("delta", {}).get("content")
+                    if content:
+                        yield content
+
+        except Exception as e:
+            yield f"OpenAI API error: {str(e)}"
+
+    async def _stream_gemini_response(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        api_key: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Stream response chunks from the Gemini streamGenerateContent API (server-sent events)"""
+        if not api_key:
+            yield "Gemini API key not configured"
+            return
+
+        prompt = self._convert_messages_to_prompt(messages)
+
+        try:
+            client = get_http_client("gemini")
+            async with client.stream(
+                "POST",
+                f"{self.base_url}/models/{model}:streamGenerateContent",
+                params={"key": api_key, "alt": "sse"},
+                json={
+                    "contents": [{
+                        "parts": [{"text": prompt}]
+                    }],
+                    "generationConfig": {
+                        "temperature": temperature,
+                        "maxOutputTokens": max_tokens
+                    }
+                }
+            ) as response:
+                if response.status_code != 200:
+                    yield f"Gemini API error: {response.status_code}"
+                    return
+                async for data in self._iter_sse_data(response):
+                    for candidate in json.loads(data).get("candidates", [])[:1]:
+                        for part in candidate.get("content", {}).get("parts", []):
+                            if part.get("text"):
+                                yield part["text"]
+
+        except Exception as e:
+            yield f"Gemini API error: {str(e)}"
+
+    async def _iter_sse_data(self, response) -> AsyncIterator[str]:
+        """Payloads of the data: lines of a server-sent event stream"""
+        async for line in response.aiter_lines():
+            if line.startswith("data:"):
+                data = line[len("data:"):].strip()
+                if data:
+                    yield data
+
     def _convert_messages_to_prompt(self, messages: List[Dict[str, str]]) -> str:
         """Convert OpenAI-style messages to a single prompt for Gemini"""
         prompt_parts = []
@@ -142,107 +258,190 @@ class AIService:
         return response.get("content", "No response generated")
 
     async def generate_embeddings(self, text: str, model: str = "text-embedding-ada-002", api_key: Optional[str] = None) -> Optional[list]:
-        """Generate embeddings for text, supporting OpenAI, Gemini, and Hugging Face MiniLM."""
-        if model == "all-MiniLM-L6-v2":
-            # Hugging Face Inference API - using sentence-transformers
-            if not api_key:
-                return None
-            url = "https://api-inference.huggingface.co/models/sentence-transformers/all-MiniLM-L6-v2"
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            }
-        if model == "all-MiniLM-L6-v2":
-            # Hugging Face Inference API - Free tier with read permissions
-            if not api_key:
-                return None
-            
-            # Try different models that work well with free tier feature extraction
-            models_to_try = [
-                "BAAI/bge-base-en-v1.5",  # Popular feature extraction model
-                "sentence-transformers/all-MiniLM-L6-v2",  # Original choice
-                "thenlper/gte-small"  # Another good option
+        """Generate embeddings for text, supporting local models, OpenAI and Hugging Face MiniLM."""
+        embeddings = await self.generate_embeddings_batch([text], model=model, api_key=api_key)
+        return embeddings[0]
+
+    async def generate_embeddings_batch(
+        self,
+        texts: List[str],
+        model: str = "text-embedding-ada-002",
+        api_key: Optional[str] = None,
+        batch_size: Optional[int] = None
+    ) -> List[Optional[list]]:
+        """
+        Generate embeddings for many texts at once.
+        Texts are split into provider-sized batches that run concurrently (bounded by
+        settings.embedding_max_concurrency). Returns one vector per text, in order,
+        with None for texts whose batch failed.
+        Vectors are served from the embedding cache when the same text was embedded before.
+        """
+        if not texts:
+            return []
+
+        if not embedding_cache.enabled:
+            return await self._generate_embeddings_uncached(texts, model, api_key, batch_size)
+
+        provider = self.embedding_provider(model)
+        vectors = await embedding_cache.get_many(provider, model, texts)
+        # Embed each distinct missing text once
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            generated = await self._generate_embeddings_uncached(missing, model, api_key, batch_size)
+            await embedding_cache.put_many(provider, model, missing, generated)
+            generated_by_text = dict(zip(missing, generated))
+            vectors = [
+                vector if vector is not None else generated_by_text[text]
+                for text, vector in zip(texts, vectors)
             ]
-            
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            for model_name in models_to_try:
-                print(f"Trying model: {model_name}")
-                url = f"https://api-inference.huggingface.co/models/{model_name}"
-                
-                try:
-                    async with httpx.AsyncClient(timeout=60.0) as client:
-                        # Use simple format for free tier
-                        payload = {"inputs": text}
-                        
-                        response = await client.post(url, headers=headers, json=payload)
-                        
-                        if response.status_code == 200:
-                            data = response.json()
-                            # HF returns array of arrays for feature extraction
-                            if isinstance(data, list) and len(data) > 0:
-                                result = data[0] if isinstance(data[0], list) else data
-                                print(f"✓ Success with {model_name}")
-                                return result
-                            return data
-                        elif response.status_code == 503:
-                            # Model is loading (common on free tier), wait and retry
-                            print(f"Model {model_name} is loading, waiting 20 seconds...")
-                            await asyncio.sleep(20)
-                            response = await client.post(url, headers=headers, json=payload)
-                            if response.status_code == 200:
-                                data = response.json()
-                                if isinstance(data, list) and len(data) > 0:
-                                    result = data[0] if isinstance(data[0], list) else data
-                                    print(f"✓ Success with {model_name} after retry")
-                                    return result
-                                return data
-                        elif response.status_code == 429:
-                            # Rate limit exceeded (free tier limitation)
-                            print(f"Rate limit exceeded for {model_name}. Trying next model...")
-                            continue
-                        else:
-                            print(f"Model {model_name} failed with {response.status_code}: {response.text}")
-                            continue
-                            
-                except Exception as e:
-                    print(f"Exception with {model_name}: {str(e)}")
-                    continue
-            
-            print("All models failed to generate embeddings")
-            return None
+        return vectors
+
+    async def _generate_embeddings_uncached(
+        self,
+        texts: List[str],
+        model: str,
+        api_key: Optional[str] = None,
+        batch_size: Optional[int] = None
+    ) -> List[Optional[list]]:
+        """Embed texts with the provider for the model, without consulting the cache"""
+        if local_embeddings.supports(model):
+            # In-process CPU model, no API key or network round trip needed
+            return await local_embeddings.embed(texts, model)
+
+        if model == "all-MiniLM-L6-v2" or model.startswith("sentence-transformers/"):
+            # Hugging Face Inference API - Free tier with read permissions
+            embed_batch = self._generate_huggingface_embeddings
+            batch_size = batch_size or settings.huggingface_embedding_batch_size
         elif model.startswith("text-embedding"):
             # OpenAI Embeddings API
-            if not api_key:
+            embed_batch = self._generate_openai_embeddings
+            batch_size = batch_size or settings.openai_embedding_batch_size
+        else:
+            return [None] * len(texts)
+
+        if not api_key:
+            return [None] * len(texts)
+
+        semaphore = asyncio.Semaphore(settings.embedding_max_concurrency)
+
+        async def run_batch(batch: List[str]) -> List[Optional[list]]:
+            async with semaphore:
+                vectors = await embed_batch(batch, model, api_key)
+            if not vectors or len(vectors) != len(batch):
+                return [None] * len(batch)
+            return vectors
+
+        batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+        results = await asyncio.gather(*(run_batch(batch) for batch in batches))
+        return [vector for batch_vectors in results for vector in batch_vectors]
+
+    def embedding_provider(self, model: str) -> str:
+        """Who embeds texts for the model: the in-process model, OpenAI or HuggingFace"""
+        if local_embeddings.supports(model):
+            return "local"
+        if model.startswith("text-embedding"):
+            return "openai"
+        return "huggingface"
+
+    def embeddings_require_api_key(self, model: str) -> bool:
+        """Remote embedding providers need an API key, local models do not"""
+        return not local_embeddings.supports(model)
+
+    async def _generate_openai_embeddings(self, texts: List[str], model: str, api_key: str) -> Optional[List[list]]:
+        """Embed a batch of texts with one OpenAI /embeddings request"""
+        try:
+            client = get_http_client("openai")
+            response = await client.post(
+                f"{self.openai_base_url}/embeddings",
+                headers={
+                    "Authorization": f"Bearer {api_key}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "model": model,
+                    "input": texts
+                }
+            )
+            if response.status_code == 200:
+                data = response.json()
+                # OpenAI tags each vector with the index of its input
+                items = sorted(data["data"], key=lambda item: item["index"])
+                return [item["embedding"] for item in items]
+            else:
+                print(f"OpenAI Embeddings API error: {response.status_code}", response.text)
                 return None
+        except Exception as e:
+            print(f"OpenAI Embeddings API error: {str(e)}")
+            return None
+
+    async def _generate_huggingface_embeddings(self, texts: List[str], model: str, api_key: str) -> Optional[List[list]]:
+        """Embed a batch of texts with the HuggingFace Inference API, trying fallback models"""
+        # Try different models that work well with free tier feature extraction
+        models_to_try = [
+            "BAAI/bge-base-en-v1.5",  # Popular feature extraction model
+            "sentence-transformers/all-MiniLM-L6-v2",  # Original choice
+            "thenlper/gte-small"  # Another good option
+        ]
+        if model.startswith("sentence-transformers/"):
+            # A specific model was asked for: other models' vectors would not be comparable
+            models_to_try = [model]
+        
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        # Use simple format for free tier
+        payload = {"inputs": texts}
+        
+        for model_name in models_to_try:
+            print(f"Trying model: {model_name}")
+            url = f"https://api-inference.huggingface.co/models/{model_name}"
+            
             try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(
-                        f"{self.openai_base_url}/embeddings",
-                        headers={
-                            "Authorization": f"Bearer {api_key}",
-                            "Content-Type": "application/json"
-                        },
-                        json={
-                            "model": model,
-                            "input": text
-                        }
-                    )
-                    if response.status_code == 200:
-                        data = response.json()
-                        return data["data"][0]["embedding"]
-                    else:
-                        print(f"OpenAI Embeddings API error: {response.status_code}", response.text)
-                        return None
+                client = get_http_client("huggingface")
+                response = await client.post(url, headers=headers, json=payload)
+                
+                if response.status_code == 503:
+                    # Model is loading (common on free tier), wait and retry
+                    print(f"Model {model_name} is loading, waiting 20 seconds...")
+                    await asyncio.sleep(20)
+                    response = await client.post(url, headers=headers, json=payload)
+                
+                if response.status_code == 200:
+                    vectors = self._normalize_huggingface_vectors(response.json(), len(texts))
+                    if vectors:
+                        print(f"✓ Success with {model_name}")
+                        return vectors
+                    print(f"Model {model_name} returned an unexpected embedding shape")
+                    continue
+                elif response.status_code == 429:
+                    # Rate limit exceeded (free tier limitation)
+                    print(f"Rate limit exceeded for {model_name}. Trying next model...")
+                    continue
+                else:
+                    print(f"Model {model_name} failed with {response.status_code}: {response.text}")
+                    continue
+                    
             except Exception as e:
-                print(f"OpenAI Embeddings API error: {str(e)}")
-                return None
+                print(f"Exception with {model_name}: {str(e)}")
+                continue
         
+        print("All models failed to generate embeddings")
         return None
 
+    def _normalize_huggingface_vectors(self, data: Any, expected: int) -> Optional[List[list]]:
+        """HF returns one vector per input, or token-level vectors where the first (CLS) one is used"""
+        if not isinstance(data, list) or len(data) != expected:
+            return None
+        vectors = []
+        for item in data:
+            if isinstance(item, list) and item and isinstance(item[0], list):
+                item = item[0]
+            if not isinstance(item, list) or not item:
+                return None
+            vectors.append(item)
+        return vectors
+
     async def analyze_document(self, text: str) -> Dict[str, Any]:
         """Analyze document content"""
         prompt = f"""
@@ -1,22 +1,77 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.api_keys import UserApiKey
 from app.schemas.api_keys import ApiKeyCreate, ApiKeyUpdate, ApiKeyResponse
 from app.core.config import settings
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+from functools import lru_cache
+import logging
+import threading
+import time
 import uuid
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def get_cipher() -> Fernet:
+    """Fernet instance shared by every ApiKeyService"""
+    # Get encryption key from settings
+    encryption_key = settings.api_key_encryption_key
+    
+    if isinstance(encryption_key, str):
+        encryption_key = encryption_key.encode()
+    
+    return Fernet(encryption_key)
+
+
+class DecryptedKeyCache:
+    """
+    Short-lived per-process cache of a user's decrypted API keys (key name -> value).
+    Entries expire after api_key_cache_ttl seconds and are dropped whenever the user's keys
+    change in this process; the TTL bounds staleness across processes.
+    """
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, keys = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return dict(keys)
+
+    def put(self, user_id: str, keys: Dict[str, str]):
+        if settings.api_key_cache_ttl <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + settings.api_key_cache_ttl, dict(keys))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > settings.api_key_cache_max_users:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+# Global decrypted API key cache instance
+decrypted_key_cache = DecryptedKeyCache()
 
 
 class ApiKeyService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
-        # Get encryption key from settings
-        encryption_key = settings.api_key_encryption_key
-        
-        if isinstance(encryption_key, str):
-            encryption_key = encryption_key.encode()
-        
-        self.cipher = Fernet(encryption_key)
+        self.cipher = get_cipher()
 
     def _encrypt_api_key(self, api_key: str) -> str:
         """Encrypt an API key"""
@@ -26,21 +81,27 @@ class ApiKeyService:
         """Decrypt an API key"""
         return self.cipher.decrypt(encrypted_key.encode()).decode()
 
-    def create_api_key(self, user_id: str, api_key_data: ApiKeyCreate) -> ApiKeyResponse:
+    async def _get_api_key(self, user_id: str, key_name: str) -> Optional[UserApiKey]:
+        """Get a stored API key row by name for a user"""
+        result = await self.db.execute(select(UserApiKey).filter(
+            UserApiKey.user_id == user_id,
+            UserApiKey.key_name == key_name
+        ))
+        return result.scalars().first()
+
+    async def create_api_key(self, user_id: str, api_key_data: ApiKeyCreate) -> ApiKeyResponse:
         """Create or update an API key for a user"""
         # Check if API key with this name already exists for the user
-        existing_key = self.db.query(UserApiKey).filter(
-            UserApiKey.user_id == user_id,
-            UserApiKey.key_name == api_key_data.key_name
-        ).first()
+        existing_key = await self._get_api_key(user_id, api_key_data.key_name)
 
         encrypted_key = self._encrypt_api_key(api_key_data.api_key)
 
         if existing_key:
             # Update existing key
             existing_key.encrypted_key = encrypted_key
-            self.db.commit()
-            self.db.refresh(existing_key)
+            await self.db.commit()
+            decrypted_key_cache.invalidate(str(user_id))
+            await self.db.refresh(existing_key)
             return ApiKeyResponse(
                 id=str(existing_key.id),
                 key_name=existing_key.key_name,
@@ -55,8 +116,9 @@ class ApiKeyService:
                 encrypted_key=encrypted_key
             )
             self.db.add(db_api_key)
-            self.db.commit()
-            self.db.refresh(db_api_key)
+            await self.db.commit()
+            decrypted_key_cache.invalidate(str(user_id))
+            await self.db.refresh(db_api_key)
             return ApiKeyResponse(
                 id=str(db_api_key.id),
                 key_name=db_api_key.key_name,
@@ -64,9 +126,10 @@ class ApiKeyService:
                 updated_at=db_api_key.updated_at
             )
 
-    def get_api_keys(self, user_id: str) -> List[ApiKeyResponse]:
+    async def get_api_keys(self, user_id: str) -> List[ApiKeyResponse]:
         """Get all API keys for a user (without the actual key values)"""
-        api_keys = self.db.query(UserApiKey).filter(UserApiKey.user_id == user_id).all()
+        result = await self.db.execute(select(UserApiKey).filter(UserApiKey.user_id == user_id))
+        api_keys = result.scalars().all()
         return [
             ApiKeyResponse(
                 id=str(key.id),
@@ -77,45 +140,52 @@ class ApiKeyService:
             for key in api_keys
         ]
 
-    def get_decrypted_api_key(self, user_id: str, key_name: str) -> Optional[str]:
-        """Get a decrypted API key by name for a user"""
-        api_key = self.db.query(UserApiKey).filter(
-            UserApiKey.user_id == user_id,
-            UserApiKey.key_name == key_name
-        ).first()
-        
-        if not api_key:
-            return None
+    async def get_all_decrypted_keys(self, user_id: str) -> Dict[str, str]:
+        """Get all decrypted API keys of a user (key name -> value) with one query, cached briefly"""
+        user_id = str(user_id)
+        keys = decrypted_key_cache.get(user_id)
+        if keys is not None:
+            return keys
         
-        return self._decrypt_api_key(api_key.encrypted_key)
+        result = await self.db.execute(select(UserApiKey).filter(UserApiKey.user_id == user_id))
+        keys = {}
+        for api_key in result.scalars().all():
+            try:
+                keys[api_key.key_name] = self._decrypt_api_key(api_key.encrypted_key)
+            except InvalidToken:
+                # One unreadable key (e.g. encrypted with an old encryption key) must not hide the others
+                logger.error(f"Could not decrypt API key '{api_key.key_name}' of user {user_id}; skipping it")
+        decrypted_key_cache.put(user_id, keys)
+        return keys
+
+    async def get_decrypted_api_key(self, user_id: str, key_name: str) -> Optional[str]:
+        """Get a decrypted API key by name for a user"""
+        keys = await self.get_all_decrypted_keys(user_id)
+        return keys.get(key_name)
 
-    def delete_api_key(self, user_id: str, key_name: str) -> bool:
+    async def delete_api_key(self, user_id: str, key_name: str) -> bool:
         """Delete an API key"""
-        api_key = self.db.query(UserApiKey).filter(
-            UserApiKey.user_id == user_id,
-            UserApiKey.key_name == key_name
-        ).first()
+        api_key = await self._get_api_key(user_id, key_name)
         
         if not api_key:
             return False
         
-        self.db.delete(api_key)
-        self.db.commit()
+        await self.db.delete(api_key)
+        await self.db.commit()
+        decrypted_key_cache.invalidate(str(user_id))
         return True
 
-    def update_api_key(self, user_id: str, key_name: str, api_key_data: ApiKeyUpdate) -> Optional[ApiKeyResponse]:
+    async def update_api_key(self, user_id: str, key_name: str, api_key_data: ApiKeyUpdate) -> Optional[ApiKeyResponse]:
         """Update an existing API key"""
-        api_key = self.db.query(UserApiKey).filter(
-            UserApiKey.user_id == user_id,
-            UserApiKey.key_name == key_name
-        ).first()
+        api_key = await self._get_api_key(user_id, key_name)
         
         if not api_key:
             return None
         
         api_key.encrypted_key = self._encrypt_api_key(api_key_data.api_key)
-        self.db.commit()
-        self.db.refresh(api_key)
+        await self.db.commit()
+        decrypted_key_cache.invalidate(str(user_id))
+        await self.db.refresh(api_key)
         
         return ApiKeyResponse(
             id=str(api_key.id),
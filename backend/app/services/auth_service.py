@@ -1,50 +1,111 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from app.models.user import User
 from app.schemas.auth import UserCreate
-from app.core.security import get_password_hash, verify_password
-from typing import Optional
+from app.core.security import get_password_hash_async, verify_password_async
+from app.core.config import settings
+from typing import Any, Dict, Optional
+from collections import OrderedDict
+import threading
+import time
+
+# User columns kept in the cache: enough for authorization and /auth/me, never the password hash
+CACHED_USER_FIELDS = ("id", "email", "username", "is_active", "created_at", "updated_at")
+
+
+class UserCache:
+    """
+    Bounded per-process TTL cache of authenticated users' minimal profiles, so most
+    requests authenticate without a database round trip.
+    """
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[User]:
+        """A detached User built from the cached profile, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, profile = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+        return User(**profile)
+
+    def put(self, user: User):
+        if settings.user_cache_ttl <= 0:
+            return
+        profile: Dict[str, Any] = {field: getattr(user, field) for field in CACHED_USER_FIELDS}
+        with self._lock:
+            self._entries[str(user.id)] = (time.monotonic() + settings.user_cache_ttl, profile)
+            self._entries.move_to_end(str(user.id))
+            while len(self._entries) > settings.user_cache_max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+
+# Global authenticated-user cache instance
+user_cache = UserCache()
 
 
 class AuthService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
 
-    def create_user(self, user_data: UserCreate) -> User:
+    async def create_user(self, user_data: UserCreate) -> User:
         """Create a new user"""
         try:
-            hashed_password = get_password_hash(user_data.password)
+            hashed_password = await get_password_hash_async(user_data.password)
             db_user = User(
                 email=user_data.email,
                 username=user_data.username,
                 hashed_password=hashed_password
             )
             self.db.add(db_user)
-            self.db.commit()
-            self.db.refresh(db_user)
+            await self.db.commit()
+            await self.db.refresh(db_user)
             return db_user
         except IntegrityError:
-            self.db.rollback()
+            await self.db.rollback()
             raise ValueError("User with this email already exists")
 
-    def authenticate_user(self, email: str, password: str) -> Optional[User]:
+    async def authenticate_user(self, email: str, password: str) -> Optional[User]:
         """Authenticate user by email and password"""
-        user = self.get_user_by_email(email)
-        if not user or not verify_password(password, user.hashed_password):
+        user = await self.get_user_by_email(email)
+        if not user or not await verify_password_async(password, user.hashed_password):
             return None
         return user
 
-    def get_user_by_email(self, email: str) -> Optional[User]:
+    async def get_user_by_email(self, email: str) -> Optional[User]:
         """Get user by email"""
-        return self.db.query(User).filter(User.email == email).first()
+        result = await self.db.execute(select(User).filter(User.email == email))
+        return result.scalars().first()
 
-    def get_user_by_id(self, user_id: str) -> Optional[User]:
+    async def get_user_by_id(self, user_id: str) -> Optional[User]:
         """Get user by ID"""
-        return self.db.query(User).filter(User.id == user_id).first()
+        result = await self.db.execute(select(User).filter(User.id == user_id))
+        return result.scalars().first()
+
+    async def get_authenticated_user(self, user_id: str) -> Optional[User]:
+        """Get the user of a verified token, from the user cache when possible"""
+        user = user_cache.get(str(user_id))
+        if user is None:
+            user = await self.get_user_by_id(user_id)
+            if user:
+                user_cache.put(user)
+        return user
 
-    def update_user(self, user_id: str, **kwargs) -> Optional[User]:
+    async def update_user(self, user_id: str, **kwargs) -> Optional[User]:
         """Update user information"""
-        user = self.get_user_by_id(user_id)
+        user = await self.get_user_by_id(user_id)
         if not user:
             return None
         
@@ -52,6 +113,7 @@ class AuthService:
             if hasattr(user, key):
                 setattr(user, key, value)
         
-        self.db.commit()
-        self.db.refresh(user)
+        await self.db.commit()
+        await self.db.refresh(user)
+        user_cache.invalidate(user_id)
         return user
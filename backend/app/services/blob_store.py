@@ -0,0 +1,124 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import Counter
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.document import ContentBlob
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStore:
+    """
+    Content-addressed storage for uploaded files.
+    Each file is kept once under its sha256, however many documents (in any workflow) use
+    it. The content_blobs table counts those documents, and a file is deleted together with
+    the last document referencing it. The text extracted from a blob is kept next to it, so
+    an identical upload is not extracted again.
+    """
+
+    @property
+    def root(self) -> str:
+        return os.path.join(settings.upload_dir, "blobs")
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def _text_path(self, sha256: str) -> str:
+        return f"{self.blob_path(sha256)}.text.json"
+
+    def temp_path(self) -> str:
+        """Where to write an upload while its hash is still unknown (same filesystem as the blobs)"""
+        os.makedirs(self.root, exist_ok=True)
+        return os.path.join(self.root, f"{uuid.uuid4().hex}.part")
+
+    async def acquire(self, db: AsyncSession, sha256: str, size: int):
+        """Add a reference to a blob within the caller's transaction, creating its row on first use"""
+        insert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+        statement = insert(ContentBlob).values(sha256=sha256, size=size, ref_count=1)
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=[ContentBlob.sha256],
+            set_={"ref_count": ContentBlob.ref_count + 1}
+        ))
+
+    def place(self, temp_path: str, sha256: str) -> str:
+        """Move an upload into the store once its reference is committed; a known blob is not written twice"""
+        path = self.blob_path(sha256)
+        if os.path.exists(path):
+            os.remove(temp_path)
+            metrics.track_document_dedup("blob")
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+        return path
+
+    async def release(self, hashes: Iterable[str]):
+        """Drop one reference per hash; blobs nobody references any more are deleted"""
+        counts = Counter(sha256 for sha256 in hashes if sha256)
+        if not counts:
+            return
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(ContentBlob).where(ContentBlob.sha256.in_(list(counts))).with_for_update()
+            )
+            unused = []
+            for blob in result.scalars().all():
+                blob.ref_count -= counts[blob.sha256]
+                if blob.ref_count <= 0:
+                    await db.delete(blob)
+                    unused.append(blob.sha256)
+            # Files go while the rows are still locked: an upload of the same bytes waiting on
+            # the lock re-creates the row afterwards and places its own copy of the file
+            for sha256 in unused:
+                for path in (self.blob_path(sha256), self._text_path(sha256)):
+                    if os.path.exists(path):
+                        os.remove(path)
+            await db.commit()
+        if unused:
+            logger.info(f"Deleted {len(unused)} unreferenced content blobs")
+
+    async def load_text(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """Previously extracted text of a blob, or None"""
+        path = self._text_path(sha256)
+        if not os.path.exists(path):
+            return None
+        try:
+            return await asyncio.to_thread(self._read_json, path)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable extracted text of blob {sha256}: {e}")
+            return None
+
+    async def save_text(self, sha256: str, extracted: Dict[str, Any]):
+        """Keep the extracted text of a blob for identical uploads"""
+        try:
+            await asyncio.to_thread(self._write_json, self._text_path(sha256), extracted)
+        except Exception as e:
+            logger.warning(f"Failed to keep extracted text of blob {sha256}: {e}")
+
+    @staticmethod
+    def _read_json(path: str) -> Dict[str, Any]:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write_json(path: str, data: Dict[str, Any]):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.part"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+
+
+# Global blob store instance
+blob_store = BlobStore()
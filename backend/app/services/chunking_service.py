@@ -0,0 +1,139 @@
+import re
+import bisect
+from typing import List, Dict, Any, Tuple
+
+from app.core.config import settings
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+WHITESPACE = re.compile(r"\s+")
+
+# Separator used when joining the pages of a document into one text
+PAGE_SEPARATOR = "\n\n"
+
+Span = Tuple[int, int]
+
+
+class ChunkingService:
+    """Split extracted document text into overlapping, paragraph/sentence aligned chunks"""
+
+    def __init__(self, chunk_size: int = None, chunk_overlap: int = None):
+        self.chunk_size = chunk_size or settings.chunk_size
+        self.chunk_overlap = settings.chunk_overlap if chunk_overlap is None else chunk_overlap
+        if self.chunk_overlap >= self.chunk_size:
+            raise ValueError("Chunk overlap must be smaller than chunk size")
+
+    def chunk_pages(self, pages: List[str]) -> List[Dict[str, Any]]:
+        """
+        Chunk a paged document (e.g. a PDF) and tag every chunk with its page range.
+        Page numbers are 1-based; offsets refer to the pages joined with PAGE_SEPARATOR.
+        """
+        page_starts = []
+        offset = 0
+        for page in pages:
+            page_starts.append(offset)
+            offset += len(page) + len(PAGE_SEPARATOR)
+
+        chunks = self.chunk_text(PAGE_SEPARATOR.join(pages))
+        for chunk in chunks:
+            chunk["page_start"] = bisect.bisect_right(page_starts, chunk["start_offset"])
+            chunk["page_end"] = bisect.bisect_right(page_starts, chunk["end_offset"] - 1)
+        return chunks
+
+    def chunk_text(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Chunk text into pieces of at most chunk_size characters.
+        Returns: list of {"text", "chunk_index", "start_offset", "end_offset"}
+        """
+        chunks = []
+        current: List[Span] = []
+
+        for segment in self._split_segments(text):
+            if current and segment[1] - current[0][0] > self.chunk_size:
+                chunks.append(self._make_chunk(text, current, len(chunks)))
+                current = self._overlap_tail(current)
+                # Drop overlap that would push the next chunk over the size limit
+                while current and segment[1] - current[0][0] > self.chunk_size:
+                    current.pop(0)
+            current.append(segment)
+
+        if current:
+            chunks.append(self._make_chunk(text, current, len(chunks)))
+        return chunks
+
+    def _make_chunk(self, text: str, segments: List[Span], index: int) -> Dict[str, Any]:
+        start, end = segments[0][0], segments[-1][1]
+        return {
+            "text": text[start:end],
+            "chunk_index": index,
+            "start_offset": start,
+            "end_offset": end
+        }
+
+    def _overlap_tail(self, segments: List[Span]) -> List[Span]:
+        """Trailing segments of a finished chunk that are repeated at the start of the next one"""
+        if self.chunk_overlap <= 0:
+            return []
+        end = segments[-1][1]
+        tail = []
+        # Never carry the whole chunk over, otherwise the next chunk would contain it entirely
+        for segment in reversed(segments[1:]):
+            if end - segment[0] > self.chunk_overlap:
+                break
+            tail.insert(0, segment)
+        return tail
+
+    def _split_segments(self, text: str) -> List[Span]:
+        """Split text into paragraphs, falling back to sentences and then words for long ones"""
+        segments = []
+        for paragraph in self._spans(text, 0, len(text), PARAGRAPH_BREAK):
+            if paragraph[1] - paragraph[0] <= self.chunk_size:
+                segments.append(paragraph)
+                continue
+            for sentence in self._spans(text, paragraph[0], paragraph[1], SENTENCE_BREAK):
+                if sentence[1] - sentence[0] <= self.chunk_size:
+                    segments.append(sentence)
+                else:
+                    segments.extend(self._split_words(text, sentence))
+        return segments
+
+    def _split_words(self, text: str, span: Span) -> List[Span]:
+        """Pack words into pieces of at most chunk_size, hard-splitting words that are longer"""
+        pieces = []
+        piece_start = None
+        piece_end = None
+        for word_start, word_end in self._spans(text, span[0], span[1], WHITESPACE):
+            while word_end - word_start > self.chunk_size:
+                if piece_start is not None:
+                    pieces.append((piece_start, piece_end))
+                    piece_start = None
+                pieces.append((word_start, word_start + self.chunk_size))
+                word_start += self.chunk_size
+            if piece_start is not None and word_end - piece_start > self.chunk_size:
+                pieces.append((piece_start, piece_end))
+                piece_start = None
+            if piece_start is None:
+                piece_start = word_start
+            piece_end = word_end
+        if piece_start is not None:
+            pieces.append((piece_start, piece_end))
+        return pieces
+
+    def _spans(self, text: str, start: int, end: int, separator: re.Pattern) -> List[Span]:
+        """Spans of text[start:end] between separator matches, with surrounding whitespace trimmed"""
+        spans = []
+        position = start
+        for match in separator.finditer(text, start, end):
+            spans.append((position, match.start()))
+            position = match.end()
+        spans.append((position, end))
+
+        trimmed = []
+        for span_start, span_end in spans:
+            while span_start < span_end and text[span_start].isspace():
+                span_start += 1
+            while span_end > span_start and text[span_end - 1].isspace():
+                span_end -= 1
+            if span_end > span_start:
+                trimmed.append((span_start, span_end))
+        return trimmed
@@ -1,38 +1,52 @@
 import os
+import uuid
+import hashlib
 import aiofiles
-from typing import List, Optional, Dict, Any
-from sqlalchemy.orm import Session
+from typing import List, Optional, Dict, Any, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import UploadFile
-import fitz  # PyMuPDF
-import chromadb
-from docx import Document as DocxDocument
 
 from app.models.document import Document
+from app.models.workflow import Workflow
 from app.schemas.document import DocumentCreate
 from app.services.ai_service import AIService
 from app.services.api_key_service import ApiKeyService
+from app.services.chunking_service import ChunkingService, PAGE_SEPARATOR
+from app.services.lexical_index import lexical_index, reciprocal_rank_fusion
+from app.services.text_extraction import text_extractor
+from app.services.blob_store import blob_store
+from app.services.embedding_cache import text_hash
 from app.core.config import settings
+from app.core.vector_store import vector_store
+from app.utils.metrics import metrics
+
+# Rough characters-per-token ratio used to size retrieved context without a tokenizer
+CHARS_PER_TOKEN = 4
+
+PDF_CONTENT_TYPE = "application/pdf"
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+class FileTooLargeError(ValueError):
+    """Raised when an upload exceeds settings.max_file_size"""
 
 
 class DocumentService:
-    def __init__(self, db: Session = None):
+    def __init__(self, db: AsyncSession = None):
         self.db = db
         self.upload_dir = settings.upload_dir
         
-        # Initialize ChromaDB in embedded mode
-        self.chroma_client = chromadb.Client(chromadb.config.Settings(
-            persist_directory=settings.chroma_persist_directory,
-            anonymized_telemetry=False
-        ))
+        # ChromaDB client and collection handles are shared process-wide
+        self.chroma_client = vector_store.client
         
         self.collection_name = "documents"
         self.api_key_service = ApiKeyService(db) if db else None
+        self.chunking_service = ChunkingService()
+        self.ai_service = AIService()
         
         # Ensure upload directory exists
         os.makedirs(self.upload_dir, exist_ok=True)
-        
-        # Ensure ChromaDB persist directory exists
-        os.makedirs(settings.chroma_persist_directory, exist_ok=True)
 
     async def upload_document(self, file: UploadFile, user_id: str, embedding_model: str = "text-embedding-ada-002", api_key: str = None) -> Document:
         """Upload and process document"""
@@ -40,18 +54,15 @@ class DocumentService:
         if not self._is_valid_file_type(file.filename):
             raise ValueError("Invalid file type")
 
-        # Save file
-        file_path = os.path.join(self.upload_dir, f"{user_id}_{file.filename}")
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
+        # Stream file to disk; identical content is stored only once
+        temp_path, file_size, file_hash = await self._save_upload(file)
 
         # Create database record
         document_data = DocumentCreate(
             filename=file.filename,
             content_type=file.content_type,
-            file_size=len(content),
-            file_path=file_path
+            file_size=file_size,
+            file_path=blob_store.blob_path(file_hash)
         )
 
         db_document = Document(
@@ -59,13 +70,13 @@ class DocumentService:
             content_type=document_data.content_type,
             file_size=document_data.file_size,
             file_path=document_data.file_path,
+            content_hash=file_hash,
             user_id=user_id
         )
 
+        await self.add_upload_documents([(db_document, temp_path)])
         if self.db:
-            self.db.add(db_document)
-            self.db.commit()
-            self.db.refresh(db_document)
+            await self.db.refresh(db_document)
 
         # Process document asynchronously with specified model and API key
         await self._process_document(db_document, embedding_model, api_key)
@@ -77,151 +88,105 @@ class DocumentService:
         if not self.db:
             return ""
 
-        document = self.db.query(Document).filter(Document.id == document_id).first()
+        result = await self.db.execute(select(Document).filter(Document.id == document_id))
+        document = result.scalars().first()
         if not document:
             raise ValueError("Document not found")
 
-        return await self._extract_text_from_file(document.file_path)
+        return await self._extract_text_from_file(document.file_path, document.content_type)
+
+    async def _save_upload(self, file: UploadFile) -> Tuple[str, int, str]:
+        """
+        Stream an upload to a temporary file in fixed-size chunks, hashing it and enforcing max_file_size on the way.
+        Returns the temporary path, size and sha256 hex digest. Nothing is left on disk if the upload is rejected.
+        """
+        if file.size is not None and file.size > settings.max_file_size:
+            raise FileTooLargeError(f"File exceeds the maximum size of {settings.max_file_size} bytes")
 
-    async def _extract_text_from_file(self, file_path: str) -> str:
-        """Extract text from file based on type"""
-        if file_path.endswith('.pdf'):
-            return self._extract_pdf_text(file_path)
-        elif file_path.endswith('.txt'):
+        digest = hashlib.sha256()
+        size = 0
+        # The file is content-addressed, so where it goes is only known once it has been read
+        temp_path = blob_store.temp_path()
+        try:
+            async with aiofiles.open(temp_path, 'wb') as f:
+                while True:
+                    chunk = await file.read(settings.upload_chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > settings.max_file_size:
+                        raise FileTooLargeError(f"File exceeds the maximum size of {settings.max_file_size} bytes")
+                    digest.update(chunk)
+                    await f.write(chunk)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return temp_path, size, digest.hexdigest()
+
+    async def _extract_text_from_file(self, file_path: str, content_type: str = None) -> str:
+        """Extract text from a stored file based on its type"""
+        if content_type == PDF_CONTENT_TYPE or file_path.endswith('.pdf'):
+            return PAGE_SEPARATOR.join(await self._extract_pdf_pages(file_path))
+        elif content_type == DOCX_CONTENT_TYPE or file_path.endswith('.docx'):
+            return await self._extract_docx_text(file_path)
+        elif (content_type or "").startswith("text/") or file_path.endswith('.txt'):
             async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
                 return await f.read()
-        elif file_path.endswith('.docx'):
-            return self._extract_docx_text(file_path)
         else:
             return "Unsupported file type for text extraction"
 
-    def _extract_pdf_text(self, file_path: str) -> str:
-        """Extract text from PDF using PyMuPDF"""
-        try:
-            doc = fitz.open(file_path)
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            doc.close()
-            return text
-        except Exception as e:
-            return f"Error extracting PDF text: {str(e)}"
-
-    def _extract_docx_text(self, file_path: str) -> str:
-        """Extract text from DOCX using python-docx"""
-        try:
-            doc = DocxDocument(file_path)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text
-        except Exception as e:
-            return f"Error extracting DOCX text: {str(e)}"
-
-    async def _extract_pdf_text(self, content: bytes) -> str:
-        """Extract text from PDF content using PyMuPDF"""
+    async def _extract_pdf_pages(self, file_path: str) -> List[str]:
+        """Extract the text of every page of a stored PDF (page ranges run in parallel worker processes)"""
         try:
-            import tempfile
-            import io
-            
-            # Check if content is valid
-            if not content or len(content) == 0:
-                return "Error: PDF content is empty"
-                
-            # Try to open directly from bytes first
-            try:
-                doc = fitz.open(stream=content, filetype="pdf")
-                text = ""
-                for page in doc:
-                    text += page.get_text()
-                doc.close()
-                
-                if not text.strip():
-                    return "Error: PDF appears to be empty or contains no extractable text"
-                    
-                return text
-            except Exception as direct_error:
-                print(f"Direct PDF processing failed: {direct_error}")
-                
-                # Fallback: Use temporary file
-                with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
-                    temp_file.write(content)
-                    temp_file.flush()
-                    
-                    doc = fitz.open(temp_file.name)
-                    text = ""
-                    for page in doc:
-                        text += page.get_text()
-                    doc.close()
-                    
-                    # Clean up temp file
-                    os.unlink(temp_file.name)
-                    
-                    if not text.strip():
-                        return "Error: PDF appears to be empty or contains no extractable text"
-                        
-                    return text
-                    
+            return await text_extractor.extract_pdf_pages(file_path)
         except Exception as e:
-            print(f"PDF extraction error: {str(e)}")
-            return f"Error extracting PDF text: {str(e)}"
+            raise ValueError(f"Failed to extract PDF text: {str(e)}")
 
-    async def _extract_docx_text(self, content: bytes) -> str:
-        """Extract text from DOCX content using python-docx"""
+    async def _extract_docx_text(self, file_path: str) -> str:
+        """Extract text from a stored DOCX in a worker process"""
         try:
-            import tempfile
-            with tempfile.NamedTemporaryFile(suffix='.docx', delete=False) as temp_file:
-                temp_file.write(content)
-                temp_file.flush()
-                
-                doc = DocxDocument(temp_file.name)
-                text = ""
-                for paragraph in doc.paragraphs:
-                    text += paragraph.text + "\n"
-                
-                # Clean up temp file
-                os.unlink(temp_file.name)
-                return text
+            return await text_extractor.extract_docx_text(file_path)
         except Exception as e:
-            return f"Error extracting DOCX text: {str(e)}"
+            raise ValueError(f"Failed to extract DOCX text: {str(e)}")
 
     async def _process_document(self, document: Document, embedding_model: str = "text-embedding-ada-002", api_key: str = None):
         """Process document: extract text and generate embeddings with selected model and key"""
         try:
-            # Extract text
-            text = await self._extract_text_from_file(document.file_path)
+            # Extract text (PDFs keep their page boundaries for chunk metadata)
+            pages = None
+            if document.content_type == PDF_CONTENT_TYPE or document.file_path.endswith('.pdf'):
+                pages = await self._extract_pdf_pages(document.file_path)
+            else:
+                text = await self._extract_text_from_file(document.file_path, document.content_type)
             
             # Get API key if not provided
             final_api_key = api_key
             if not final_api_key and self.api_key_service and document.user_id:
                 # Determine which API key to use based on embedding model
                 if embedding_model == "all-MiniLM-L6-v2":
-                    final_api_key = self.api_key_service.get_decrypted_api_key(str(document.user_id), "huggingface")
+                    final_api_key = await self.api_key_service.get_decrypted_api_key(str(document.user_id), "huggingface")
                 else:
-                    final_api_key = self.api_key_service.get_decrypted_api_key(str(document.user_id), "openai")
+                    final_api_key = await self.api_key_service.get_decrypted_api_key(str(document.user_id), "openai")
             
-            # Generate embeddings with model and key
-            ai_service = AIService()
-            embeddings = await ai_service.generate_embeddings(text, model=embedding_model, api_key=final_api_key)
+            # Split into chunks and embed them in batches
+            chunks = self.chunking_service.chunk_pages(pages) if pages is not None else self.chunking_service.chunk_text(text)
+            chunk_texts = [chunk["text"] for chunk in chunks]
+            embeddings = await self._embed_chunks(chunk_texts, embedding_model, final_api_key) if chunks else None
             if embeddings:
-                # Store in ChromaDB
-                collection = self._get_or_create_collection()
-                collection.add(
-                    documents=[text],
-                    metadatas=[{
-                        "document_id": str(document.id),
-                        "filename": document.filename,
-                        "user_id": str(document.user_id),
-                        "workflow_id": str(document.workflow_id) if document.workflow_id else None
-                    }],
-                    ids=[str(document.id)],
-                    embeddings=[embeddings]
-                )
+                # Store all chunks in ChromaDB with a single bulk add
+                ids, metadatas = self._build_chunk_records(chunks, str(document.id), {
+                    "document_id": str(document.id),
+                    "filename": document.filename,
+                    "user_id": str(document.user_id),
+                    "workflow_id": str(document.workflow_id) if document.workflow_id else None
+                })
+                self._store_chunks(ids, chunk_texts, metadatas, embeddings)
                 # Mark as processed only if embeddings were successfully generated and stored
                 if self.db:
                     document.processed = True
-                    self.db.commit()
-                print(f"Successfully processed document {document.id} with {embedding_model}")
+                    await self.db.commit()
+                print(f"Successfully processed document {document.id} ({len(chunks)} chunks) with {embedding_model}")
             else:
                 # Don't mark as processed if embedding generation failed
                 print(f"Failed to generate embeddings for document {document.id} using {embedding_model}")
@@ -243,9 +208,9 @@ class DocumentService:
             # Get API key if needed
             api_key = None
             if self.api_key_service and embedding_model == "all-MiniLM-L6-v2":
-                api_key = self.api_key_service.get_decrypted_api_key(user_id, "huggingface")
+                api_key = await self.api_key_service.get_decrypted_api_key(user_id, "huggingface")
             elif self.api_key_service and embedding_model.startswith("text-embedding"):
-                api_key = self.api_key_service.get_decrypted_api_key(user_id, "openai")
+                api_key = await self.api_key_service.get_decrypted_api_key(user_id, "openai")
             
             query_embedding = await ai_service.generate_embeddings(query, model=embedding_model, api_key=api_key)
             
@@ -319,231 +284,497 @@ class DocumentService:
     async def process_document(self, file: UploadFile, workflow_id: str, user_id: str) -> Dict[str, Any]:
         """Process and store document for workflow"""
         try:
-            # Save and process document
-            content = await file.read()
-            
-            print(f"Processing document: {file.filename}, size: {len(content)} bytes, type: {file.content_type}")
-            
-            # Check if content is valid
-            if not content or len(content) == 0:
-                raise ValueError("Document content is empty")
-            
-            # Extract text content
-            text_content = ""
-            if file.content_type == "application/pdf":
-                text_content = await self._extract_pdf_text(content)
-            elif file.content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-                text_content = await self._extract_docx_text(content)
-            elif file.content_type.startswith("text/"):
-                text_content = content.decode('utf-8')
-            else:
-                raise ValueError(f"Unsupported file type: {file.content_type}")
-            
-            print(f"Extracted text length: {len(text_content)}")
-            
-            if not text_content.strip():
-                raise ValueError("No text could be extracted from the document")
-            
-            # Save to database first
-            from app.models.document import Document
-            import os
-            from app.core.config import settings
-            import aiofiles
-            
-            # Save file to disk
-            file_path = os.path.join(settings.upload_dir, f"{user_id}_{file.filename}")
-            async with aiofiles.open(file_path, 'wb') as f:
-                await f.write(content)
-            
-            # Create DB record
-            db_document = Document(
-                filename=file.filename,
-                content_type=file.content_type,
-                file_size=len(content),
-                file_path=file_path,
-                user_id=user_id,
-                workflow_id=workflow_id,
-                processed=False
-            )
-            
-            if self.db:
-                self.db.add(db_document)
-                self.db.commit()
-                self.db.refresh(db_document)
-            
-            # Generate embeddings with user's API keys
-            print(f"DEBUG: Generating embeddings for document: {file.filename}")
-            print(f"DEBUG: Text content length: {len(text_content)}")
-            ai_service = AIService()
-            
-            # Try to get user's API keys for embeddings
-            embeddings = None
-            api_key = None
-            embedding_model = "all-MiniLM-L6-v2"  # Default to HuggingFace free model
+            temp_path, file_size, file_hash = await self.save_upload_file(file)
+            document = self.create_upload_document(file, file_hash, file_size, workflow_id, user_id)
+            await self.add_upload_documents([(document, temp_path)])
+            try:
+                extracted = await self.extract_document_text(document)
+            except Exception:
+                await self.remove_documents([document])
+                raise
             
-            if self.api_key_service and user_id:
-                # Try HuggingFace first (free tier)
-                api_key = self.api_key_service.get_decrypted_api_key(str(user_id), "huggingface")
-                if api_key:
-                    print(f"DEBUG: Using HuggingFace API key for embeddings")
-                    embeddings = await ai_service.generate_embeddings(text_content, model=embedding_model, api_key=api_key)
-                else:
-                    # Try OpenAI as fallback
-                    api_key = self.api_key_service.get_decrypted_api_key(str(user_id), "openai")
-                    if api_key:
-                        print(f"DEBUG: Using OpenAI API key for embeddings")
-                        embedding_model = "text-embedding-ada-002"
-                        embeddings = await ai_service.generate_embeddings(text_content, model=embedding_model, api_key=api_key)
-                    else:
-                        print("DEBUG: No API keys found for user - embeddings will not be generated")
-            else:
-                print("DEBUG: API key service not available - embeddings will not be generated")
+            chunks = self.chunk_extracted(extracted)
+            print(f"DEBUG: Split {file.filename} into {len(chunks)} chunks")
             
-            print(f"DEBUG: Embeddings generated: {bool(embeddings)}")
-            if embeddings:
-                print(f"DEBUG: Embedding dimensions: {len(embeddings)}")
-            else:
-                print("WARNING: No embeddings generated - document will not be searchable")
+            embedding_model, api_key = await self.resolve_upload_embedding(user_id)
+            embeddings = await self.embed_upload_chunks(chunks, embedding_model, api_key, file_hash)
             
-            doc_id = f"{workflow_id}_{file.filename}_{hash(text_content)}"
+            result = await self.store_document_chunks(document, extracted, chunks, embeddings, embedding_model)
             
-            if embeddings:
-                print(f"Generated embeddings, length: {len(embeddings)}")
-                
-                # Store in ChromaDB with error handling for dimension mismatch
-                try:
-                    collection = self._get_or_create_collection()
-                    
-                    collection.add(
-                        documents=[text_content],
-                        embeddings=[embeddings],
-                        metadatas=[{
-                            "filename": file.filename,
-                            "workflow_id": workflow_id,
-                            "user_id": user_id,
-                            "content_type": file.content_type,
-                            "size": len(content),
-                            "doc_id": str(db_document.id) if hasattr(db_document, 'id') else doc_id
-                        }],
-                        ids=[doc_id]
-                    )
-                    print(f"✓ Document stored in ChromaDB with embeddings: {doc_id}")
-                except Exception as e:
-                    if "dimension" in str(e).lower():
-                        print(f"Dimension mismatch detected: {str(e)}")
-                        print("Recreating collection with correct dimensions...")
-                        collection = self._get_or_create_collection(force_recreate=True)
-                        collection.add(
-                            documents=[text_content],
-                            embeddings=[embeddings],
-                            metadatas=[{
-                                "filename": file.filename,
-                                "workflow_id": workflow_id,
-                                "user_id": user_id,
-                                "content_type": file.content_type,
-                                "size": len(content),
-                                "doc_id": str(db_document.id) if hasattr(db_document, 'id') else doc_id
-                            }],
-                            ids=[doc_id]
-                        )
-                        print(f"✓ Document stored in ChromaDB with embeddings after recreation: {doc_id}")
-                    else:
-                        raise e
-            else:
-                print("WARNING: No embeddings available - storing document without embeddings")
-                # Store document without embeddings (text-only for fallback retrieval)
-                try:
-                    collection = self._get_or_create_collection()
-                    collection.add(
-                        documents=[text_content],
-                        metadatas=[{
-                            "filename": file.filename,
-                            "workflow_id": workflow_id,
-                            "user_id": user_id,
-                            "content_type": file.content_type,
-                            "size": len(content),
-                            "doc_id": str(db_document.id) if hasattr(db_document, 'id') else doc_id,
-                            "no_embeddings": True  # Flag for fallback retrieval
-                        }],
-                        ids=[doc_id]
-                    )
-                    print(f"✓ Document stored in ChromaDB without embeddings: {doc_id}")
-                except Exception as e:
-                    if "dimension" in str(e).lower():
-                        print(f"Dimension mismatch detected for no-embeddings storage: {str(e)}")
-                        print("Recreating collection...")
-                        collection = self._get_or_create_collection(force_recreate=True)
-                        collection.add(
-                            documents=[text_content],
-                            metadatas=[{
-                                "filename": file.filename,
-                                "workflow_id": workflow_id,
-                                "user_id": user_id,
-                                "content_type": file.content_type,
-                                "size": len(content),
-                                "doc_id": str(db_document.id) if hasattr(db_document, 'id') else doc_id,
-                                "no_embeddings": True  # Flag for fallback retrieval
-                            }],
-                            ids=[doc_id]
-                        )
-                        print(f"✓ Document stored in ChromaDB without embeddings after recreation: {doc_id}")
-                    else:
-                        raise e
-                
             # Mark as processed
-            if self.db and hasattr(db_document, 'id'):
-                db_document.processed = True
-                self.db.commit()
-                
-            print(f"Document stored in ChromaDB with ID: {doc_id}")
+            if self.db:
+                document.processed = True
+                await self.db.commit()
             
-            return {
-                "doc_id": doc_id,
-                "filename": file.filename,
-                "size": len(content),
-                "content_type": file.content_type,
-                "processed": bool(embeddings),
-                "embeddings_count": len(embeddings) if embeddings else 0,
-                "text_length": len(text_content),
-                "message": f"Successfully processed {file.filename}"
-            }
+            return {**result, "sha256": file_hash}
             
+        except FileTooLargeError:
+            raise
         except Exception as e:
             print(f"Document processing error: {str(e)}")
             raise ValueError(f"Failed to process document: {str(e)}")
 
-    async def _extract_pdf_text(self, content: bytes) -> str:
-        """Extract text from PDF content"""
+    # The steps of process_document; the ingestion pipeline runs them as separate stages
+
+    async def save_upload_file(self, file: UploadFile) -> Tuple[str, int, str]:
+        """Stream an upload to a temporary file; returns its path, size and sha256"""
+        temp_path, file_size, file_hash = await self._save_upload(file)
+        print(f"Processing document: {file.filename}, size: {file_size} bytes, type: {file.content_type}")
+        return temp_path, file_size, file_hash
+
+    def create_upload_document(
+        self,
+        file: UploadFile,
+        file_hash: str,
+        file_size: int,
+        workflow_id: str,
+        user_id: str,
+        ingest_job_id: uuid.UUID = None
+    ) -> Document:
+        """Build (without adding it to the session) the record of a workflow upload stored as a blob"""
+        document = Document(
+            filename=file.filename,
+            content_type=file.content_type,
+            file_size=file_size,
+            file_path=blob_store.blob_path(file_hash),
+            content_hash=file_hash,
+            user_id=user_id,
+            workflow_id=workflow_id,
+            processed=False
+        )
+        if ingest_job_id:
+            document.ingest_job_id = ingest_job_id
+            document.status = "queued"
+            document.progress = 0
+        return document
+
+    async def add_upload_documents(self, uploads: List[Tuple[Document, str]]):
+        """
+        Record new uploads, given as (document, temporary path) pairs, together with their blob
+        references in one transaction; then move the files into the blob store.
+        """
+        try:
+            if self.db:
+                for document, _ in uploads:
+                    self.db.add(document)
+                    await blob_store.acquire(self.db, document.content_hash, document.file_size)
+                await self.db.commit()
+        except BaseException:
+            for _, temp_path in uploads:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            raise
+        for document, temp_path in uploads:
+            blob_store.place(temp_path, document.content_hash)
+
+    async def find_workflow_document(self, workflow_id: str, content_hash: str) -> Optional[Document]:
+        """A document of the workflow with the same content, unless that one failed"""
+        if not self.db:
+            return None
+        result = await self.db.execute(select(Document).filter(
+            Document.workflow_id == workflow_id,
+            Document.content_hash == content_hash,
+            Document.status != "failed"
+        ))
+        return result.scalars().first()
+
+    async def extract_document_text(self, document: Document) -> Dict[str, Any]:
+        """Extract the text of a stored upload, reusing the text extracted earlier from identical content"""
+        if document.content_hash:
+            cached = await blob_store.load_text(document.content_hash)
+            if cached is not None and cached.get("content_type") == document.content_type:
+                metrics.track_document_dedup("text")
+                return cached
+        
+        # Check if content is valid
+        if document.file_size == 0:
+            raise ValueError("Document content is empty")
+        
+        # Extract text content (PDFs keep their page boundaries for chunk metadata)
+        text_content = ""
+        pages = None
+        if document.content_type == PDF_CONTENT_TYPE:
+            pages = await self._extract_pdf_pages(document.file_path)
+            text_content = PAGE_SEPARATOR.join(pages)
+        elif document.content_type == DOCX_CONTENT_TYPE:
+            text_content = await self._extract_docx_text(document.file_path)
+        elif document.content_type.startswith("text/"):
+            text_content = await self._extract_text_from_file(document.file_path, document.content_type)
+        else:
+            raise ValueError(f"Unsupported file type: {document.content_type}")
+        
+        print(f"Extracted text length: {len(text_content)}")
+        
+        if not text_content.strip():
+            raise ValueError("No text could be extracted from the document")
+        
+        extracted = {"text": text_content, "pages": pages, "content_type": document.content_type}
+        if document.content_hash:
+            await blob_store.save_text(document.content_hash, extracted)
+        return extracted
+
+    def chunk_extracted(self, extracted: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Split extracted text into chunks with offset/page metadata"""
+        if extracted["pages"] is not None:
+            return self.chunking_service.chunk_pages(extracted["pages"])
+        return self.chunking_service.chunk_text(extracted["text"])
+
+    async def resolve_upload_embedding(self, user_id: str) -> Tuple[str, Optional[str]]:
+        """Pick the embedding model and API key for uploads: the local model, then the user's HuggingFace or OpenAI key"""
+        api_key = None
+        embedding_model = "all-MiniLM-L6-v2"  # Default to the free MiniLM model
+        
+        if not self.ai_service.embeddings_require_api_key(embedding_model):
+            print(f"DEBUG: Using local {embedding_model} model for embeddings")
+        elif self.api_key_service and user_id:
+            # Try HuggingFace first (free tier)
+            api_key = await self.api_key_service.get_decrypted_api_key(str(user_id), "huggingface")
+            if api_key:
+                print(f"DEBUG: Using HuggingFace API key for embeddings")
+            else:
+                # Try OpenAI as fallback
+                api_key = await self.api_key_service.get_decrypted_api_key(str(user_id), "openai")
+                if api_key:
+                    print(f"DEBUG: Using OpenAI API key for embeddings")
+                    embedding_model = "text-embedding-ada-002"
+                else:
+                    print("DEBUG: No API keys found for user - embeddings will not be generated")
+        else:
+            print("DEBUG: API key service not available - embeddings will not be generated")
+        return embedding_model, api_key
+
+    async def embed_upload_chunks(
+        self,
+        chunks: List[Dict[str, Any]],
+        embedding_model: str,
+        api_key: Optional[str],
+        content_hash: str = None
+    ) -> Optional[List[List[float]]]:
+        """Embed an upload's chunks, reusing stored embeddings of identical content; None when no embeddings could be generated"""
+        chunk_texts = [chunk["text"] for chunk in chunks]
+        embeddings = self._find_stored_embeddings(content_hash, embedding_model, chunk_texts) if content_hash else None
+        if embeddings:
+            metrics.track_document_dedup("embeddings")
+            print(f"DEBUG: Reusing stored embeddings for {len(chunk_texts)} chunks")
+        else:
+            embeddings = await self._embed_chunks(chunk_texts, embedding_model, api_key)
+        print(f"DEBUG: Embeddings generated: {bool(embeddings)}")
+        if not embeddings:
+            print("WARNING: No embeddings generated - document will not be searchable")
+        return embeddings
+
+    async def store_document_chunks(
+        self,
+        document: Document,
+        extracted: Dict[str, Any],
+        chunks: List[Dict[str, Any]],
+        embeddings: Optional[List[List[float]]],
+        embedding_model: str = None
+    ) -> Dict[str, Any]:
+        """Store a document's chunks (with or without embeddings) in ChromaDB"""
+        text_content = extracted["text"]
+        chunk_texts = [chunk["text"] for chunk in chunks]
+        workflow_id = str(document.workflow_id) if document.workflow_id else None
+        
+        # Content-addressed, so the ids are stable across uploads and restarts
+        doc_id = f"{workflow_id}_{document.content_hash or text_hash(text_content)}"
+        
+        ids, metadatas = self._build_chunk_records(chunks, doc_id, {
+            "filename": document.filename,
+            "workflow_id": workflow_id,
+            "user_id": str(document.user_id),
+            "content_type": document.content_type,
+            "size": document.file_size,
+            "doc_id": str(document.id) if document.id else doc_id,
+            "content_hash": document.content_hash,
+            "embedding_model": embedding_model if embeddings else None
+        })
+        if not embeddings:
+            # Store chunks without embeddings (text-only for fallback retrieval)
+            for metadata in metadatas:
+                metadata["no_embeddings"] = True
+        
+        # Store all chunks in ChromaDB with a single bulk add
+        self._store_chunks(ids, chunk_texts, metadatas, embeddings)
+        print(f"✓ Stored {len(ids)} chunks in ChromaDB {'with' if embeddings else 'without'} embeddings: {doc_id}")
+        print(f"Document stored in ChromaDB with ID: {doc_id}")
+        
+        return {
+            "doc_id": doc_id,
+            "filename": document.filename,
+            "size": document.file_size,
+            "content_type": document.content_type,
+            "processed": bool(embeddings),
+            "chunks_count": len(chunks),
+            "embeddings_count": len(embeddings) if embeddings else 0,
+            "text_length": len(text_content),
+            "message": f"Successfully processed {document.filename}"
+        }
+
+    async def _embed_chunks(self, texts: List[str], embedding_model: str, api_key: str = None) -> Optional[List[List[float]]]:
+        """Embed chunk texts in batches; returns None unless every chunk was embedded"""
+        if not texts or (not api_key and self.ai_service.embeddings_require_api_key(embedding_model)):
+            return None
+        
+        embeddings = await self.ai_service.generate_embeddings_batch(texts, model=embedding_model, api_key=api_key)
+        if not all(embeddings):
+            failed = sum(1 for embedding in embeddings if not embedding)
+            print(f"Embedding failed for {failed} of {len(texts)} chunks using {embedding_model}")
+            return None
+        return embeddings
+
+    def _find_stored_embeddings(self, content_hash: str, embedding_model: str, texts: List[str]) -> Optional[List[list]]:
+        """Embeddings already stored (in any workflow) for these chunks of the same content and model"""
+        try:
+            stored = self._get_or_create_collection().get(
+                where={"$and": [{"content_hash": content_hash}, {"embedding_model": embedding_model}]},
+                include=["documents", "embeddings"]
+            )
+        except Exception as e:
+            print(f"Lookup of stored embeddings failed: {str(e)}")
+            return None
+        
+        documents = stored.get("documents")
+        embeddings = stored.get("embeddings")
+        if documents is None or embeddings is None:
+            return None
+        vectors = {}
+        for text, embedding in zip(documents, embeddings):
+            vectors[text] = embedding.tolist() if hasattr(embedding, "tolist") else list(embedding)
+        if not texts or not all(text in vectors for text in texts):
+            return None
+        return [vectors[text] for text in texts]
+
+    def _build_chunk_records(self, chunks: List[Dict[str, Any]], base_id: str, metadata: Dict[str, Any]) -> Tuple[List[str], List[Dict[str, Any]]]:
+        """Build ChromaDB ids and metadatas for document chunks"""
+        # ChromaDB rejects None metadata values
+        base_metadata = {key: value for key, value in metadata.items() if value is not None}
+        ids = []
+        metadatas = []
+        for chunk in chunks:
+            ids.append(f"{base_id}_chunk_{chunk['chunk_index']}")
+            chunk_metadata = dict(base_metadata)
+            chunk_metadata.update({
+                "chunk_index": chunk["chunk_index"],
+                "chunk_count": len(chunks),
+                "start_offset": chunk["start_offset"],
+                "end_offset": chunk["end_offset"]
+            })
+            if "page_start" in chunk:
+                chunk_metadata["page_start"] = chunk["page_start"]
+                chunk_metadata["page_end"] = chunk["page_end"]
+            metadatas.append(chunk_metadata)
+        return ids, metadatas
+
+    def _store_chunks(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]], embeddings: Optional[List[List[float]]] = None):
+        """Store chunks with one bulk add, recreating the collection on embedding dimension mismatch"""
+        if not ids:
+            return
+        records = {"ids": ids, "documents": documents, "metadatas": metadatas}
+        if embeddings:
+            records["embeddings"] = embeddings
+        try:
+            # Upsert: ids are content-addressed, so storing the same content again is a no-op
+            self._get_or_create_collection().upsert(**records)
+        except Exception as e:
+            if "dimension" not in str(e).lower():
+                raise
+            print(f"Dimension mismatch detected: {str(e)}")
+            print("Recreating collection with correct dimensions...")
+            self._get_or_create_collection(force_recreate=True).upsert(**records)
+            lexical_index.drop()
+        
+        # Keep the BM25 index in step with the collection
+        workflow_id = metadatas[0].get("workflow_id")
+        if workflow_id:
+            lexical_index.add(workflow_id, ids, documents)
+
+    async def retrieve_workflow_context(
+        self,
+        workflow_id: str,
+        query: str,
+        query_embedding: Optional[list] = None,
+        top_k: int = None,
+        max_tokens: int = None
+    ) -> List[str]:
+        """
+        Retrieve the most relevant document chunks of a workflow for a query.
+        BM25 and (when an embedding is available) vector rankings are fused with reciprocal
+        rank fusion; the result is trimmed to fit the context token budget.
+        """
+        top_k = top_k or settings.knowledge_base_top_k
+        max_tokens = max_tokens or settings.knowledge_base_max_tokens
+        
+        results = self._hybrid_search(query, query_embedding, [workflow_id], {"workflow_id": workflow_id}, top_k)
+        documents = [result["content"] for result in results]
+        if not documents:
+            # Nothing matched lexically and no embedding: fall back to the opening chunks
+            fallback = self._get_or_create_collection().get(
+                where={"workflow_id": workflow_id},
+                limit=top_k,
+                include=["documents"]
+            )
+            documents = fallback.get("documents") or []
+        
+        return self._apply_token_budget(documents, max_tokens)
+
+    async def search_documents_hybrid(
+        self,
+        query: str,
+        user_id: str,
+        workflow_id: Optional[str] = None,
+        limit: int = 5,
+        embedding_model: str = "all-MiniLM-L6-v2"
+    ) -> List[Dict[str, Any]]:
+        """Search a user's documents (optionally one workflow's) with fused BM25 and vector rankings"""
+        if workflow_id:
+            workflow_ids = [workflow_id]
+            vector_where = {"$and": [{"workflow_id": workflow_id}, {"user_id": user_id}]}
+        else:
+            workflow_ids = []
+            if self.db:
+                result = await self.db.execute(select(Workflow.id).filter(Workflow.user_id == user_id))
+                workflow_ids = [str(workflow_id) for workflow_id in result.scalars().all()]
+            vector_where = {"user_id": user_id}
+        
+        query_embedding = None
+        try:
+            api_key = None
+            if self.ai_service.embeddings_require_api_key(embedding_model) and self.api_key_service:
+                provider = "openai" if embedding_model.startswith("text-embedding") else "huggingface"
+                api_key = await self.api_key_service.get_decrypted_api_key(user_id, provider)
+            if api_key or not self.ai_service.embeddings_require_api_key(embedding_model):
+                query_embedding = await self.ai_service.generate_embeddings(query, model=embedding_model, api_key=api_key)
+        except Exception as e:
+            print(f"Query embedding failed, searching lexically only: {str(e)}")
+        
+        results = self._hybrid_search(query, query_embedding, workflow_ids, vector_where, limit, user_id=user_id)
+        for result in results:
+            if len(result["content"]) > 500:
+                result["content"] = result["content"][:500] + "..."
+        return results
+
+    def _hybrid_search(
+        self,
+        query: str,
+        query_embedding: Optional[list],
+        workflow_ids: List[str],
+        vector_where: Dict[str, Any],
+        limit: int,
+        user_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Fuse the vector ranking and the per-workflow BM25 rankings of chunks with RRF.
+        With user_id, BM25 hits on chunks of other users are dropped (the BM25 index is per workflow only).
+        """
+        collection = self._get_or_create_collection()
+        candidates = limit * settings.retrieval_candidate_multiplier
+        rankings = []
+        records: Dict[str, Dict[str, Any]] = {}
+        
+        if query_embedding:
+            try:
+                vector_results = collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=candidates,
+                    where=vector_where,
+                    include=["documents", "metadatas", "distances"]
+                )
+                ids = vector_results["ids"][0] if vector_results["ids"] else []
+                for i, chunk_id in enumerate(ids):
+                    records[chunk_id] = {
+                        "document_id": chunk_id,
+                        "content": vector_results["documents"][0][i] or "",
+                        "similarity": 1 - vector_results["distances"][0][i],
+                        "metadata": vector_results["metadatas"][0][i] or {}
+                    }
+                rankings.append(ids)
+            except Exception as e:
+                print(f"Vector query failed (possibly a dimension mismatch), using BM25 only: {e}")
+        
+        lexical_hits = []
+        for workflow_id in workflow_ids:
+            lexical_hits.extend(lexical_index.search(workflow_id, query, candidates))
+        lexical_hits.sort(key=lambda hit: hit[1], reverse=True)
+        rankings.append([chunk_id for chunk_id, _ in lexical_hits[:candidates]])
+        
+        fused = reciprocal_rank_fusion(rankings)[:limit]
+        missing = [chunk_id for chunk_id, _ in fused if chunk_id not in records]
+        if missing:
+            fetched = collection.get(ids=missing, include=["documents", "metadatas"])
+            for i, chunk_id in enumerate(fetched.get("ids") or []):
+                metadata = fetched["metadatas"][i] or {}
+                if user_id is not None and metadata.get("user_id") != user_id:
+                    continue
+                records[chunk_id] = {
+                    "document_id": chunk_id,
+                    "content": fetched["documents"][i] or "",
+                    "similarity": None,
+                    "metadata": metadata
+                }
+        
+        results = []
+        for chunk_id, score in fused:
+            if chunk_id in records:
+                results.append({**records[chunk_id], "score": score})
+        return results
+
+    async def remove_documents(self, documents: List[Document]):
+        """Delete document records with their chunks, and release their blobs"""
+        for document in documents:
+            self.delete_document_chunks(document)
+        if self.db:
+            for document in documents:
+                await self.db.delete(document)
+            await self.db.commit()
+        await blob_store.release(document.content_hash for document in documents)
+
+    async def remove_workflow_documents(self, workflow_id: str):
+        """Delete a workflow's document records, releasing their blobs"""
+        if not self.db:
+            return
+        result = await self.db.execute(select(Document).filter(Document.workflow_id == workflow_id))
+        await self.remove_documents(result.scalars().all())
+
+    def delete_document_chunks(self, document: Document):
+        """Remove one document's chunks from ChromaDB and the BM25 index"""
         try:
-            doc = fitz.open(stream=content, filetype="pdf")
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            doc.close()
-            return text
+            collection = self._get_or_create_collection()
+            ids = collection.get(where={"doc_id": str(document.id)}, include=[]).get("ids") or []
+            if not ids:
+                return
+            collection.delete(ids=ids)
+            if document.workflow_id:
+                lexical_index.remove(str(document.workflow_id), ids)
         except Exception as e:
-            raise ValueError(f"Failed to extract PDF text: {str(e)}")
+            print(f"Failed to delete chunks of document {document.id}: {str(e)}")
 
-    def _get_or_create_collection(self, force_recreate=False):
-        """Get or create ChromaDB collection with proper embedding configuration"""
+    def delete_workflow_documents(self, workflow_id: str):
+        """Remove a workflow's chunks from ChromaDB and the BM25 index"""
         try:
-            if force_recreate:
-                # Delete existing collection if it exists
-                try:
-                    self.chroma_client.delete_collection(self.collection_name)
-                    print(f"Deleted existing collection: {self.collection_name}")
-                except:
-                    pass
-            
-            # Try to get existing collection first
-            collection = self.chroma_client.get_collection(self.collection_name)
-            print(f"Using existing collection: {self.collection_name}")
-            return collection
-        except:
-            # Create new collection - let ChromaDB use its default embedding function
-            # This will use all-MiniLM-L6-v2 which produces 384-dimensional embeddings
-            print(f"Creating new collection: {self.collection_name}")
-            return self.chroma_client.create_collection(self.collection_name)
+            self._get_or_create_collection().delete(where={"workflow_id": workflow_id})
+        except Exception as e:
+            print(f"Failed to delete chunks of workflow {workflow_id}: {str(e)}")
+        lexical_index.drop(workflow_id)
+
+    def _apply_token_budget(self, documents: List[str], max_tokens: int) -> List[str]:
+        """Keep chunks in rank order until the (approximate) token budget is used up"""
+        budget_chars = max_tokens * CHARS_PER_TOKEN
+        selected = []
+        used = 0
+        for document in documents:
+            if used + len(document) > budget_chars:
+                remaining = budget_chars - used
+                if not selected and remaining > 0:
+                    selected.append(document[:remaining])
+                break
+            selected.append(document)
+            used += len(document)
+        return selected
+
+    def _get_or_create_collection(self, force_recreate=False):
+        """Get the shared ChromaDB collection, recreating it when requested"""
+        return vector_store.get_collection(self.collection_name, force_recreate=force_recreate)
 
     def _is_valid_file_type(self, filename: str) -> bool:
         """Check if file type is allowed"""
@@ -553,11 +784,12 @@ class DocumentService:
         file_ext = os.path.splitext(filename)[1].lower()
         return file_ext in settings.allowed_file_types
 
-    def get_user_documents(self, user_id: str, skip: int = 0, limit: int = 100) -> List[Document]:
+    async def get_user_documents(self, user_id: str, skip: int = 0, limit: int = 100) -> List[Document]:
         """Get all documents for a user"""
         if not self.db:
             return []
         
-        return self.db.query(Document).filter(
+        result = await self.db.execute(select(Document).filter(
             Document.user_id == user_id
-        ).offset(skip).limit(limit).all()
+        ).offset(skip).limit(limit))
+        return result.scalars().all()
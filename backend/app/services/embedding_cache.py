@@ -0,0 +1,182 @@
+import os
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per statement
+_SQLITE_BATCH = 500
+
+# (provider:model, vector dimension, sha256 of the text)
+CacheKey = Tuple[str, int, str]
+
+
+def text_hash(text: str) -> str:
+    """Content address of a text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Embedding cache keyed by (provider, model, vector dimension, sha256(text)).
+    An in-memory LRU sits in front of an SQLite table of float32 vectors, so repeated
+    queries and re-uploaded documents are not embedded again, even after a restart.
+    The same model name can be served by different providers (the local ONNX model or the
+    HuggingFace API, whose fallback models differ in dimension), so lookups only return
+    vectors of the dimension that provider and model last produced.
+    """
+
+    def __init__(self):
+        self._memory: "OrderedDict[CacheKey, list]" = OrderedDict()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._disk_lock = threading.Lock()
+        # provider:model -> dimension of its most recently cached vectors
+        self._dimensions: Dict[str, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return settings.embedding_cache_enabled
+
+    async def get_many(self, provider: str, model: str, texts: List[str]) -> List[Optional[list]]:
+        """Look up vectors for texts, memory first and then disk; None marks a miss"""
+        namespace = f"{provider}:{model}"
+        dimension = await self._current_dimension(namespace)
+        if dimension is None:
+            # Nothing cached for this provider and model yet
+            metrics.track_embedding_cache_miss(len(texts))
+            return [None] * len(texts)
+
+        keys = [(namespace, dimension, text_hash(text)) for text in texts]
+        vectors: List[Optional[list]] = [self._memory_get(key) for key in keys]
+        metrics.track_embedding_cache_hit("memory", sum(1 for vector in vectors if vector is not None))
+
+        missing = {keys[i][2] for i, vector in enumerate(vectors) if vector is None}
+        if missing and settings.embedding_cache_path:
+            found = await asyncio.to_thread(self._disk_get, namespace, dimension, list(missing))
+            for i, key in enumerate(keys):
+                if vectors[i] is None and key[2] in found:
+                    vectors[i] = found[key[2]]
+                    self._memory_put(key, vectors[i])
+            metrics.track_embedding_cache_hit("disk", sum(1 for i, key in enumerate(keys) if key[2] in found))
+
+        metrics.track_embedding_cache_miss(sum(1 for vector in vectors if vector is None))
+        return vectors
+
+    async def put_many(self, provider: str, model: str, texts: List[str], vectors: List[Optional[list]]):
+        """Store freshly generated vectors in both tiers (failed ones are skipped)"""
+        namespace = f"{provider}:{model}"
+        items: Dict[Tuple[int, str], list] = {}
+        for text, vector in zip(texts, vectors):
+            if vector:
+                key = (namespace, len(vector), text_hash(text))
+                self._memory_put(key, vector)
+                items[key[1:]] = vector
+                self._dimensions[namespace] = len(vector)
+        if items and settings.embedding_cache_path:
+            await asyncio.to_thread(self._disk_put, namespace, items)
+
+    async def _current_dimension(self, namespace: str) -> Optional[int]:
+        dimension = self._dimensions.get(namespace)
+        if dimension is None and settings.embedding_cache_path:
+            # After a restart: the dimension of the newest vector on disk
+            dimension = await asyncio.to_thread(self._disk_latest_dimension, namespace)
+            if dimension is not None:
+                self._dimensions[namespace] = dimension
+        return dimension
+
+    def _memory_get(self, key: CacheKey) -> Optional[list]:
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+        return vector
+
+    def _memory_put(self, key: CacheKey, vector: list):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > settings.embedding_cache_memory_size:
+            self._memory.popitem(last=False)
+
+    def _get_connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(settings.embedding_cache_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(settings.embedding_cache_path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            # Superseded by embedding_vectors: its keys did not record the provider or dimension
+            connection.execute("DROP TABLE IF EXISTS embeddings")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_vectors ("
+                "namespace TEXT NOT NULL, dimension INTEGER NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (namespace, dimension, text_hash))"
+            )
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def _disk_get(self, namespace: str, dimension: int, hashes: List[str]) -> Dict[str, list]:
+        found = {}
+        try:
+            with self._disk_lock:
+                connection = self._get_connection()
+                for start in range(0, len(hashes), _SQLITE_BATCH):
+                    batch = hashes[start:start + _SQLITE_BATCH]
+                    rows = connection.execute(
+                        f"SELECT text_hash, vector FROM embedding_vectors WHERE namespace = ? AND dimension = ? "
+                        f"AND text_hash IN ({','.join('?' * len(batch))})",
+                        [namespace, dimension, *batch]
+                    ).fetchall()
+                    for hash_value, blob in rows:
+                        found[hash_value] = array("f", blob).tolist()
+        except sqlite3.Error as e:
+            logger.error(f"Embedding cache read failed: {e}")
+        return found
+
+    def _disk_latest_dimension(self, namespace: str) -> Optional[int]:
+        try:
+            with self._disk_lock:
+                # INSERT OR REPLACE gives rewritten rows a new rowid, so the highest rowid is the newest
+                row = self._get_connection().execute(
+                    "SELECT dimension FROM embedding_vectors WHERE namespace = ? ORDER BY rowid DESC LIMIT 1",
+                    [namespace]
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Embedding cache read failed: {e}")
+            return None
+        return row[0] if row else None
+
+    def _disk_put(self, namespace: str, items: Dict[Tuple[int, str], list]):
+        try:
+            with self._disk_lock:
+                connection = self._get_connection()
+                connection.executemany(
+                    "INSERT OR REPLACE INTO embedding_vectors (namespace, dimension, text_hash, vector) VALUES (?, ?, ?, ?)",
+                    [
+                        (namespace, dimension, hash_value, array("f", vector).tobytes())
+                        for (dimension, hash_value), vector in items.items()
+                    ]
+                )
+                connection.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Embedding cache write failed: {e}")
+
+    def close(self):
+        """Close the on-disk tier"""
+        with self._disk_lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+# Global embedding cache instance
+embedding_cache = EmbeddingCache()
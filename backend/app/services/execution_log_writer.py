@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+
+from app.core.config import settings
+from app.core.database import async_engine
+from app.models.document import ExecutionLog
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutionLogWriter:
+    """
+    Background writer for execution log rows.
+    Rows are queued and written with multi-row inserts once a batch fills up or the flush
+    interval passes. A full queue makes producers wait (backpressure) instead of growing
+    without bound; whatever is queued is flushed on shutdown.
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the writer task (called once at startup)"""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue(maxsize=settings.execution_log_queue_size)
+            self._task = asyncio.create_task(self._run(), name="execution-log-writer")
+            logger.info("Execution log writer started")
+
+    async def log(self, execution_id: str, event: str, timestamp=None):
+        """Queue one log row; only waits when the queue is full"""
+        row = {
+            "id": uuid.uuid4(),
+            "execution_id": execution_id,
+            "event": event,
+            "timestamp": timestamp or datetime.now(timezone.utc),
+        }
+        if self._queue is None:
+            # Writer not running (e.g. scripts and tests): write through
+            await self._write([row])
+            return
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            metrics.track_execution_log_backpressure()
+            await self._queue.put(row)
+        metrics.update_execution_log_queue_depth(self._queue.qsize())
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = await self._next_batch()
+            metrics.update_execution_log_queue_depth(self._queue.qsize())
+            if batch:
+                await self._write(batch)
+
+    async def _next_batch(self) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Wait for the first row, then collect more until the batch is full or the interval passes.
+        Returns the batch and whether the shutdown sentinel was reached.
+        """
+        first = await self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + settings.execution_log_flush_interval
+        while len(batch) < settings.execution_log_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                row = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if row is None:
+                return batch, True
+            batch.append(row)
+        return batch, False
+
+    async def _write(self, rows: List[Dict[str, Any]]):
+        start = time.perf_counter()
+        try:
+            await self._insert(rows)
+            metrics.track_execution_log_flush("success", len(rows), time.perf_counter() - start)
+            return
+        except Exception as e:
+            if len(rows) == 1:
+                metrics.track_execution_log_flush("failed", 1, time.perf_counter() - start)
+                logger.error(f"Failed to log to database: {e}")
+                return
+            logger.warning(f"Batch insert of {len(rows)} execution log rows failed, retrying row by row: {e}")
+        
+        # One bad row (e.g. an unknown execution id) must not drop the whole batch
+        for row in rows:
+            await self._write([row])
+
+    async def _insert(self, rows: List[Dict[str, Any]]):
+        async with async_engine.begin() as connection:
+            await connection.execute(insert(ExecutionLog), rows)
+
+    async def shutdown(self):
+        """Flush queued rows and stop the writer"""
+        if self._task is None:
+            return
+        # The sentinel queues behind every pending row, so they are all written first
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        self._queue = None
+        logger.info("Execution log writer stopped")
+
+
+# Global execution log writer instance
+execution_log_writer = ExecutionLogWriter()
@@ -0,0 +1,282 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, List, Optional
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.workflow import Workflow, WorkflowExecution
+from app.services.execution_scheduler import execution_scheduler, ExecutionQueueFullError
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ClaimHandler = Callable[[WorkflowExecution, Workflow], Awaitable[None]]
+
+
+class ExecutionQueue:
+    """
+    Durable queue of async workflow runs, kept in the workflow_executions table.
+    Submitted runs are "pending" rows. Workers (any number of processes) claim them with
+    SELECT ... FOR UPDATE SKIP LOCKED and hold a lease on every run they execute, renewed
+    by a heartbeat. Runs whose lease expires - their process crashed or was killed - are
+    re-queued, or failed once they have used up their attempts.
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handler: Optional[ClaimHandler] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def lease_expiry(self) -> datetime:
+        return datetime.now(timezone.utc) + timedelta(seconds=settings.execution_lease_duration)
+
+    async def check_admission(self, db: AsyncSession, user_id: str):
+        """Raise ExecutionQueueFullError when the pending runs, overall or for this user, hit their limit"""
+        result = await db.execute(
+            select(
+                func.count(),
+                func.count().filter(WorkflowExecution.user_id == uuid.UUID(str(user_id)))
+            ).where(WorkflowExecution.status == "pending")
+        )
+        pending, user_pending = result.one()
+        if user_pending >= settings.execution_user_queue_size:
+            metrics.track_execution_rejection("user_queue_full")
+            raise ExecutionQueueFullError("Too many workflow runs queued for this user", "user_queue_full")
+        if pending >= settings.execution_queue_size:
+            metrics.track_execution_rejection("queue_full")
+            raise ExecutionQueueFullError("Workflow execution queue is full", "queue_full")
+
+    def notify(self):
+        """Wake this process's worker, e.g. after a run was queued or a slot freed up"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self, handler: ClaimHandler):
+        """Recover orphaned runs, then start the lease heartbeat and (if enabled) the worker loop"""
+        self._handler = handler
+        self._wakeup = asyncio.Event()
+        try:
+            await self.recover_orphaned()
+        except Exception as e:
+            logger.error(f"Startup sweep of orphaned executions failed: {e}")
+        self._tasks = [asyncio.create_task(self._heartbeat_loop(), name="execution-lease-heartbeat")]
+        if settings.execution_worker_enabled:
+            self._tasks.append(asyncio.create_task(self._worker_loop(), name="execution-queue-worker"))
+        logger.info(f"Execution queue started as worker {self.worker_id}")
+
+    async def claim(self, limit: int) -> List[WorkflowExecution]:
+        """
+        Atomically take up to limit pending runs, oldest first, and lease them to this worker.
+        No user gets more than execution_max_concurrent_per_user runs executing: the rest of a
+        user's backlog stays in the table, where other workers (or a later claim) see it, and
+        one busy user does not take the slots of everyone else.
+        """
+        if limit <= 0:
+            return []
+        running = (
+            select(WorkflowExecution.user_id, func.count().label("running"))
+            .where(WorkflowExecution.status == "running")
+            .group_by(WorkflowExecution.user_id)
+            .subquery()
+        )
+        ranked = (
+            select(
+                WorkflowExecution.id,
+                func.row_number().over(
+                    partition_by=WorkflowExecution.user_id,
+                    order_by=WorkflowExecution.started_at
+                ).label("position"),
+                func.coalesce(running.c.running, 0).label("running")
+            )
+            .outerjoin(running, running.c.user_id == WorkflowExecution.user_id)
+            .where(WorkflowExecution.status == "pending")
+            .subquery()
+        )
+        claimable = select(ranked.c.id).where(
+            ranked.c.running + ranked.c.position <= settings.execution_max_concurrent_per_user
+        )
+        async with AsyncSessionLocal() as db:
+            # Ranked in a subquery: FOR UPDATE cannot be combined with window functions
+            result = await db.execute(
+                select(WorkflowExecution)
+                .where(WorkflowExecution.status == "pending", WorkflowExecution.id.in_(claimable))
+                .order_by(WorkflowExecution.started_at)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+            executions = result.scalars().all()
+            for execution in executions:
+                execution.status = "running"
+                execution.attempts = (execution.attempts or 0) + 1
+                execution.lease_owner = self.worker_id
+                execution.lease_expires_at = self.lease_expiry()
+            await db.commit()
+        return executions
+
+    async def _worker_loop(self):
+        while True:
+            # Cleared before claiming so a notify() that arrives meanwhile is not lost
+            self._wakeup.clear()
+            claimed = 0
+            try:
+                executions = await self.claim(execution_scheduler.free_slots())
+                claimed = len(executions)
+                for execution in executions:
+                    await self._start_claimed(execution)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Claiming queued executions failed: {e}")
+            if claimed:
+                continue
+            # Idle: poll again later, or as soon as work is queued or a slot frees up here
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.execution_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _start_claimed(self, execution: WorkflowExecution):
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(Workflow).filter(Workflow.id == execution.workflow_id))
+            workflow = result.scalars().first()
+        if workflow is None:
+            await self.finish(str(execution.id), "failed", error="Workflow no longer exists")
+            return
+        await self._handler(execution, workflow)
+
+    async def finish(self, execution_id: str, status: str, result=None, error: str = None) -> bool:
+        """
+        Record the outcome of a run and release its lease.
+        Returns False when another worker holds the lease (this one lost it), leaving the row alone.
+        """
+        async with AsyncSessionLocal() as db:
+            query = await db.execute(select(WorkflowExecution).filter(WorkflowExecution.id == uuid.UUID(execution_id)))
+            execution = query.scalars().first()
+            if execution is None:
+                return False
+            if execution.lease_owner not in (None, self.worker_id):
+                logger.warning(f"Execution {execution_id} is leased by {execution.lease_owner}, not recording {status}")
+                return False
+            execution.status = status
+            if result is not None:
+                execution.result = result
+            if error:
+                execution.error_message = error
+            if status in ("completed", "failed", "cancelled"):
+                execution.completed_at = datetime.now(timezone.utc)
+                execution.lease_owner = None
+                execution.lease_expires_at = None
+            await db.commit()
+        return True
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(settings.execution_heartbeat_interval)
+            try:
+                await self.renew_leases()
+                await self.recover_orphaned()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Execution lease heartbeat failed: {e}")
+
+    async def renew_leases(self):
+        """Extend the lease of every run this worker is executing, in one statement"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(WorkflowExecution)
+                .where(
+                    WorkflowExecution.lease_owner == self.worker_id,
+                    WorkflowExecution.status == "running"
+                )
+                .values(lease_expires_at=self.lease_expiry())
+            )
+            await db.commit()
+
+    async def recover_orphaned(self):
+        """
+        Re-queue or fail runs left "running" by a worker that stopped renewing its lease.
+        Rows without any lease predate the queue; they are orphaned once older than the execution timeout.
+        """
+        now = datetime.now(timezone.utc)
+        requeued = failed = 0
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(WorkflowExecution)
+                .where(
+                    WorkflowExecution.status == "running",
+                    or_(
+                        WorkflowExecution.lease_expires_at < now,
+                        and_(
+                            WorkflowExecution.lease_expires_at.is_(None),
+                            WorkflowExecution.started_at < now - timedelta(seconds=settings.execution_timeout)
+                        )
+                    )
+                )
+                .with_for_update(skip_locked=True)
+            )
+            for execution in result.scalars().all():
+                execution.lease_owner = None
+                execution.lease_expires_at = None
+                # Synchronous runs have no one left to answer; queued runs are retried a limited number of times
+                if execution.mode == "async" and (execution.attempts or 0) < settings.execution_max_attempts:
+                    execution.status = "pending"
+                    requeued += 1
+                else:
+                    execution.status = "failed"
+                    execution.error_message = "Execution was interrupted: its worker stopped before finishing"
+                    execution.completed_at = now
+                    failed += 1
+            await db.commit()
+
+        if requeued or failed:
+            logger.warning(f"Recovered orphaned executions: {requeued} re-queued, {failed} failed")
+            metrics.track_execution_recovery("requeued", requeued)
+            metrics.track_execution_recovery("failed", failed)
+            if requeued:
+                self.notify()
+
+    async def shutdown(self, running: List[asyncio.Future]):
+        """Stop claiming, interrupt this worker's async runs and hand them back to the queue"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        for future in running:
+            future.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(WorkflowExecution)
+                    .where(
+                        WorkflowExecution.lease_owner == self.worker_id,
+                        WorkflowExecution.status == "running",
+                        WorkflowExecution.mode == "async"
+                    )
+                    # An interrupted shutdown does not count as a failed attempt
+                    .values(
+                        status="pending",
+                        attempts=WorkflowExecution.attempts - 1,
+                        lease_owner=None,
+                        lease_expires_at=None
+                    )
+                )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Failed to release execution leases: {e}")
+        logger.info("Execution queue stopped")
+
+
+# Global execution queue instance
+execution_queue = ExecutionQueue()
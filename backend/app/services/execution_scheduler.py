@@ -0,0 +1,161 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from app.core.config import settings
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutionQueueFullError(Exception):
+    """Raised when a workflow run cannot be admitted because the queues are full"""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class _Job:
+    def __init__(self, job_id: str, user_id: str, run: Callable[[], Awaitable[Any]], future: asyncio.Future):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.run = run
+        self.future = future
+        self.enqueued_at = asyncio.get_running_loop().time()
+        self.task: Optional[asyncio.Task] = None
+
+
+class ExecutionScheduler:
+    """
+    Admission control for workflow runs.
+    At most execution_max_concurrent runs execute at once, and at most
+    execution_max_concurrent_per_user of them belong to one user. Runs waiting for a slot
+    sit in per-user queues that are served round-robin, so one busy user cannot starve the
+    others. Submissions beyond the queue limits are rejected instead of piling up in memory.
+    """
+
+    def __init__(self):
+        # user_id -> waiting jobs; the order of users is the round-robin order
+        self._queues: "OrderedDict[str, Deque[_Job]]" = OrderedDict()
+        self._jobs: Dict[str, _Job] = {}
+        self._queued = 0
+        self._running = 0
+        self._running_by_user: Dict[str, int] = {}
+
+    def check_admission(self, user_id: str):
+        """Raise ExecutionQueueFullError if a run for this user would be rejected right now"""
+        user_queue = self._queues.get(user_id)
+        if not user_queue and self._can_start(user_id):
+            return
+        if user_queue and len(user_queue) >= settings.execution_user_queue_size:
+            metrics.track_execution_rejection("user_queue_full")
+            raise ExecutionQueueFullError("Too many workflow runs queued for this user", "user_queue_full")
+        if self._queued >= settings.execution_queue_size:
+            metrics.track_execution_rejection("queue_full")
+            raise ExecutionQueueFullError("Workflow execution queue is full", "queue_full")
+
+    def submit(self, user_id: str, job_id: str, run: Callable[[], Awaitable[Any]], admit: bool = True) -> asyncio.Future:
+        """
+        Queue a run; it starts as soon as the limits allow.
+        Returns a future for the run's result. Cancelling the future cancels the run.
+        admit=False skips the queue limits, for runs already admitted elsewhere (the durable queue).
+        """
+        if admit:
+            self.check_admission(user_id)
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(job_id, user_id, run, future)
+        self._jobs[job_id] = job
+        self._queues.setdefault(user_id, deque()).append(job)
+        self._queued += 1
+        future.add_done_callback(lambda f: f.cancelled() and self.cancel(job_id))
+        self._dispatch()
+        return future
+
+    def cancel(self, job_id: str) -> bool:
+        """Drop a queued run or cancel a running one"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            self._jobs.pop(job_id, None)
+            user_queue = self._queues.get(job.user_id)
+            if user_queue and job in user_queue:
+                user_queue.remove(job)
+                self._queued -= 1
+                if not user_queue:
+                    del self._queues[job.user_id]
+            if not job.future.done():
+                job.future.cancel()
+            self._update_metrics()
+        return True
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """1-based position of a queued run within its user's queue, None once it has started"""
+        job = self._jobs.get(job_id)
+        if job is None or job.task is not None:
+            return None
+        return list(self._queues[job.user_id]).index(job) + 1
+
+    def free_slots(self) -> int:
+        """Runs that could start now without waiting behind queued ones"""
+        return max(0, settings.execution_max_concurrent - self._running - self._queued)
+
+    def _can_start(self, user_id: str) -> bool:
+        return (
+            self._running < settings.execution_max_concurrent
+            and self._running_by_user.get(user_id, 0) < settings.execution_max_concurrent_per_user
+        )
+
+    def _next_job(self) -> Optional[_Job]:
+        for user_id, user_queue in self._queues.items():
+            if self._running_by_user.get(user_id, 0) < settings.execution_max_concurrent_per_user:
+                job = user_queue.popleft()
+                # The user goes to the back of the rotation (or leaves it when nothing else waits)
+                if user_queue:
+                    self._queues.move_to_end(user_id)
+                else:
+                    del self._queues[user_id]
+                return job
+        return None
+
+    def _dispatch(self):
+        while self._running < settings.execution_max_concurrent:
+            job = self._next_job()
+            if job is None:
+                break
+            self._queued -= 1
+            self._running += 1
+            self._running_by_user[job.user_id] = self._running_by_user.get(job.user_id, 0) + 1
+            metrics.track_execution_queue_wait(asyncio.get_running_loop().time() - job.enqueued_at)
+            job.task = asyncio.create_task(job.run(), name=f"workflow-execution-{job.job_id}")
+            job.task.add_done_callback(lambda task, job=job: self._finish(job, task))
+        self._update_metrics()
+
+    def _finish(self, job: _Job, task: asyncio.Task):
+        self._jobs.pop(job.job_id, None)
+        self._running -= 1
+        remaining = self._running_by_user.get(job.user_id, 1) - 1
+        if remaining:
+            self._running_by_user[job.user_id] = remaining
+        else:
+            self._running_by_user.pop(job.user_id, None)
+
+        if not job.future.done():
+            if task.cancelled():
+                job.future.cancel()
+            elif task.exception() is not None:
+                job.future.set_exception(task.exception())
+            else:
+                job.future.set_result(task.result())
+        self._dispatch()
+
+    def _update_metrics(self):
+        metrics.update_execution_queue(self._queued, self._running)
+
+
+# Global execution scheduler instance
+execution_scheduler = ExecutionScheduler()
@@ -1,21 +1,20 @@
 import asyncio
 import uuid
 from typing import Dict, Any, List, Optional, Callable
-from datetime import datetime
+from datetime import datetime, timezone
 import json
 import logging
 from enum import Enum
 from pydantic import BaseModel
 
-from app.services.ai_service import AIService
-from app.services.document_service import DocumentService
-from app.services.search_service import SearchService
+from app.services.workflow_service import WorkflowService, ExecutionTimeoutError
+from app.services.execution_scheduler import execution_scheduler
+from app.services.execution_queue import execution_queue
 from app.core.config import settings
-from app.utils.websocket_manager import WebSocketManager
-from app.models.workflow import WorkflowExecution
-from app.models.document import ExecutionLog
-from app.models.user import User
-from app.core.database import SessionLocal
+from app.utils.websocket_manager import websocket_manager
+from app.models.workflow import Workflow, WorkflowExecution
+from app.services.execution_log_writer import execution_log_writer
+from app.core.database import AsyncSessionLocal
 
 
 logger = logging.getLogger(__name__)
@@ -38,9 +37,12 @@ class ExecutionEvent(BaseModel):
 
 class ExecutionEngine:
     def __init__(self):
-        self.active_executions: Dict[str, asyncio.Task] = {}
+        # execution_id -> scheduler future of submitted runs (queued or executing)
+        self.active_executions: Dict[str, asyncio.Future] = {}
+        # execution_id -> live status of runs in this process (dropped when they finish)
+        self.execution_status: Dict[str, Dict[str, Any]] = {}
         self.event_handlers: Dict[str, List[Callable]] = {}
-        self.websocket_manager = WebSocketManager()
+        self.websocket_manager = websocket_manager
 
     def add_event_handler(self, execution_id: str, handler: Callable):
         if execution_id not in self.event_handlers:
@@ -60,12 +62,12 @@ class ExecutionEngine:
             except Exception as e:
                 logger.error(f"Error in event handler: {e}")
         # Also emit via websocket
-        await self.websocket_manager.send_to_execution(event.execution_id, event.dict())
+        await self.websocket_manager.send_to_execution(event.execution_id, event.model_dump(mode="json"))
 
     async def _log_to_database(self, event: ExecutionEvent):
+        # Queued for the batched background writer; only waits when its queue is full
         try:
-            db = SessionLocal()
-            log = ExecutionLog(
+            await execution_log_writer.log(
                 execution_id=event.execution_id,
                 event=json.dumps({
                     "type": event.event_type,
@@ -73,103 +75,147 @@ class ExecutionEngine:
                     "node_id": event.node_id,
                     "data": event.data,
                     "progress": event.progress
-                }),
+                }, default=str),
                 timestamp=event.timestamp
             )
-            db.add(log)
-            db.commit()
-            db.close()
         except Exception as e:
             logger.error(f"Failed to log to database: {e}")
 
     async def execute_workflow(self, workflow_data: Dict[str, Any], user_query: str, user_id: str) -> str:
-        execution_id = str(uuid.uuid4())
-        db = SessionLocal()
-        try:
+        """
+        Queue a workflow run and return its execution id right away.
+        The run is stored as a pending execution; a worker process claims it from the durable
+        queue and executes it. Follow it through /ws/execution/{id} or get_execution_status.
+        Raises ExecutionQueueFullError when the run cannot be admitted.
+        """
+        async with AsyncSessionLocal() as db:
+            await execution_queue.check_admission(db, str(user_id))
             execution = WorkflowExecution(
-                workflow_id=workflow_data.get('id'),
-                status=ExecutionStatus.PENDING,
-                input_data={"query": user_query, "workflow": workflow_data}
+                id=uuid.uuid4(),
+                workflow_id=workflow_data["id"],
+                user_id=user_id,
+                status=ExecutionStatus.PENDING.value,
+                mode="async",
+                attempts=0,
+                input_query=user_query,
+                started_at=datetime.now(timezone.utc)
             )
             db.add(execution)
-            db.commit()
-            db.refresh(execution)
-            execution_id = str(execution.id)
-        except Exception as e:
-            logger.error(f"Failed to create execution record: {e}")
-        finally:
-            db.close()
-        task = asyncio.create_task(self._execute_workflow_task(execution_id, workflow_data, user_query, user_id))
-        self.active_executions[execution_id] = task
-        return execution_id
+            await db.commit()
+        execution_queue.notify()
+        return str(execution.id)
+
+    async def run_claimed(self, execution: WorkflowExecution, workflow: Workflow):
+        """Execute a run this worker claimed from the durable queue"""
+        execution_id = str(execution.id)
+        self.execution_status[execution_id] = {
+            "execution_id": execution_id,
+            "workflow_id": str(workflow.id),
+            "user_id": str(execution.user_id),
+            "status": ExecutionStatus.RUNNING.value,
+            "attempt": execution.attempts,
+            "progress": 0.0,
+            "running_node_ids": [],
+            "completed_node_ids": [],
+            "started_at": execution.started_at.isoformat() if execution.started_at else None
+        }
+        workflow_data = {"id": workflow.id, "nodes": workflow.nodes, "edges": workflow.edges}
+        # Claims never exceed the free slots, so the scheduler's own queue limits do not apply
+        self.active_executions[execution_id] = execution_scheduler.submit(
+            str(execution.user_id),
+            execution_id,
+            lambda: self._execute_workflow_task(execution_id, workflow_data, execution.input_query, execution.user_id),
+            admit=False
+        )
+
+    def get_execution_status(self, execution_id: str) -> Optional[Dict[str, Any]]:
+        """Live status of a run in this process, or None once it has finished (the database has it then)"""
+        status_info = self.execution_status.get(execution_id)
+        if status_info is None:
+            return None
+        return {
+            **status_info,
+            "queue_position": execution_scheduler.queue_position(execution_id),
+            "running_node_ids": list(status_info["running_node_ids"]),
+            "completed_node_ids": list(status_info["completed_node_ids"])
+        }
+
+    async def _execute_workflow_task(self, execution_id: str, workflow_data: Dict[str, Any], user_query: str, user_id: str, timeout: float = None):
+        timeout = timeout or settings.execution_timeout
+        status_info = self.execution_status[execution_id]
+        total_nodes = max(len(workflow_data.get("nodes", [])), 1)
+
+        async def on_node_event(event_type: str, node: Dict[str, Any], data: Dict[str, Any]):
+            node_id = node["id"]
+            label = node.get("data", {}).get("label", node_id)
+            if event_type == "node_started":
+                status_info["running_node_ids"].append(node_id)
+                message = f"Executing node: {label}"
+            else:
+                if node_id in status_info["running_node_ids"]:
+                    status_info["running_node_ids"].remove(node_id)
+                if event_type == "node_completed":
+                    status_info["completed_node_ids"].append(node_id)
+                    message = f"Node completed: {label}"
+                else:
+                    message = f"Node failed: {data.get('error')}"
+            status_info["progress"] = len(status_info["completed_node_ids"]) / total_nodes * 0.9
+            await self.emit_event(ExecutionEvent(
+                execution_id=execution_id,
+                node_id=node_id,
+                event_type=event_type,
+                message=message,
+                timestamp=datetime.now(),
+                progress=status_info["progress"],
+                data={"node_type": node.get("type"), **data}
+            ))
 
-    async def _execute_workflow_task(self, execution_id: str, workflow_data: Dict[str, Any], user_query: str, user_id: str):
         try:
             await self.emit_event(ExecutionEvent(
                 execution_id=execution_id,
                 event_type="execution_started",
                 message="Workflow execution started",
                 timestamp=datetime.now(),
-                progress=0.0
+                progress=0.0,
+                data={"timeout": timeout}
             ))
-            await self._update_execution_status(execution_id, ExecutionStatus.RUNNING)
-            nodes = workflow_data.get('nodes', [])
-            edges = workflow_data.get('edges', [])
-            if not nodes:
-                raise Exception("No nodes found in workflow")
-            execution_order = self._build_execution_order(nodes, edges)
-            total_nodes = len(execution_order)
-            context = {"user_query": user_query, "user_id": user_id}
-            for i, node_id in enumerate(execution_order):
-                node = next((n for n in nodes if n['id'] == node_id), None)
-                if not node:
-                    continue
-                progress = (i + 1) / total_nodes
-                await self.emit_event(ExecutionEvent(
-                    execution_id=execution_id,
-                    node_id=node_id,
-                    event_type="node_started",
-                    message=f"Executing node: {node.get('data', {}).get('label', node_id)}",
-                    timestamp=datetime.now(),
-                    progress=progress * 0.9,
-                    data={"node_type": node.get('type'), "node_data": node.get('data')}
-                ))
-                try:
-                    result = await self._execute_node(node, context)
-                    context[f"node_{node_id}_result"] = result
-                    await self.emit_event(ExecutionEvent(
-                        execution_id=execution_id,
-                        node_id=node_id,
-                        event_type="node_completed",
-                        message=f"Node completed: {node.get('data', {}).get('label', node_id)}",
-                        timestamp=datetime.now(),
-                        progress=progress * 0.9,
-                        data={"result": result}
-                    ))
-                except Exception as e:
-                    error_msg = f"Node failed: {str(e)}"
-                    await self.emit_event(ExecutionEvent(
-                        execution_id=execution_id,
-                        node_id=node_id,
-                        event_type="node_error",
-                        message=error_msg,
-                        timestamp=datetime.now(),
-                        data={"error": str(e)}
-                    ))
-                    raise Exception(f"Node {node_id} failed: {str(e)}")
-                await asyncio.sleep(0.5)
+
+            # Nodes run through the same service as synchronous executions. It needs no session of
+            # this task's: API keys are read in one of its own, closed before any node runs
+            result = await WorkflowService().execute_workflow(
+                workflow_data.get("nodes", []),
+                workflow_data.get("edges", []),
+                user_query,
+                execution_id,
+                str(user_id),
+                str(workflow_data["id"]),
+                timeout=timeout,
+                on_node_event=on_node_event
+            )
+
+            await self._update_execution_status(execution_id, ExecutionStatus.COMPLETED, result=result)
             await self.emit_event(ExecutionEvent(
                 execution_id=execution_id,
                 event_type="execution_completed",
                 message="Workflow execution completed successfully",
                 timestamp=datetime.now(),
                 progress=1.0,
-                data={"final_context": context}
+                data={"result": result}
+            ))
+        except ExecutionTimeoutError as e:
+            logger.error(f"Execution {execution_id} timed out: {e}")
+            await self._update_execution_status(execution_id, ExecutionStatus.FAILED, error=str(e))
+            await self.emit_event(ExecutionEvent(
+                execution_id=execution_id,
+                event_type="execution_timeout",
+                message=str(e),
+                timestamp=datetime.now(),
+                data={"timeout": e.timeout, "node_ids": e.node_ids, "completed_node_ids": status_info["completed_node_ids"]}
             ))
-            await self._update_execution_status(execution_id, ExecutionStatus.COMPLETED, result=context)
         except Exception as e:
             error_msg = f"Execution failed: {str(e)}"
             logger.error(error_msg)
+            await self._update_execution_status(execution_id, ExecutionStatus.FAILED, error=str(e))
             await self.emit_event(ExecutionEvent(
                 execution_id=execution_id,
                 event_type="execution_error",
@@ -177,56 +223,24 @@ class ExecutionEngine:
                 timestamp=datetime.now(),
                 data={"error": str(e)}
             ))
-            await self._update_execution_status(execution_id, ExecutionStatus.FAILED, error=str(e))
         finally:
-            if execution_id in self.active_executions:
-                del self.active_executions[execution_id]
-
-    def _build_execution_order(self, nodes: List[Dict], edges: List[Dict]) -> List[str]:
-        return [node['id'] for node in nodes]
-
-    async def _execute_node(self, node: Dict[str, Any], context: Dict[str, Any]) -> Any:
-        node_type = node.get('type')
-        node_data = node.get('data', {})
-        if node_type == "userQuery":
-            return context.get('user_query', '')
-        elif node_type == "knowledgeBase":
-            doc_service = DocumentService()
-            return await doc_service.search_documents(context["user_query"], context["user_id"])
-        elif node_type == "webSearch":
-            search_service = SearchService()
-            provider = node_data.get('provider', 'brave')
-            return await search_service.search(context["user_query"], provider)
-        elif node_type == "llmEngine":
-            ai_service = AIService()
-            prompt = self._build_llm_prompt(context, node_data)
-            return await ai_service.generate_response(prompt)
-        elif node_type == "output":
-            return self._format_output(context, node_data)
-        else:
-            raise Exception(f"Unknown node type: {node_type}")
+            self.active_executions.pop(execution_id, None)
+            self.execution_status.pop(execution_id, None)
+            # A slot is free again
+            execution_queue.notify()
 
     async def _update_execution_status(self, execution_id: str, status: ExecutionStatus, result: Any = None, error: str = None):
         try:
-            db = SessionLocal()
-            execution = db.query(WorkflowExecution).filter(WorkflowExecution.id == execution_id).first()
-            if execution:
-                execution.status = status
-                if result:
-                    execution.result = result
-                if error:
-                    execution.error = error
-                if status in [ExecutionStatus.COMPLETED, ExecutionStatus.FAILED]:
-                    execution.completed_at = datetime.now()
-                db.commit()
-            db.close()
+            await execution_queue.finish(execution_id, status.value, result=result, error=error)
         except Exception as e:
             logger.error(f"Failed to update execution status: {e}")
 
     async def cancel_execution(self, execution_id: str):
         if execution_id in self.active_executions:
-            task = self.active_executions[execution_id]
-            task.cancel()
+            # Removes a queued run or cancels an executing one
+            execution_scheduler.cancel(execution_id)
+            self.active_executions.pop(execution_id, None)
+            self.execution_status.pop(execution_id, None)
             await self.emit_event(ExecutionEvent(
                 execution_id=execution_id,
                 event_type="execution_cancelled",
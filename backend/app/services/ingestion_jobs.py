@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.document import Document
+from app.services.document_service import DocumentService
+from app.services.ingestion_pipeline import ingestion_pipeline, IngestItem, STATUS_PROGRESS
+from app.utils.websocket_manager import ingestion_websocket_manager
+
+logger = logging.getLogger(__name__)
+
+# Statuses of documents a worker has claimed but not finished
+IN_PROGRESS_STATUSES = ("processing", "extracting", "chunking", "embedding", "storing")
+
+
+class IngestionJobManager:
+    """
+    Background document ingestion.
+    An upload request stores its files, records them as "queued" documents that share a job
+    id and returns that id right away. Workers pick jobs up and run their documents through
+    the ingestion pipeline, which keeps each document's status and progress current and
+    pushes it to /ws/ingestion/{job_id}. The documents table is the queue: a worker holds a
+    lease on the documents it claimed, renewed by a heartbeat, and every process periodically
+    re-queues documents whose lease expired (their process died) and picks up queued jobs.
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._queued: Set[str] = set()
+        self._running: Set[str] = set()
+
+    def lease_expiry(self) -> datetime:
+        return datetime.now(timezone.utc) + timedelta(seconds=settings.ingest_lease_duration)
+
+    async def start(self):
+        """Start the workers and the lease heartbeat, and resume unfinished jobs (called once at startup)"""
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"ingestion-worker-{index}")
+            for index in range(max(1, settings.ingest_job_workers))
+        ]
+        try:
+            await self.recover()
+        except Exception as e:
+            logger.error(f"Startup sweep of unfinished ingestion jobs failed: {e}")
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop(), name="ingestion-lease-heartbeat")
+        logger.info(f"Ingestion job workers started as {self.worker_id}")
+
+    def submit(self, job_id: str):
+        """Queue a job whose documents are already stored as "queued" rows"""
+        if job_id in self._queued:
+            return
+        if self._queue is None:
+            # Workers not running (e.g. scripts and tests): run the job right away
+            task = asyncio.create_task(self.run_job(job_id), name=f"ingestion-job-{job_id}")
+            self._workers.append(task)
+            task.add_done_callback(lambda task: task in self._workers and self._workers.remove(task))
+            return
+        self._queued.add(job_id)
+        self._queue.put_nowait(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                await self.run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ingestion job {job_id} failed: {e}")
+
+    async def run_job(self, job_id: str):
+        """Claim the job's queued documents and ingest them"""
+        self._running.add(job_id)
+        try:
+            async with AsyncSessionLocal() as db:
+                documents = await self._claim(db, job_id)
+                if not documents:
+                    return
+                items = [IngestItem.from_document(document) for document in documents]
+                outcome = await ingestion_pipeline.ingest(DocumentService(db), items, str(documents[0].user_id))
+            await ingestion_websocket_manager.send_to_execution(job_id, {
+                "job_id": job_id,
+                "event_type": "job_completed",
+                "stats": outcome["stats"],
+                "timestamp": datetime.utcnow().isoformat()
+            })
+        finally:
+            self._running.discard(job_id)
+
+    async def _claim(self, db: AsyncSession, job_id: str) -> List[Document]:
+        # Conditional update: another process that claimed a document first keeps it
+        result = await db.execute(
+            update(Document)
+            .where(Document.ingest_job_id == uuid.UUID(job_id), Document.status == "queued")
+            .values(
+                status="processing",
+                progress=STATUS_PROGRESS["processing"],
+                lease_owner=self.worker_id,
+                lease_expires_at=self.lease_expiry()
+            )
+            .returning(Document.id)
+        )
+        document_ids = result.scalars().all()
+        documents = []
+        if document_ids:
+            result = await db.execute(select(Document).where(Document.id.in_(document_ids)))
+            documents = result.scalars().all()
+        # Ends the transaction, so no connection is held while the job runs
+        await db.commit()
+        return documents
+
+    async def get_job(self, db: AsyncSession, job_id: str, workflow_id: str, user_id) -> Optional[Dict[str, Any]]:
+        """Status of a job and its documents, or None if the user has no such job for the workflow"""
+        result = await db.execute(select(Document).where(
+            Document.ingest_job_id == uuid.UUID(job_id),
+            Document.workflow_id == uuid.UUID(workflow_id),
+            Document.user_id == user_id
+        ))
+        documents = result.scalars().all()
+        if not documents:
+            return None
+        statuses = [document.status for document in documents]
+        if all(status == "failed" for status in statuses):
+            job_status = "failed"
+        elif all(status in ("completed", "failed") for status in statuses):
+            job_status = "completed"
+        elif all(status == "queued" for status in statuses):
+            job_status = "queued"
+        else:
+            job_status = "processing"
+        return {
+            "job_id": job_id,
+            "status": job_status,
+            # Failed documents are finished too
+            "progress": round(sum(
+                100 if document.status == "failed" else document.progress or 0 for document in documents
+            ) / len(documents)),
+            "documents": [
+                {
+                    "id": str(document.id),
+                    "filename": document.filename,
+                    "status": document.status,
+                    "progress": document.progress,
+                    "processed": document.processed,
+                    "error": document.error_message
+                }
+                for document in documents
+            ]
+        }
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(settings.ingest_heartbeat_interval)
+            try:
+                await self.renew_leases()
+                await self.recover()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ingestion lease heartbeat failed: {e}")
+
+    async def renew_leases(self):
+        """Extend the lease of every document this worker is processing, in one statement"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(Document)
+                .where(Document.lease_owner == self.worker_id, Document.status.in_(IN_PROGRESS_STATUSES))
+                .values(lease_expires_at=self.lease_expiry())
+            )
+            await db.commit()
+
+    async def recover(self):
+        """
+        Queue again the documents whose worker stopped mid-way - their lease expired, or, for
+        documents claimed without a lease, they made no progress for ingest_job_timeout seconds -
+        and pick up every job with documents left waiting.
+        """
+        now = datetime.now(timezone.utc)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(Document)
+                .where(
+                    Document.status.in_(IN_PROGRESS_STATUSES),
+                    or_(
+                        Document.lease_expires_at < now,
+                        and_(
+                            Document.lease_expires_at.is_(None),
+                            Document.updated_at < now - timedelta(seconds=settings.ingest_job_timeout)
+                        )
+                    )
+                )
+                .values(status="queued", progress=STATUS_PROGRESS["queued"], lease_owner=None, lease_expires_at=None)
+                .returning(Document.id)
+            )
+            requeued = len(result.scalars().all())
+            result = await db.execute(
+                select(Document.ingest_job_id)
+                .where(Document.status == "queued", Document.ingest_job_id.isnot(None))
+                .distinct()
+            )
+            job_ids = [str(job_id) for job_id in result.scalars().all()]
+            await db.commit()
+        job_ids = [job_id for job_id in job_ids if job_id not in self._queued and job_id not in self._running]
+        for job_id in job_ids:
+            self.submit(job_id)
+        if requeued:
+            logger.warning(f"Re-queued {requeued} documents of interrupted ingestion jobs")
+        if job_ids:
+            logger.info(f"Picked up {len(job_ids)} queued ingestion jobs")
+
+    async def shutdown(self):
+        """Stop the workers and hand the documents they were working on back to the queue"""
+        tasks = self._workers + ([self._heartbeat] if self._heartbeat else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._heartbeat = None
+        self._queue = None
+        self._queued.clear()
+
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(Document)
+                    .where(Document.lease_owner == self.worker_id, Document.status.in_(IN_PROGRESS_STATUSES))
+                    .values(status="queued", progress=STATUS_PROGRESS["queued"], lease_owner=None, lease_expires_at=None)
+                )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Failed to requeue interrupted ingestion jobs: {e}")
+        self._running.clear()
+        logger.info("Ingestion job workers stopped")
+
+
+# Global ingestion job manager instance
+ingestion_jobs = IngestionJobManager()
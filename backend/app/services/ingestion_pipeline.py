@@ -0,0 +1,290 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import UploadFile
+from sqlalchemy import update
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.document import Document
+from app.services.blob_store import blob_store
+from app.utils.metrics import metrics
+from app.utils.websocket_manager import ingestion_websocket_manager
+
+logger = logging.getLogger(__name__)
+
+# Document.progress reached when a document enters each ingestion status
+STATUS_PROGRESS = {
+    "queued": 0,
+    "processing": 5,
+    "extracting": 10,
+    "chunking": 40,
+    "embedding": 50,
+    "storing": 90,
+    "completed": 100
+}
+
+
+class IngestItem:
+    """One upload moving through the pipeline, with its per-file result"""
+
+    def __init__(self, filename: str, content_type: str, document: Optional[Document] = None):
+        self.document = document
+        self.extracted: Optional[Dict[str, Any]] = None
+        self.chunks: List[Dict[str, Any]] = []
+        self.embeddings: Optional[List[List[float]]] = None
+        self.started_at = time.perf_counter()
+        self.result: Dict[str, Any] = {
+            "filename": filename,
+            "content_type": content_type,
+            "status": "queued"
+        }
+
+    @classmethod
+    def from_document(cls, document: Document) -> "IngestItem":
+        item = cls(document.filename, document.content_type, document)
+        item.result.update({"document_id": str(document.id), "size": document.file_size})
+        return item
+
+
+class IngestionPipeline:
+    """
+    Concurrent ingestion of a batch of stored uploads.
+    Each document passes through four stages - extract, chunk, embed, store - connected by
+    bounded queues, so several documents are extracted at once while earlier ones are being
+    embedded and stored. A document that fails only fails itself. Every stage transition is
+    written to the document's status/progress and, for background jobs, pushed to the job's
+    WebSocket channel.
+    """
+
+    async def save_uploads(
+        self,
+        document_service,
+        files: List[UploadFile],
+        workflow_id: str,
+        user_id: str,
+        ingest_job_id=None
+    ) -> List[IngestItem]:
+        """
+        Stream uploads to disk, a few at a time, and record them as documents (one commit for the batch).
+        Content the workflow already has is not added again: such files are reported as duplicates.
+        """
+        semaphore = asyncio.Semaphore(max(1, settings.ingest_file_concurrency))
+
+        async def save(file: UploadFile):
+            async with semaphore:
+                await file.seek(0)
+                return await document_service.save_upload_file(file)
+
+        saved = await asyncio.gather(*(save(file) for file in files), return_exceptions=True)
+        items = []
+        uploads = []
+        new_documents: Dict[str, Document] = {}
+        duplicates: Dict[IngestItem, str] = {}
+        for file, outcome in zip(files, saved):
+            item = IngestItem(file.filename, file.content_type)
+            items.append(item)
+            if isinstance(outcome, Exception):
+                item.result.update({"status": "failed", "stage": "upload", "error": str(outcome)})
+                metrics.track_document_upload("failed")
+                continue
+            temp_path, file_size, file_hash = outcome
+            item.result.update({"size": file_size, "sha256": file_hash})
+            existing = await document_service.find_workflow_document(workflow_id, file_hash)
+            if existing is not None or file_hash in new_documents:
+                os.remove(temp_path)
+                item.result.update({"status": "duplicate", "message": f"{file.filename} is already in this workflow"})
+                if existing is not None:
+                    item.result["document_id"] = str(existing.id)
+                else:
+                    duplicates[item] = file_hash
+                metrics.track_document_dedup("duplicate")
+                continue
+            item.document = document_service.create_upload_document(
+                file, file_hash, file_size, workflow_id, user_id, ingest_job_id
+            )
+            new_documents[file_hash] = item.document
+            uploads.append((item.document, temp_path))
+
+        if uploads:
+            await document_service.add_upload_documents(uploads)
+        for item in items:
+            if item.document is not None:
+                item.result["document_id"] = str(item.document.id)
+        for item, file_hash in duplicates.items():
+            item.result["document_id"] = str(new_documents[file_hash].id)
+        return items
+
+    async def ingest(self, document_service, items: List[IngestItem], user_id: str) -> Dict[str, Any]:
+        """Run stored documents through the pipeline with the given DocumentService"""
+        start_time = time.perf_counter()
+        pending = [item for item in items if item.document is not None]
+        if pending:
+            await self._run_stages(document_service, pending, user_id)
+
+        for item in pending:
+            item.result["duration_seconds"] = round(time.perf_counter() - item.started_at, 3)
+            metrics.track_document_upload(item.result["status"])
+        stats = self._stats(items, time.perf_counter() - start_time)
+        logger.info(
+            f"Ingested {stats['succeeded']}/{stats['files']} files "
+            f"in {stats['duration_seconds']}s ({stats['files_per_second']} files/s)"
+        )
+        return {"files": [item.result for item in items], "stats": stats}
+
+    async def _run_stages(self, document_service, items: List[IngestItem], user_id: str):
+        # One model and key for the whole batch, resolved before any stage runs
+        embedding_model, api_key = await document_service.resolve_upload_embedding(user_id)
+
+        async def extract(item: IngestItem):
+            item.extracted = await document_service.extract_document_text(item.document)
+
+        async def chunk(item: IngestItem):
+            item.chunks = document_service.chunk_extracted(item.extracted)
+
+        async def embed(item: IngestItem):
+            item.embeddings = await document_service.embed_upload_chunks(
+                item.chunks, embedding_model, api_key, item.document.content_hash
+            )
+
+        async def store(item: IngestItem):
+            stored = await document_service.store_document_chunks(
+                item.document, item.extracted, item.chunks, item.embeddings, embedding_model
+            )
+            item.result.update(stored)
+            await self._set_status(item, "completed", processed=True)
+
+        uploads: asyncio.Queue = asyncio.Queue()
+        for item in items:
+            uploads.put_nowait(item)
+        uploads.put_nowait(None)
+        extracted = asyncio.Queue(maxsize=settings.ingest_queue_size)
+        chunked = asyncio.Queue(maxsize=settings.ingest_queue_size)
+        embedded = asyncio.Queue(maxsize=settings.ingest_queue_size)
+
+        await asyncio.gather(
+            self._stage(document_service, "extract", "extracting", extract, uploads, extracted, min(settings.ingest_file_concurrency, len(items))),
+            self._stage(document_service, "chunk", "chunking", chunk, extracted, chunked, 1),
+            self._stage(document_service, "embed", "embedding", embed, chunked, embedded, settings.ingest_embed_concurrency),
+            self._stage(document_service, "store", "storing", store, embedded, None, 1)
+        )
+
+    async def _stage(
+        self,
+        document_service,
+        name: str,
+        status: str,
+        step: Callable[[IngestItem], Awaitable[None]],
+        inbox: asyncio.Queue,
+        outbox: Optional[asyncio.Queue],
+        concurrency: int
+    ):
+        """Run step on every item from inbox with concurrency workers, passing successful items on"""
+        async def worker():
+            while True:
+                item = await inbox.get()
+                if item is None:
+                    # Leave the end marker for this stage's other workers
+                    inbox.put_nowait(None)
+                    return
+                step_start = time.perf_counter()
+                try:
+                    await self._set_status(item, status)
+                    await step(item)
+                except Exception as e:
+                    logger.warning(f"Ingestion of {item.document.filename} failed in the {name} stage: {e}")
+                    item.result.update({"stage": name, "error": str(e)})
+                    await self._set_status(item, "failed", error=str(e))
+                    await self._release_failed(document_service, item)
+                    continue
+                finally:
+                    metrics.track_ingest_stage(name, time.perf_counter() - step_start)
+                if outbox is not None:
+                    await outbox.put(item)
+
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+        if outbox is not None:
+            await outbox.put(None)
+
+    async def _release_failed(self, document_service, item: IngestItem):
+        """
+        Drop what a failed document holds - its chunks and its blob reference - keeping the row
+        to report the failure. A retried upload of the same file gets a new document.
+        """
+        document = item.document
+        document_service.delete_document_chunks(document)
+        try:
+            async with AsyncSessionLocal() as db:
+                # Clearing the hash marks the reference as released, so it is never released twice
+                result = await db.execute(
+                    update(Document)
+                    .where(Document.id == document.id, Document.content_hash.isnot(None))
+                    .values(content_hash=None)
+                    .returning(Document.id)
+                )
+                released = result.first() is not None
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Failed to release the content of failed document {document.id}: {e}")
+            return
+        if released:
+            await blob_store.release([document.content_hash])
+
+    async def _set_status(self, item: IngestItem, status: str, error: str = None, processed: bool = None):
+        """Record a document's ingestion status and push it to the job's WebSocket channel"""
+        document = item.document
+        item.result["status"] = "success" if status == "completed" else status
+        values = {"status": status, "error_message": error}
+        if status in STATUS_PROGRESS:
+            values["progress"] = STATUS_PROGRESS[status]
+        if processed is not None:
+            values["processed"] = processed
+        if status in ("completed", "failed"):
+            # Finished: the ingestion worker's lease on the document ends
+            values.update(lease_owner=None, lease_expires_at=None)
+        try:
+            # Stages run concurrently, so each update uses its own short session
+            async with AsyncSessionLocal() as db:
+                await db.execute(update(Document).where(Document.id == document.id).values(**values))
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Failed to record ingestion status of document {document.id}: {e}")
+
+        if document.ingest_job_id:
+            await ingestion_websocket_manager.send_to_execution(str(document.ingest_job_id), {
+                "job_id": str(document.ingest_job_id),
+                "document_id": str(document.id),
+                "filename": document.filename,
+                "event_type": "document_progress",
+                "status": status,
+                "progress": values.get("progress"),
+                "error": error,
+                "timestamp": datetime.utcnow().isoformat()
+            })
+
+    def _stats(self, items: List[IngestItem], duration: float) -> Dict[str, Any]:
+        succeeded = [item for item in items if item.result["status"] == "success"]
+        duplicates = sum(1 for item in items if item.result["status"] == "duplicate")
+        total_bytes = sum(item.result.get("size", 0) for item in succeeded)
+        total_chunks = sum(item.result.get("chunks_count", 0) for item in succeeded)
+        per_second = lambda amount: round(amount / duration, 2) if duration > 0 else 0.0
+        return {
+            "files": len(items),
+            "succeeded": len(succeeded),
+            "duplicates": duplicates,
+            "failed": len(items) - len(succeeded) - duplicates,
+            "bytes": total_bytes,
+            "chunks": total_chunks,
+            "duration_seconds": round(duration, 3),
+            "files_per_second": per_second(len(succeeded)),
+            "bytes_per_second": per_second(total_bytes),
+            "chunks_per_second": per_second(total_chunks)
+        }
+
+
+# Global ingestion pipeline instance
+ingestion_pipeline = IngestionPipeline()
@@ -0,0 +1,177 @@
+import re
+import math
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.vector_store import vector_store
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Standard Okapi BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens; single characters carry no signal and are dropped"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) > 1]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: int = None) -> List[Tuple[str, float]]:
+    """
+    Fuse several ranked id lists: score(id) = sum(1 / (k + rank)) over the lists containing it.
+    Returns (id, score) pairs, best first.
+    """
+    k = settings.retrieval_rrf_k if k is None else k
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class _Partition:
+    """Inverted index over the chunks of one workflow"""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.lengths: Dict[str, int] = {}
+        self.chunk_terms: Dict[str, List[str]] = {}
+        self.total_length = 0
+        # When the partition was last reconciled with ChromaDB
+        self.checked_at = time.monotonic()
+
+    def add(self, chunk_id: str, text: str):
+        self.remove(chunk_id)
+        counts = Counter(tokenize(text))
+        for term, count in counts.items():
+            self.postings[term][chunk_id] = count
+        length = sum(counts.values())
+        self.lengths[chunk_id] = length
+        self.chunk_terms[chunk_id] = list(counts)
+        self.total_length += length
+
+    def remove(self, chunk_id: str):
+        length = self.lengths.pop(chunk_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in self.chunk_terms.pop(chunk_id):
+            del self.postings[term][chunk_id]
+            if not self.postings[term]:
+                del self.postings[term]
+
+    def search(self, terms: List[str], limit: int) -> List[Tuple[str, float]]:
+        count = len(self.lengths)
+        if not count:
+            return []
+        average_length = self.total_length / count or 1.0
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(terms):
+            chunks = self.postings.get(term)
+            if not chunks:
+                continue
+            idf = math.log(1 + (count - len(chunks) + 0.5) / (len(chunks) + 0.5))
+            for chunk_id, frequency in chunks.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[chunk_id] / average_length)
+                scores[chunk_id] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+class LexicalIndex:
+    """
+    In-memory BM25 index over document chunks, partitioned by workflow_id.
+    ChromaDB remains the source of truth: a partition is loaded from it on first use and
+    then kept current by this process's ingest and delete paths, so chunks stored without
+    embeddings stay searchable. Other worker processes change the collection too, so a
+    partition older than retrieval_lexical_refresh_interval is reconciled with the
+    workflow's chunk ids in ChromaDB before it is searched.
+    """
+
+    def __init__(self):
+        self._partitions: Dict[str, _Partition] = {}
+        self._lock = threading.RLock()
+
+    def _load_partition(self, workflow_id: str) -> _Partition:
+        partition = self._partitions.get(workflow_id)
+        if partition is not None and not self._is_stale(partition):
+            return partition
+        with self._lock:
+            partition = self._partitions.get(workflow_id)
+            if partition is None:
+                partition = _Partition()
+                results = vector_store.get_collection().get(
+                    where={"workflow_id": workflow_id},
+                    include=["documents"]
+                )
+                for chunk_id, text in zip(results.get("ids") or [], results.get("documents") or []):
+                    partition.add(chunk_id, text or "")
+                self._partitions[workflow_id] = partition
+                logger.info(f"Loaded BM25 index for workflow {workflow_id}: {len(partition.lengths)} chunks")
+            elif self._is_stale(partition):
+                self._refresh(workflow_id, partition)
+        return partition
+
+    def _is_stale(self, partition: _Partition) -> bool:
+        return time.monotonic() - partition.checked_at >= settings.retrieval_lexical_refresh_interval
+
+    def _refresh(self, workflow_id: str, partition: _Partition):
+        """Bring a partition in line with ChromaDB; chunk ids are content-addressed, so comparing ids suffices"""
+        collection = vector_store.get_collection()
+        current = set(collection.get(where={"workflow_id": workflow_id}, include=[]).get("ids") or [])
+        removed = [chunk_id for chunk_id in partition.lengths if chunk_id not in current]
+        added = [chunk_id for chunk_id in current if chunk_id not in partition.lengths]
+        for chunk_id in removed:
+            partition.remove(chunk_id)
+        if added:
+            results = collection.get(ids=added, include=["documents"])
+            for chunk_id, text in zip(results.get("ids") or [], results.get("documents") or []):
+                partition.add(chunk_id, text or "")
+        partition.checked_at = time.monotonic()
+        if removed or added:
+            logger.info(f"Refreshed BM25 index for workflow {workflow_id}: +{len(added)} -{len(removed)} chunks")
+
+    def add(self, workflow_id: str, ids: List[str], documents: List[str]):
+        """Index new chunks; partitions not loaded yet pick them up from ChromaDB on first use"""
+        with self._lock:
+            partition = self._partitions.get(workflow_id)
+            if partition is None:
+                return
+            for chunk_id, text in zip(ids, documents):
+                partition.add(chunk_id, text)
+
+    def remove(self, workflow_id: str, ids: List[str]):
+        """Drop chunks from a workflow partition"""
+        with self._lock:
+            partition = self._partitions.get(workflow_id)
+            if partition is None:
+                return
+            for chunk_id in ids:
+                partition.remove(chunk_id)
+
+    def drop(self, workflow_id: Optional[str] = None):
+        """Forget one workflow partition, or all of them (e.g. after the collection is recreated)"""
+        with self._lock:
+            if workflow_id:
+                self._partitions.pop(workflow_id, None)
+            else:
+                self._partitions.clear()
+
+    def search(self, workflow_id: str, query: str, limit: int) -> List[Tuple[str, float]]:
+        """BM25-ranked (chunk_id, score) pairs of a workflow for a query"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        partition = self._load_partition(workflow_id)
+        with self._lock:
+            return partition.search(terms, limit)
+
+
+# Global lexical index instance
+lexical_index = LexicalIndex()
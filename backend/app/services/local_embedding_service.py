@@ -0,0 +1,122 @@
+import asyncio
+import importlib.util
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _load_onnx_minilm() -> Callable[[List[str]], List[list]]:
+    """all-MiniLM-L6-v2 exported to ONNX, as bundled with chromadb (downloaded once, then cached on disk)"""
+    from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+    embedding_function = ONNXMiniLM_L6_V2()
+    return lambda texts: [vector.tolist() for vector in embedding_function(texts)]
+
+
+def _load_sentence_transformer(model_name: str) -> Callable[[List[str]], List[list]]:
+    """Any sentence-transformers model, when the optional package is installed"""
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+    return lambda texts: model.encode(texts, convert_to_numpy=True).tolist()
+
+
+# Model name -> loader for models that can run in-process without network access
+LOCAL_EMBEDDING_MODELS: Dict[str, Callable[[], Callable[[List[str]], List[list]]]] = {
+    "all-MiniLM-L6-v2": _load_onnx_minilm,
+    # The same weights under their HuggingFace name
+    "sentence-transformers/all-MiniLM-L6-v2": _load_onnx_minilm,
+}
+
+# sentence-transformers is optional (not in requirements.txt); other sentence-transformers/* models
+# are only served locally when it is installed, and go to HuggingFace otherwise
+SENTENCE_TRANSFORMERS_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
+
+
+class LocalEmbeddingService:
+    """In-process CPU embedding models, loaded once and shared by every request"""
+
+    def __init__(self):
+        self._models: Dict[str, Callable[[List[str]], List[list]]] = {}
+        self._load_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._warned_unavailable = False
+
+    def supports(self, model: str) -> bool:
+        """Whether the model is served locally instead of by a remote provider"""
+        if not settings.local_embeddings_enabled:
+            return False
+        if model in LOCAL_EMBEDDING_MODELS:
+            return True
+        if not model.startswith("sentence-transformers/"):
+            return False
+        if not SENTENCE_TRANSFORMERS_AVAILABLE and not self._warned_unavailable:
+            self._warned_unavailable = True
+            logger.warning(
+                "sentence-transformers is not installed: sentence-transformers/* models other than "
+                "all-MiniLM-L6-v2 are embedded by HuggingFace instead of locally"
+            )
+        return SENTENCE_TRANSFORMERS_AVAILABLE
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # ONNX Runtime and torch release the GIL during inference, so threads run batches in parallel
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.local_embedding_workers,
+                thread_name_prefix="local-embeddings"
+            )
+        return self._executor
+
+    def _get_model(self, model: str) -> Callable[[List[str]], List[list]]:
+        encoder = self._models.get(model)
+        if encoder is None:
+            with self._load_lock:
+                encoder = self._models.get(model)
+                if encoder is None:
+                    logger.info(f"Loading local embedding model: {model}")
+                    loader = LOCAL_EMBEDDING_MODELS.get(model)
+                    encoder = loader() if loader else _load_sentence_transformer(model)
+                    self._models[model] = encoder
+        return encoder
+
+    def _embed_batch(self, texts: List[str], model: str) -> List[list]:
+        return self._get_model(model)(texts)
+
+    async def embed(self, texts: List[str], model: str) -> List[Optional[list]]:
+        """Embed texts in batches spread over the worker pool; returns vectors in input order"""
+        if not texts:
+            return []
+
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        batch_size = settings.local_embedding_batch_size
+        batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+
+        results = await asyncio.gather(
+            *(loop.run_in_executor(executor, self._embed_batch, batch, model) for batch in batches),
+            return_exceptions=True
+        )
+
+        embeddings = []
+        for batch, vectors in zip(batches, results):
+            if isinstance(vectors, Exception):
+                logger.error(f"Local embedding with {model} failed: {vectors}")
+                embeddings.extend([None] * len(batch))
+            else:
+                embeddings.extend(vectors)
+        return embeddings
+
+    def shutdown(self):
+        """Stop the worker pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Global local embedding service instance
+local_embeddings = LocalEmbeddingService()
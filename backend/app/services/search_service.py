@@ -1,8 +1,9 @@
-import httpx
 import re
 from typing import Dict, Any, List
 from datetime import datetime, timedelta
 
+from app.core.http_client import get_http_client
+
 
 class SearchService:
     def __init__(self):
@@ -167,41 +168,41 @@ class SearchService:
             return {"error": "Brave API key not provided in node data"}
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    "https://api.search.brave.com/res/v1/web/search",
-                    headers={
-                        "Accept": "application/json",
-                        "X-Subscription-Token": api_key
-                    },
-                    params={
-                        "q": query,
-                        "count": limit,
-                        "search_lang": "en",
-                        "country": "US"
-                    }
-                )
+            client = get_http_client("brave")
+            response = await client.get(
+                "https://api.search.brave.com/res/v1/web/search",
+                headers={
+                    "Accept": "application/json",
+                    "X-Subscription-Token": api_key
+                },
+                params={
+                    "q": query,
+                    "count": limit,
+                    "search_lang": "en",
+                    "country": "US"
+                }
+            )
+
+            if response.status_code == 200:
+                data = response.json()
+                results = []
 
-                if response.status_code == 200:
-                    data = response.json()
-                    results = []
-                    
-                    for result in data.get("web", {}).get("results", []):
-                        results.append({
-                            "title": result.get("title", ""),
-                            "url": result.get("url", ""),
-                            "description": result.get("description", ""),
-                            "snippet": result.get("snippet", "")
-                        })
+                for result in data.get("web", {}).get("results", []):
+                    results.append({
+                        "title": result.get("title", ""),
+                        "url": result.get("url", ""),
+                        "description": result.get("description", ""),
+                        "snippet": result.get("snippet", "")
+                    })
 
-                    return {
-                        "provider": "brave",
-                        "query": query,
-                        "results": results,
-                        "total_results": len(results)
-                    }
-                else:
-                    return {"error": f"Brave API error: {response.status_code}"}
+                return {
+                    "provider": "brave",
+                    "query": query,
+                    "results": results,
+                    "total_results": len(results)
+                }
+            else:
+                return {"error": f"Brave API error: {response.status_code}"}
 
         except Exception as e:
             return {"error": f"Brave search error: {str(e)}"}
@@ -212,39 +213,39 @@ class SearchService:
             return {"error": "SerpAPI key not provided in node data"}
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    "https://serpapi.com/search",
-                    params={
-                        "q": query,
-                        "api_key": api_key,
-                        "engine": "google",
-                        "num": limit,
-                        "gl": "us",
-                        "hl": "en"
-                    }
-                )
+            client = get_http_client("serpapi")
+            response = await client.get(
+                "https://serpapi.com/search",
+                params={
+                    "q": query,
+                    "api_key": api_key,
+                    "engine": "google",
+                    "num": limit,
+                    "gl": "us",
+                    "hl": "en"
+                }
+            )
+
+            if response.status_code == 200:
+                data = response.json()
+                results = []
 
-                if response.status_code == 200:
-                    data = response.json()
-                    results = []
-                    
-                    for result in data.get("organic_results", []):
-                        results.append({
-                            "title": result.get("title", ""),
-                            "url": result.get("link", ""),
-                            "description": result.get("snippet", ""),
-                            "snippet": result.get("snippet", "")
-                        })
+                for result in data.get("organic_results", []):
+                    results.append({
+                        "title": result.get("title", ""),
+                        "url": result.get("link", ""),
+                        "description": result.get("snippet", ""),
+                        "snippet": result.get("snippet", "")
+                    })
 
-                    return {
-                        "provider": "serpapi",
-                        "query": query,
-                        "results": results,
-                        "total_results": len(results)
-                    }
-                else:
-                    return {"error": f"SerpAPI error: {response.status_code}"}
+                return {
+                    "provider": "serpapi",
+                    "query": query,
+                    "results": results,
+                    "total_results": len(results)
+                }
+            else:
+                return {"error": f"SerpAPI error: {response.status_code}"}
 
         except Exception as e:
             return {"error": f"SerpAPI search error: {str(e)}"}
@@ -1,15 +1,24 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.workflow import Workflow, WorkflowExecution
 from app.schemas.workflow import WorkflowCreate, WorkflowUpdate, ValidationResult, WorkflowNodeBase, WorkflowEdgeBase
 from app.services.ai_service import AIService
 from app.services.search_service import SearchService
 from app.services.document_service import DocumentService
 from app.services.api_key_service import ApiKeyService
-from typing import List, Optional, Dict, Any
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.utils.websocket_manager import websocket_manager
+from typing import List, Optional, Dict, Any, Set, Tuple, Callable, Awaitable
 import uuid
 import asyncio
+import heapq
+import logging
+import time
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 
 # Helper to convert UUIDs to strings recursively
 def convert_uuids(obj):
@@ -23,16 +32,138 @@ def convert_uuids(obj):
         return obj
 
 
+# Pipeline stage of each node type, used to order independent nodes deterministically
+NODE_TYPE_ORDER = {"userQuery": 1, "knowledgeBase": 2, "webSearch": 3, "llmEngine": 4, "output": 5}
+
+
+def build_dependency_graph(nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]]) -> Tuple[List[str], Dict[str, List[str]]]:
+    """
+    Topologically sort workflow nodes using their edges (Kahn's algorithm).
+    Returns: (execution_order, predecessors) where predecessors maps node id -> upstream node ids
+
+    Nodes that become ready at the same time are ordered by NODE_TYPE_ORDER.
+    Workflows saved without edges are chained in NODE_TYPE_ORDER, as before.
+    """
+    node_ids = [node["id"] for node in nodes]
+    node_types = {node["id"]: node["type"] for node in nodes}
+    index = {node_id: i for i, node_id in enumerate(node_ids)}
+
+    def sort_key(node_id: str) -> Tuple[int, int]:
+        return (NODE_TYPE_ORDER.get(node_types[node_id], 99), index[node_id])
+
+    predecessors: Dict[str, List[str]] = {node_id: [] for node_id in node_ids}
+    successors: Dict[str, List[str]] = {node_id: [] for node_id in node_ids}
+
+    valid_edges = [
+        (edge.get("source"), edge.get("target")) for edge in edges
+        if edge.get("source") in index and edge.get("target") in index and edge.get("source") != edge.get("target")
+    ]
+    if not valid_edges:
+        chained = sorted(node_ids, key=sort_key)
+        valid_edges = list(zip(chained, chained[1:]))
+
+    for source, target in valid_edges:
+        if source not in predecessors[target]:
+            predecessors[target].append(source)
+            successors[source].append(target)
+
+    in_degree = {node_id: len(preds) for node_id, preds in predecessors.items()}
+    ready = [(sort_key(node_id), node_id) for node_id in node_ids if in_degree[node_id] == 0]
+    heapq.heapify(ready)
+
+    execution_order = []
+    while ready:
+        _, node_id = heapq.heappop(ready)
+        execution_order.append(node_id)
+        for successor in successors[node_id]:
+            in_degree[successor] -= 1
+            if in_degree[successor] == 0:
+                heapq.heappush(ready, (sort_key(successor), successor))
+
+    if len(execution_order) != len(node_ids):
+        cyclic = [node_id for node_id in node_ids if in_degree[node_id] > 0]
+        raise ValueError(f"Workflow contains a cycle between nodes: {', '.join(cyclic)}")
+
+    return execution_order, predecessors
+
+
+class ExecutionTimeoutError(Exception):
+    """Raised when a workflow run exceeds its deadline"""
+
+    def __init__(self, timeout: float, node_ids: List[str]):
+        self.timeout = timeout
+        self.node_ids = node_ids
+        super().__init__(f"Execution exceeded its {timeout:g}s budget while running node(s): {', '.join(node_ids)}")
+
+
+async def wait_for_node_tasks(tasks: Dict[str, asyncio.Task], running: Set[str], timeout: Optional[float] = None):
+    """
+    Wait for the node tasks of a run (created in topological order).
+    If a node fails or the deadline passes, the outstanding tasks are cancelled; a timeout raises
+    ExecutionTimeoutError naming the nodes that were still running.
+    """
+    try:
+        done, pending = await asyncio.wait(tasks.values(), timeout=timeout, return_when=asyncio.FIRST_EXCEPTION)
+    except asyncio.CancelledError:
+        for task in tasks.values():
+            task.cancel()
+        raise
+
+    # Snapshot before cancelling: cancelled nodes leave the running set
+    overrunning = [node_id for node_id in tasks if node_id in running]
+    if pending:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    # Downstream nodes fail with their upstream's error, so the first failure in order is the cause
+    for task in tasks.values():
+        if task in done and not task.cancelled() and task.exception():
+            raise task.exception()
+
+    if pending:
+        waiting = [node_id for node_id, task in tasks.items() if task in pending]
+        raise ExecutionTimeoutError(timeout, overrunning or waiting)
+
+
+def select_result_node(execution_order: List[str], predecessors: Dict[str, List[str]], node_types: Dict[str, str]) -> str:
+    """
+    The node whose output is the result of a run: the Output node, or else the sink (a node
+    nothing depends on) of the latest pipeline stage. With concurrent scheduling the last node
+    in topological order can be an unrelated branch, so it is not used directly.
+    """
+    output_nodes = [node_id for node_id in execution_order if node_types[node_id] == "output"]
+    if output_nodes:
+        return output_nodes[-1]
+    upstream = {pred_id for preds in predecessors.values() for pred_id in preds}
+    sinks = [node_id for node_id in execution_order if node_id not in upstream]
+    return max(
+        reversed(sinks or execution_order),
+        key=lambda node_id: NODE_TYPE_ORDER.get(node_types[node_id], 0)
+    )
+
+
+def group_execution_levels(execution_order: List[str], predecessors: Dict[str, List[str]]) -> List[List[str]]:
+    """Group topologically sorted nodes into levels whose nodes can run concurrently"""
+    depth: Dict[str, int] = {}
+    levels: List[List[str]] = []
+    for node_id in execution_order:
+        depth[node_id] = max((depth[pred] + 1 for pred in predecessors[node_id]), default=0)
+        if depth[node_id] == len(levels):
+            levels.append([])
+        levels[depth[node_id]].append(node_id)
+    return levels
+
+
 class WorkflowService:
-    def __init__(self, db: Session = None):
+    def __init__(self, db: AsyncSession = None):
         self.db = db
         self.ai_service = AIService()
         self.search_service = SearchService()
         self.document_service = DocumentService()
-        if db:
-            self.api_key_service = ApiKeyService(db)
+        self.api_key_service = ApiKeyService(db) if db else None
 
-    def create_workflow(self, user_id: str, workflow_data: WorkflowCreate) -> Workflow:
+    async def create_workflow(self, user_id: str, workflow_data: WorkflowCreate) -> Workflow:
         """Create a new workflow"""
         db_workflow = Workflow(
             name=workflow_data.name,
@@ -42,26 +173,28 @@ class WorkflowService:
             edges=[edge.dict() for edge in workflow_data.edges]
         )
         self.db.add(db_workflow)
-        self.db.commit()
-        self.db.refresh(db_workflow)
+        await self.db.commit()
+        await self.db.refresh(db_workflow)
         return db_workflow
 
-    def get_workflow(self, workflow_id: str, user_id: str) -> Optional[Workflow]:
+    async def get_workflow(self, workflow_id: str, user_id: str) -> Optional[Workflow]:
         """Get workflow by ID for specific user"""
-        return self.db.query(Workflow).filter(
+        result = await self.db.execute(select(Workflow).filter(
             Workflow.id == workflow_id,
             Workflow.user_id == user_id
-        ).first()
+        ))
+        return result.scalars().first()
 
-    def get_user_workflows(self, user_id: str, skip: int = 0, limit: int = 100) -> List[Workflow]:
+    async def get_user_workflows(self, user_id: str, skip: int = 0, limit: int = 100) -> List[Workflow]:
         """Get all workflows for a user"""
-        return self.db.query(Workflow).filter(
+        result = await self.db.execute(select(Workflow).filter(
             Workflow.user_id == user_id
-        ).offset(skip).limit(limit).all()
+        ).offset(skip).limit(limit))
+        return result.scalars().all()
 
-    def update_workflow(self, workflow_id: str, user_id: str, workflow_data: WorkflowUpdate) -> Optional[Workflow]:
+    async def update_workflow(self, workflow_id: str, user_id: str, workflow_data: WorkflowUpdate) -> Optional[Workflow]:
         """Update workflow"""
-        workflow = self.get_workflow(workflow_id, user_id)
+        workflow = await self.get_workflow(workflow_id, user_id)
         if not workflow:
             return None
 
@@ -76,21 +209,21 @@ class WorkflowService:
         for key, value in update_data.items():
             setattr(workflow, key, value)
 
-        self.db.commit()
-        self.db.refresh(workflow)
+        await self.db.commit()
+        await self.db.refresh(workflow)
         return workflow
 
-    def delete_workflow(self, workflow_id: str, user_id: str) -> bool:
+    async def delete_workflow(self, workflow_id: str, user_id: str) -> bool:
         """Delete workflow"""
-        workflow = self.get_workflow(workflow_id, user_id)
+        workflow = await self.get_workflow(workflow_id, user_id)
         if not workflow:
             return False
 
-        self.db.delete(workflow)
-        self.db.commit()
+        await self.db.delete(workflow)
+        await self.db.commit()
         return True
 
-    def create_execution(self, workflow_id: str, user_id: str, query: str) -> WorkflowExecution:
+    async def create_execution(self, workflow_id: str, user_id: str, query: str) -> WorkflowExecution:
         """Create a new workflow execution"""
         execution_id = str(uuid.uuid4())
         db_execution = WorkflowExecution(
@@ -101,13 +234,14 @@ class WorkflowService:
             status="running"
         )
         self.db.add(db_execution)
-        self.db.commit()
-        self.db.refresh(db_execution)
+        await self.db.commit()
+        await self.db.refresh(db_execution)
         return db_execution
 
-    def update_execution_status(self, execution_id: str, status: str, result: dict = None, error: str = None) -> Optional[WorkflowExecution]:
+    async def update_execution_status(self, execution_id: str, status: str, result: dict = None, error: str = None) -> Optional[WorkflowExecution]:
         """Update execution status"""
-        execution = self.db.query(WorkflowExecution).filter(WorkflowExecution.id == execution_id).first()
+        query = await self.db.execute(select(WorkflowExecution).filter(WorkflowExecution.id == execution_id))
+        execution = query.scalars().first()
         if not execution:
             return None
 
@@ -119,8 +253,8 @@ class WorkflowService:
         if status in ["completed", "failed"]:
             execution.completed_at = datetime.utcnow()
 
-        self.db.commit()
-        self.db.refresh(execution)
+        await self.db.commit()
+        await self.db.refresh(execution)
         return execution
 
     def _has_path(self, source_id: str, target_id: str, edges: List[WorkflowEdgeBase]) -> bool:
@@ -210,37 +344,25 @@ class WorkflowService:
 
     async def build_execution_plan(self, nodes: List[WorkflowNodeBase], edges: List[WorkflowEdgeBase]) -> Dict[str, Any]:
         """Build execution plan from workflow nodes and edges"""
-        # Create execution graph
-        node_map = {node.id: node for node in nodes}
-        execution_order = []
-        
         # Find starting node (User Query)
         start_node = next((n for n in nodes if n.type == 'userQuery'), None)
         if not start_node:
             raise ValueError("No User Query node found")
         
-        # Build execution order using topological sort
-        visited = set()
-        def visit(node_id: str):
-            if node_id in visited:
-                return
-            visited.add(node_id)
-            
-            # Find outgoing edges
-            outgoing = [e for e in edges if e.source == node_id]
-            for edge in outgoing:
-                visit(edge.target)
-            
-            execution_order.insert(0, node_id)
-        
-        visit(start_node.id)
+        # Build execution order and parallel stages using topological sort
+        execution_order, predecessors = build_dependency_graph(
+            [node.dict() for node in nodes],
+            [edge.dict() for edge in edges]
+        )
         
         execution_plan = {
             "execution_order": execution_order,
+            "execution_levels": group_execution_levels(execution_order, predecessors),
             "nodes": {node.id: {
                 "type": node.type,
                 "configuration": node.data.get('configuration', {}),
-                "position": node.position
+                "position": node.position,
+                "depends_on": predecessors[node.id]
             } for node in nodes},
             "edges": [{
                 "source": edge.source,
@@ -253,208 +375,266 @@ class WorkflowService:
         
         return execution_plan
 
-    async def execute_workflow(self, nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]], query: str, execution_id: str, user_id: str = None, workflow_id: str = None) -> Dict[str, Any]:
-        """Execute workflow with given query"""
+    async def load_stored_api_keys(self, user_id: str) -> Dict[str, str]:
+        """
+        The user's stored API keys, read in a short session of their own: a run lasts as long as
+        its LLM and search calls, and no pooled connection should sit idle in a transaction meanwhile.
+        """
+        try:
+            async with AsyncSessionLocal() as db:
+                # All of the user's keys in one (cached) query
+                keys = await ApiKeyService(db).get_all_decrypted_keys(user_id)
+            return {key_name: key_value for key_name, key_value in keys.items() if key_value}
+        except Exception as e:
+            print(f"Warning: Could not retrieve stored API keys: {e}")
+            return {}
+
+    async def execute_workflow(self, nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]], query: str, execution_id: str, user_id: str = None, workflow_id: str = None, timeout: float = None, on_node_event: Optional[Callable[[str, Dict[str, Any], Dict[str, Any]], Awaitable[None]]] = None) -> Dict[str, Any]:
+        """
+        Execute workflow with given query, running independent branches concurrently within a deadline.
+        on_node_event, when given, is awaited with (event_type, node, data) as nodes start, complete or fail.
+        """
         context = {"query": query, "execution_id": execution_id}
         node_map = {node["id"]: node for node in nodes}
         start_node = next((n for n in nodes if n["type"] == "userQuery"), None)
         if not start_node:
             raise ValueError("No User Query node found")
-        current_output = query
 
         # Get stored API keys for the user
-        stored_api_keys = {}
-        if user_id and self.api_key_service:
+        stored_api_keys = await self.load_stored_api_keys(user_id) if user_id else {}
+
+        # Schedule nodes from the edges so that independent branches run concurrently
+        execution_order, predecessors = build_dependency_graph(nodes, edges)
+        logger.debug(f"Execution order: {[node_map[node_id]['type'] for node_id in execution_order]}")
+
+        outputs: Dict[str, str] = {}
+        node_timings: Dict[str, Dict[str, Any]] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+        running: Set[str] = set()
+        run_started = time.perf_counter()
+
+        async def run_node(node_id: str) -> str:
+            upstream = predecessors[node_id]
+            if upstream:
+                await asyncio.gather(*(tasks[pred_id] for pred_id in upstream))
+            node = node_map[node_id]
+            node_input = self._select_node_input(upstream, node_map, outputs, query)
+
+            if on_node_event:
+                await on_node_event("node_started", node, {"depends_on": upstream})
+            node_started = time.perf_counter()
+            running.add(node_id)
             try:
-                # Get all stored API keys for the user
-                for key_name in ["openai", "serpapi", "brave", "huggingface", "gemini"]:
-                    key_value = self.api_key_service.get_decrypted_api_key(user_id, key_name)
-                    if key_value:
-                        stored_api_keys[key_name] = key_value
+                output = await self._execute_node(node, node_input, context, stored_api_keys, workflow_id)
             except Exception as e:
-                print(f"Warning: Could not retrieve stored API keys: {e}")
+                if on_node_event:
+                    await on_node_event("node_error", node, {"error": str(e)})
+                raise
+            finally:
+                running.discard(node_id)
+            node_finished = time.perf_counter()
+
+            outputs[node_id] = output
+            node_timings[node_id] = {
+                "type": node["type"],
+                "depends_on": upstream,
+                "started_at_ms": round((node_started - run_started) * 1000, 2),
+                "duration_ms": round((node_finished - node_started) * 1000, 2)
+            }
+            if on_node_event:
+                await on_node_event("node_completed", node, {"output": output, **node_timings[node_id]})
+            return output
+
+        # Nodes are created in topological order, so every upstream task exists before it is awaited
+        for node_id in execution_order:
+            tasks[node_id] = asyncio.create_task(run_node(node_id))
+
+        await wait_for_node_tasks(tasks, running, timeout or settings.execution_timeout)
+
+        total_duration_ms = round((time.perf_counter() - run_started) * 1000, 2)
+        result_node_id = select_result_node(
+            execution_order, predecessors, {node_id: node["type"] for node_id, node in node_map.items()}
+        )
+        current_output = outputs[result_node_id]
 
-        # Sort nodes to ensure proper execution order: userQuery -> knowledgeBase -> llmEngine -> output
-        node_order = {"userQuery": 1, "knowledgeBase": 2, "webSearch": 3, "llmEngine": 4, "output": 5}
-        sorted_nodes = sorted(nodes, key=lambda x: node_order.get(x["type"], 99))
+        result = {
+            "result": current_output,
+            "execution_context": context,
+            "status": "completed",
+            "execution_id": execution_id,
+            "completed_at": datetime.utcnow().isoformat(),
+            "execution_order": execution_order,
+            "timings": {
+                "total_duration_ms": total_duration_ms,
+                "sum_node_duration_ms": round(sum(t["duration_ms"] for t in node_timings.values()), 2),
+                "nodes": node_timings
+            }
+        }
         
-        print(f"DEBUG: Original node order: {[n['type'] for n in nodes]}")
-        print(f"DEBUG: Sorted node order: {[n['type'] for n in sorted_nodes]}")
-
-        for node in sorted_nodes:
-            node_type = node["type"]
-            # Try to get config from data.config first, then fall back to data directly
-            node_data = node.get("data", {})
-            node_config = node_data.get("config", {})
+        # Add search sources to result if available
+        if "search_sources" in context:
+            result["search_sources"] = context["search_sources"]
             
-            # If config is empty, use the data directly (for backward compatibility)
-            if not node_config:
-                node_config = node_data
-                
-            print(f"DEBUG: Processing node type={node_type}, config={node_config}")
-            print(f"DEBUG: Full node data: {node.get('data', {})}")
-            print(f"DEBUG: Node keys: {list(node.keys())}")
-            if "data" in node:
-                print(f"DEBUG: Data keys: {list(node['data'].keys())}")
+        return convert_uuids(result)
+
+    def _select_node_input(self, upstream: List[str], node_map: Dict[str, Dict[str, Any]], outputs: Dict[str, str], query: str) -> str:
+        """Pick the input for a node from the outputs of its upstream nodes.
+
+        When several branches meet, the output of the latest pipeline stage wins
+        (e.g. web search results over the pass-through knowledge base output),
+        which matches the old sequential behaviour.
+        """
+        if not upstream:
+            return query
+        source_id = max(
+            upstream,
+            key=lambda node_id: NODE_TYPE_ORDER.get(node_map[node_id]["type"], 99)
+        )
+        return outputs[source_id]
+
+    async def _execute_node(self, node: Dict[str, Any], current_output: str, context: Dict[str, Any], stored_api_keys: Dict[str, str], workflow_id: str = None) -> str:
+        """Execute a single workflow node and return its output"""
+        node_type = node["type"]
+        query = context["query"]
+        # Try to get config from data.config first, then fall back to data directly
+        node_data = node.get("data", {})
+        node_config = node_data.get("config", {})
+        
+        # If config is empty, use the data directly (for backward compatibility)
+        if not node_config:
+            node_config = node_data
             
-            if node_type == "userQuery":
-                context["user_query"] = query
-                current_output = query
-            elif node_type == "knowledgeBase":
-                # For Knowledge Base nodes, search all documents for this workflow
-                if workflow_id:
+        print(f"DEBUG: Processing node type={node_type}, config={node_config}")
+        
+        if node_type == "userQuery":
+            context["user_query"] = query
+            current_output = query
+        elif node_type == "knowledgeBase":
+            # For Knowledge Base nodes, retrieve the most relevant chunks of this workflow's documents
+            if workflow_id:
+                try:
+                    query_embedding = None
+                    
+                    print(f"DEBUG: Processing knowledgeBase node for workflow {workflow_id}")
+                    print(f"DEBUG: Current output for embedding search: {current_output}")
+                    
+                    # Try to get query embedding - determine which embedding model and API key to use
+                    embedding_model = node_config.get("embeddingModel", "all-MiniLM-L6-v2")  # Default to MiniLM model
+                    embedding_api_key = None
+                    
+                    # Check for API key in node config first
+                    embedding_api_key = node_config.get("apiKey")  # Knowledge Base nodes store API key in apiKey field
+                    
+                    if embedding_model == "all-MiniLM-L6-v2":
+                        if not embedding_api_key:
+                            embedding_api_key = stored_api_keys.get("huggingface")
+                    else:
+                        if not embedding_api_key:
+                            embedding_api_key = stored_api_keys.get("openai")
+                    
+                    print(f"DEBUG: Using embedding model: {embedding_model}")
+                    print(f"DEBUG: API key available: {bool(embedding_api_key)}")
+                    
                     try:
-                        # Search documents in ChromaDB for this workflow
-                        collection = self.document_service._get_or_create_collection()
-                        query_embedding = None
-                        
-                        print(f"DEBUG: Processing knowledgeBase node for workflow {workflow_id}")
-                        print(f"DEBUG: Current output for embedding search: {current_output}")
-                        
-                        # Try to get query embedding - determine which embedding model and API key to use
-                        embedding_model = node_config.get("embeddingModel", "all-MiniLM-L6-v2")  # Default to HuggingFace model
-                        embedding_api_key = None
-                        
-                        # Check for API key in node config first
-                        embedding_api_key = node_config.get("apiKey")  # Knowledge Base nodes store API key in apiKey field
-                        
-                        if embedding_model == "all-MiniLM-L6-v2":
-                            if not embedding_api_key:
-                                embedding_api_key = stored_api_keys.get("huggingface")
-                        else:
-                            if not embedding_api_key:
-                                embedding_api_key = stored_api_keys.get("openai")
-                        
-                        print(f"DEBUG: Using embedding model: {embedding_model}")
-                        print(f"DEBUG: API key available: {bool(embedding_api_key)}")
-                        
-                        try:
-                            from app.services.ai_service import AIService
-                            ai_service = AIService()
-                            if embedding_api_key:
-                                query_embedding = await ai_service.generate_embeddings(
-                                    current_output, 
-                                    model=embedding_model, 
-                                    api_key=embedding_api_key
-                                )
-                                print(f"DEBUG: Generated embedding: {bool(query_embedding)}")
-                        except Exception as e:
-                            print(f"DEBUG: Could not generate embeddings: {e}")
-                        
-                        # Always try to get documents first (more reliable)
-                        print(f"DEBUG: Getting all documents for workflow: {workflow_id}")
-                        try:
-                            all_results = collection.get(
-                                where={"workflow_id": workflow_id}
+                        if embedding_api_key or not self.ai_service.embeddings_require_api_key(embedding_model):
+                            query_embedding = await self.ai_service.generate_embeddings(
+                                current_output, 
+                                model=embedding_model, 
+                                api_key=embedding_api_key
                             )
-                            print(f"DEBUG: Documents retrieval successful: {bool(all_results and all_results['documents'])}")
-                            
-                            if all_results and all_results['documents']:
-                                # Use all documents as context (they're already chunked appropriately)
-                                relevant_content = "\n\n".join(all_results['documents'])
-                                context["knowledge_context"] = all_results['documents']
-                                print(f"DEBUG: Document context set, total length: {len(relevant_content)}")
-                                
-                                # If we have embeddings, try to search for most relevant parts
-                                if query_embedding:
-                                    try:
-                                        print(f"DEBUG: Attempting embedding search for workflow: {workflow_id}")
-                                        results = collection.query(
-                                            query_embeddings=[query_embedding],
-                                            n_results=3,
-                                            where={"workflow_id": workflow_id}
-                                        )
-                                        
-                                        if results and results['documents'] and results['documents'][0]:
-                                            # Use semantic search results if available
-                                            relevant_content = "\n\n".join(results['documents'][0])
-                                            context["knowledge_context"] = results['documents'][0]
-                                            print(f"DEBUG: Using semantic search results, length: {len(relevant_content)}")
-                                        
-                                    except Exception as e:
-                                        print(f"DEBUG: Embedding search failed (dimension mismatch), using all documents: {e}")
-                                        # Keep using all documents as fallback
-                                
-                            else:
-                                print(f"DEBUG: No documents found for workflow: {workflow_id}")
-                                
-                        except Exception as e:
-                            print(f"DEBUG: Could not retrieve documents: {e}")
+                            print(f"DEBUG: Generated embedding: {bool(query_embedding)}")
                     except Exception as e:
-                        print(f"DEBUG: Knowledge Base processing failed: {e}")
-                        # Continue without knowledge base context
-            elif node_type == "llmEngine":
-                model = node_config.get("model", "gpt-3.5-turbo")
-                system_prompt = node_config.get("systemPrompt", "You are a helpful assistant.")
-                
-                print(f"DEBUG LLM Engine: model={model}")
-                print(f"DEBUG LLM Engine: stored_api_keys available: {list(stored_api_keys.keys())}")
-                
-                # Get API key - prefer node config, fallback to stored key based on model type
-                llm_api_key = node_config.get("apiKey")
-                print(f"DEBUG LLM Engine: node_config apiKey={llm_api_key}")
-                
-                if not llm_api_key:
-                    # Determine API key type based on model
-                    if model.startswith("gpt-") or model.startswith("text-") or model.startswith("davinci"):
-                        llm_api_key = stored_api_keys.get("openai")
-                        print(f"DEBUG LLM Engine: Detected OpenAI model, using openai key: {bool(llm_api_key)}")
-                    elif model.startswith("gemini-") or "gemini" in model.lower() or "flash" in model.lower():
-                        llm_api_key = stored_api_keys.get("gemini")
-                        print(f"DEBUG LLM Engine: Detected Gemini model, using gemini key: {bool(llm_api_key)}")
+                        print(f"DEBUG: Could not generate embeddings: {e}")
+                    
+                    # Hybrid BM25 + vector retrieval bounded by a token budget (BM25 alone without an embedding)
+                    knowledge_context = await self.document_service.retrieve_workflow_context(
+                        workflow_id,
+                        current_output,
+                        query_embedding=query_embedding,
+                        top_k=node_config.get("topK"),
+                        max_tokens=node_config.get("contextTokenBudget")
+                    )
+                    
+                    if knowledge_context:
+                        context["knowledge_context"] = knowledge_context
+                        print(f"DEBUG: Document context set from {len(knowledge_context)} chunks, total length: {sum(len(c) for c in knowledge_context)}")
                     else:
-                        # Default to trying both
-                        llm_api_key = stored_api_keys.get("gemini") or stored_api_keys.get("openai")
-                        print(f"DEBUG LLM Engine: Unknown model, using fallback key: {bool(llm_api_key)}")
-                
-                print(f"DEBUG LLM Engine: Final API key available: {bool(llm_api_key)}")
-                print(f"DEBUG LLM Engine: Model for AI service call: {model}")
-                
-                # Enhanced Web search integration
-                webSearchEnabled = node_config.get("webSearchEnabled", False)
+                        print(f"DEBUG: No documents found for workflow: {workflow_id}")
+                except Exception as e:
+                    print(f"DEBUG: Knowledge Base processing failed: {e}")
+                    # Continue without knowledge base context
+        elif node_type == "llmEngine":
+            model = node_config.get("model", "gpt-3.5-turbo")
+            system_prompt = node_config.get("systemPrompt", "You are a helpful assistant.")
+            
+            print(f"DEBUG LLM Engine: model={model}")
+            print(f"DEBUG LLM Engine: stored_api_keys available: {list(stored_api_keys.keys())}")
+            
+            # Get API key - prefer node config, fallback to stored key based on model type
+            llm_api_key = node_config.get("apiKey")
+            print(f"DEBUG LLM Engine: node_config apiKey={llm_api_key}")
+            
+            if not llm_api_key:
+                # Determine API key type based on model
+                if model.startswith("gpt-") or model.startswith("text-") or model.startswith("davinci"):
+                    llm_api_key = stored_api_keys.get("openai")
+                    print(f"DEBUG LLM Engine: Detected OpenAI model, using openai key: {bool(llm_api_key)}")
+                elif model.startswith("gemini-") or "gemini" in model.lower() or "flash" in model.lower():
+                    llm_api_key = stored_api_keys.get("gemini")
+                    print(f"DEBUG LLM Engine: Detected Gemini model, using gemini key: {bool(llm_api_key)}")
+                else:
+                    # Default to trying both
+                    llm_api_key = stored_api_keys.get("gemini") or stored_api_keys.get("openai")
+                    print(f"DEBUG LLM Engine: Unknown model, using fallback key: {bool(llm_api_key)}")
+            
+            print(f"DEBUG LLM Engine: Final API key available: {bool(llm_api_key)}")
+            print(f"DEBUG LLM Engine: Model for AI service call: {model}")
+            
+            # Enhanced Web search integration
+            webSearchEnabled = node_config.get("webSearchEnabled", False)
+            
+            if webSearchEnabled:
+                search_provider = "serpapi"  # Default to serpapi for web search
+                search_api_key = node_config.get("serpApiKey") or stored_api_keys.get("serpapi")
                 
-                if webSearchEnabled:
-                    search_provider = "serpapi"  # Default to serpapi for web search
-                    search_api_key = node_config.get("serpApiKey") or stored_api_keys.get("serpapi")
+                if search_api_key:
+                    # Enhanced web search: Identify items from documents and fetch prices
+                    search_results, enhanced_sources = await self._perform_enhanced_web_search(
+                        query=current_output,
+                        context=context,
+                        search_provider=search_provider,
+                        search_api_key=search_api_key
+                    )
                     
-                    if search_api_key:
-                        # Enhanced web search: Identify items from documents and fetch prices
-                        search_results, enhanced_sources = await self._perform_enhanced_web_search(
-                            query=current_output,
-                            context=context,
-                            search_provider=search_provider,
-                            search_api_key=search_api_key
+                    if search_results:
+                        context["search_results"] = search_results
+                        
+                        # Store enhanced sources for frontend display (max 2-3 sources)
+                        if enhanced_sources:
+                            context["search_sources"] = enhanced_sources[:3]  # Limit to 3 sources
+                        
+                        # Use enhanced formatting from search service
+                        search_context = self.search_service.format_search_results_for_llm(
+                            results=search_results,
+                            search_analysis=None,
+                            max_results=5
                         )
                         
-                        if search_results:
-                            context["search_results"] = search_results
-                            
-                            # Store enhanced sources for frontend display (max 2-3 sources)
-                            if enhanced_sources:
-                                context["search_sources"] = enhanced_sources[:3]  # Limit to 3 sources
-                            
-                            # Use enhanced formatting from search service
-                            search_context = self.search_service.format_search_results_for_llm(
-                                results=search_results,
-                                search_analysis=None,
-                                max_results=5
-                            )
-                            
-                            system_prompt += f"\n\n{search_context}"
-                            print(f"DEBUG: Added {len(search_results)} search results to context with {len(enhanced_sources) if enhanced_sources else 0} enhanced sources")
-                        else:
-                            print(f"DEBUG: No search results found for query: '{current_output}'")
+                        system_prompt += f"\n\n{search_context}"
+                        print(f"DEBUG: Added {len(search_results)} search results to context with {len(enhanced_sources) if enhanced_sources else 0} enhanced sources")
                     else:
-                        print(f"DEBUG: No API key available for {search_provider} search")
+                        print(f"DEBUG: No search results found for query: '{current_output}'")
+                else:
+                    print(f"DEBUG: No API key available for {search_provider} search")
+            
+            # Add document context to system prompt if available
+            if "knowledge_context" in context and context["knowledge_context"]:
+                context_content = "\n\n".join(context["knowledge_context"])
+                print(f"DEBUG: Adding document context to LLM, length: {len(context_content)}")
                 
-                # Add document context to system prompt if available
-                if "knowledge_context" in context and context["knowledge_context"]:
-                    context_content = "\n\n".join(context["knowledge_context"])
-                    print(f"DEBUG: Adding document context to LLM, length: {len(context_content)}")
-                    
-                    # Enhanced prompt when we have both documents and web search
-                    if webSearchEnabled and "search_results" in context:
-                        system_prompt += f"""
+                # Enhanced prompt when we have both documents and web search
+                if webSearchEnabled and "search_results" in context:
+                    system_prompt += f"""
 
 === DOCUMENT CONTENT ===
 The following content is from documents that the user has uploaded:
@@ -479,22 +659,33 @@ Focus on being helpful with actionable information including:
 - Recommendations based on both sources
 
 Always cite your sources and distinguish between document information and current web data."""
-                    else:
-                        system_prompt += f"\n\n=== DOCUMENT CONTENT ===\nThe following content is from documents that the user has uploaded and wants to discuss. This is the actual content from their documents:\n\n{context_content}\n\n=== END DOCUMENT CONTENT ===\n\nBased on the document content above, please provide accurate and detailed responses to the user's questions. Always reference specific parts of the document when answering."
                 else:
-                    print(f"DEBUG: No document context available for LLM")
-                
-                messages = [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": current_output}
-                ]
-                
-                print(f"DEBUG: About to call AI service with:")
-                print(f"  model={model}")
-                print(f"  api_key={'***' if llm_api_key else 'None'}")
-                print(f"  temperature={node_config.get('temperature', 0.7)}")
-                print(f"  max_tokens={node_config.get('maxTokens', 1000)}")
-                
+                    system_prompt += f"\n\n=== DOCUMENT CONTENT ===\nThe following content is from documents that the user has uploaded and wants to discuss. This is the actual content from their documents:\n\n{context_content}\n\n=== END DOCUMENT CONTENT ===\n\nBased on the document content above, please provide accurate and detailed responses to the user's questions. Always reference specific parts of the document when answering."
+            else:
+                print(f"DEBUG: No document context available for LLM")
+            
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": current_output}
+            ]
+            
+            print(f"DEBUG: About to call AI service with:")
+            print(f"  model={model}")
+            print(f"  api_key={'***' if llm_api_key else 'None'}")
+            print(f"  temperature={node_config.get('temperature', 0.7)}")
+            print(f"  max_tokens={node_config.get('maxTokens', 1000)}")
+            
+            if settings.llm_streaming_enabled:
+                current_output = await self._stream_llm_response(
+                    context["execution_id"],
+                    node["id"],
+                    messages=messages,
+                    model=model,
+                    temperature=node_config.get("temperature", 0.7),
+                    max_tokens=node_config.get("maxTokens", 1000),
+                    api_key=llm_api_key
+                )
+            else:
                 response = await self.ai_service.generate_response(
                     messages=messages,
                     model=model,
@@ -502,42 +693,45 @@ Always cite your sources and distinguish between document information and curren
                     max_tokens=node_config.get("maxTokens", 1000),
                     api_key=llm_api_key
                 )
-                
-                print(f"DEBUG: AI service response: {response.get('content', 'No content')}")
                 current_output = response["content"]
-                context["llm_response"] = current_output
-            elif node_type == "webSearch":
-                provider = node_config.get("provider", "brave")
-                # Get API key - prefer node config, fallback to stored key
-                search_api_key = node_config.get("apiKey") or stored_api_keys.get(provider)
-                search_results = await self.search_service.search(
-                    query=current_output,
-                    provider=provider,
-                    num_results=node_config.get("numResults", 5),
-                    api_key=search_api_key
-                )
-                context["search_results"] = search_results
-                formatted_results = "\n".join([
-                    f"Title: {result.get('title', '')}\nURL: {result.get('url', '')}\nSnippet: {result.get('snippet', '')}\n"
-                    for result in search_results
-                ])
-                current_output = f"Search Query: {current_output}\n\nSearch Results:\n{formatted_results}"
-            elif node_type == "output":
-                output_format = node_config.get("format", "text")
-                context["final_output"] = current_output
-        result = {
-            "result": current_output,
-            "execution_context": context,
-            "status": "completed",
-            "execution_id": execution_id,
-            "completed_at": datetime.utcnow().isoformat()
-        }
-        
-        # Add search sources to result if available
-        if "search_sources" in context:
-            result["search_sources"] = context["search_sources"]
             
-        return convert_uuids(result)
+            print(f"DEBUG: AI service response: {current_output}")
+            context["llm_response"] = current_output
+        elif node_type == "webSearch":
+            provider = node_config.get("provider", "brave")
+            # Get API key - prefer node config, fallback to stored key
+            search_api_key = node_config.get("apiKey") or stored_api_keys.get(provider)
+            search_results = await self.search_service.search(
+                query=current_output,
+                provider=provider,
+                num_results=node_config.get("numResults", 5),
+                api_key=search_api_key
+            )
+            context["search_results"] = search_results
+            formatted_results = "\n".join([
+                f"Title: {result.get('title', '')}\nURL: {result.get('url', '')}\nSnippet: {result.get('snippet', '')}\n"
+                for result in search_results
+            ])
+            current_output = f"Search Query: {current_output}\n\nSearch Results:\n{formatted_results}"
+        elif node_type == "output":
+            output_format = node_config.get("format", "text")
+            context["final_output"] = current_output
+        return current_output
+
+    async def _stream_llm_response(self, execution_id: str, node_id: str, **request) -> str:
+        """Stream an LLM response, forwarding each chunk to the execution's WebSocket clients"""
+        chunks = []
+        async for chunk in self.ai_service.stream_response(**request):
+            await websocket_manager.send_to_execution(str(execution_id), {
+                "execution_id": str(execution_id),
+                "node_id": node_id,
+                "event_type": "llm_token",
+                "message": chunk,
+                "timestamp": datetime.utcnow().isoformat(),
+                "data": {"index": len(chunks)}
+            })
+            chunks.append(chunk)
+        return "".join(chunks)
 
     async def _perform_enhanced_web_search(self, query: str, context: Dict[str, Any], search_provider: str, search_api_key: str) -> tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
         """
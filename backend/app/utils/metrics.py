@@ -37,12 +37,83 @@ websocket_connections_active = Gauge(
 
 db_connections_active = Gauge(
     'db_connections_active',
-    'Active database connections'
+    'Active database connections',
+    ['pool']
 )
 
 db_connections_idle = Gauge(
     'db_connections_idle',
-    'Idle database connections'
+    'Idle database connections',
+    ['pool']
+)
+
+db_pool_checkout_wait_seconds = Histogram(
+    'db_pool_checkout_wait_seconds',
+    'Time spent waiting for a pooled database connection',
+    ['pool'],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+execution_log_rows_total = Counter(
+    'execution_log_rows_total',
+    'Execution log rows written by the background writer',
+    ['status']
+)
+
+execution_log_flush_duration_seconds = Histogram(
+    'execution_log_flush_duration_seconds',
+    'Duration of execution log batch inserts'
+)
+
+execution_log_queue_depth = Gauge(
+    'execution_log_queue_depth',
+    'Execution log rows waiting to be written'
+)
+
+execution_log_backpressure_total = Counter(
+    'execution_log_backpressure_total',
+    'Execution log rows that had to wait for space in a full queue'
+)
+
+db_pool_checkout_timeouts_total = Counter(
+    'db_pool_checkout_timeouts_total',
+    'Database connection checkouts that timed out',
+    ['pool']
+)
+
+execution_queue_depth = Gauge(
+    'execution_queue_depth',
+    'Workflow runs waiting for an execution slot'
+)
+
+executions_running = Gauge(
+    'executions_running',
+    'Workflow runs currently executing'
+)
+
+execution_queue_wait_seconds = Histogram(
+    'execution_queue_wait_seconds',
+    'Time workflow runs wait in the queue before starting',
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+)
+
+execution_rejections_total = Counter(
+    'execution_rejections_total',
+    'Workflow runs rejected because the execution queues were full',
+    ['reason']
+)
+
+executions_recovered_total = Counter(
+    'executions_recovered_total',
+    'Executions found with an expired lease',
+    ['outcome']
+)
+
+password_hash_queue_wait_seconds = Histogram(
+    'password_hash_queue_wait_seconds',
+    'Time password hash/verify calls wait for a worker',
+    ['operation'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
 )
 
 document_uploads_total = Counter(
@@ -51,12 +122,41 @@ document_uploads_total = Counter(
     ['status']
 )
 
+text_extraction_duration_seconds = Histogram(
+    'text_extraction_duration_seconds',
+    'Duration of document text extraction',
+    ['file_type']
+)
+
+ingest_stage_duration_seconds = Histogram(
+    'ingest_stage_duration_seconds',
+    'Time a document spends in each stage of the ingestion pipeline',
+    ['stage']
+)
+
+document_dedup_total = Counter(
+    'document_dedup_total',
+    'Uploads that reused stored content instead of redoing the work',
+    ['kind']
+)
+
 embedding_operations_total = Counter(
     'embedding_operations_total',
     'Total embedding operations',
     ['operation_type']
 )
 
+embedding_cache_hits_total = Counter(
+    'embedding_cache_hits_total',
+    'Embedding cache hits',
+    ['tier']
+)
+
+embedding_cache_misses_total = Counter(
+    'embedding_cache_misses_total',
+    'Embedding cache misses'
+)
+
 llm_requests_total = Counter(
     'llm_requests_total',
     'Total LLM requests',
@@ -129,6 +229,27 @@ class MetricsMiddleware:
             
         document_uploads_total.labels(status=status).inc()
     
+    def track_text_extraction(self, file_type: str, duration: float):
+        """Track document text extraction duration"""
+        if not settings.prometheus_enabled:
+            return
+            
+        text_extraction_duration_seconds.labels(file_type=file_type).observe(duration)
+    
+    def track_ingest_stage(self, stage: str, duration: float):
+        """Track time a document spent in an ingestion stage"""
+        if not settings.prometheus_enabled:
+            return
+            
+        ingest_stage_duration_seconds.labels(stage=stage).observe(duration)
+    
+    def track_document_dedup(self, kind: str):
+        """Track an upload that reused a stored blob, extracted text or embeddings, or duplicated a document"""
+        if not settings.prometheus_enabled:
+            return
+            
+        document_dedup_total.labels(kind=kind).inc()
+    
     def track_embedding_operation(self, operation_type: str):
         """Track embedding operation metrics"""
         if not settings.prometheus_enabled:
@@ -136,6 +257,20 @@ class MetricsMiddleware:
             
         embedding_operations_total.labels(operation_type=operation_type).inc()
     
+    def track_embedding_cache_hit(self, tier: str, count: int = 1):
+        """Track embedding cache hits per tier (memory or disk)"""
+        if not settings.prometheus_enabled or count <= 0:
+            return
+            
+        embedding_cache_hits_total.labels(tier=tier).inc(count)
+    
+    def track_embedding_cache_miss(self, count: int = 1):
+        """Track embedding cache misses"""
+        if not settings.prometheus_enabled or count <= 0:
+            return
+            
+        embedding_cache_misses_total.inc(count)
+    
     def track_llm_request(self, provider: str, status: str, duration: float = None):
         """Track LLM request metrics"""
         if not settings.prometheus_enabled:
@@ -153,13 +288,88 @@ class MetricsMiddleware:
             
         web_search_requests_total.labels(provider=provider, status=status).inc()
     
-    def update_db_connections(self, active: int, idle: int):
+    def update_db_connections(self, pool: str, active: int, idle: int):
         """Update active and idle database connections metrics"""
         if not settings.prometheus_enabled:
             return
             
-        db_connections_active.set(active)
-        db_connections_idle.set(idle)
+        db_connections_active.labels(pool=pool).set(active)
+        db_connections_idle.labels(pool=pool).set(idle)
+    
+    def track_execution_log_flush(self, status: str, rows: int, duration: float):
+        """Track a batch insert of execution log rows"""
+        if not settings.prometheus_enabled:
+            return
+            
+        execution_log_rows_total.labels(status=status).inc(rows)
+        execution_log_flush_duration_seconds.observe(duration)
+    
+    def update_execution_log_queue_depth(self, depth: int):
+        """Update the number of execution log rows waiting to be written"""
+        if not settings.prometheus_enabled:
+            return
+            
+        execution_log_queue_depth.set(depth)
+    
+    def track_execution_log_backpressure(self):
+        """Track an execution log row that waited for queue space"""
+        if not settings.prometheus_enabled:
+            return
+            
+        execution_log_backpressure_total.inc()
+    
+    def track_db_checkout_wait(self, pool: str, duration: float):
+        """Track time spent waiting for a pooled database connection"""
+        if not settings.prometheus_enabled:
+            return
+            
+        db_pool_checkout_wait_seconds.labels(pool=pool).observe(duration)
+    
+    def track_db_pool_timeout(self, pool: str):
+        """Track database connection checkouts that timed out"""
+        if not settings.prometheus_enabled:
+            return
+            
+        db_pool_checkout_timeouts_total.labels(pool=pool).inc()
+
+    
+    def track_password_hash_wait(self, operation: str, duration: float):
+        """Track time a password hash/verify call waited for a worker"""
+        if not settings.prometheus_enabled:
+            return
+            
+        password_hash_queue_wait_seconds.labels(operation=operation).observe(duration)
+
+    
+    def update_execution_queue(self, queued: int, running: int):
+        """Update the number of queued and running workflow runs"""
+        if not settings.prometheus_enabled:
+            return
+            
+        execution_queue_depth.set(queued)
+        executions_running.set(running)
+    
+    def track_execution_queue_wait(self, duration: float):
+        """Track time a workflow run waited before starting"""
+        if not settings.prometheus_enabled:
+            return
+            
+        execution_queue_wait_seconds.observe(duration)
+    
+    def track_execution_rejection(self, reason: str):
+        """Track a workflow run rejected by admission control"""
+        if not settings.prometheus_enabled:
+            return
+            
+        execution_rejections_total.labels(reason=reason).inc()
+
+    
+    def track_execution_recovery(self, outcome: str, count: int = 1):
+        """Track orphaned executions that were re-queued or failed"""
+        if not settings.prometheus_enabled:
+            return
+            
+        executions_recovered_total.labels(outcome=outcome).inc(count)
 
 
 # Global metrics instance
@@ -51,3 +51,10 @@ class WebSocketManager:
             return len(self.active_connections.get(execution_id, []))
         
         return sum(len(connections) for connections in self.active_connections.values())
+
+
+# Global WebSocket manager instance, shared by every producer of execution events
+websocket_manager = WebSocketManager()
+
+# Global WebSocket manager for background ingestion jobs, keyed by job id
+ingestion_websocket_manager = WebSocketManager()
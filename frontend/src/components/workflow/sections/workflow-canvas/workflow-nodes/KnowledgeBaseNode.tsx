@@ -40,6 +40,7 @@ export const KnowledgeBaseNode = ({ id, data, selected }: { id: string; data: Kn
   const [showApiKey, setShowApiKey] = useState(false);
   const [isUploading, setIsUploading] = useState(false);
   const [uploadStatus, setUploadStatus] = useState<'idle' | 'success' | 'error'>('idle');
+  const [duplicateNote, setDuplicateNote] = useState<string | null>(null);
   
   const fileInputRef = useRef<HTMLInputElement>(null);
   const params = useParams();
@@ -78,11 +79,29 @@ export const KnowledgeBaseNode = ({ id, data, selected }: { id: string; data: Kn
     try {
       const { workflowService } = await import('@/services/workflowService');
       const result = await workflowService.uploadDocuments(workflowId, files, embeddingModel, apiKey);
+      // Files are processed independently; only the ones that made it are added to the node.
+      // A duplicate is content the workflow already has: its existing document is attached instead.
+      const uploaded = result.files.filter(file => file.status === 'success' || file.status === 'duplicate');
+      const duplicates = result.files.filter(file => file.status === 'duplicate');
+      const knownIds = new Set(uploadedDocuments.map(doc => doc.id));
+      const added: UploadedDocument[] = [];
+      uploaded.forEach(file => {
+        const documentId = file.document_id as string;
+        if (!documentId || knownIds.has(documentId)) {
+          return;
+        }
+        knownIds.add(documentId);
+        added.push({
+          id: documentId,
+          filename: file.filename as string,
+          file_size: file.size as number | undefined
+        });
+      });
 
       data?.onUpdate?.(id, {
         data: {
           ...data,
-          uploadedDocuments: [...uploadedDocuments, ...(result.files as unknown as UploadedDocument[])],
+          uploadedDocuments: [...uploadedDocuments, ...added],
           file: null,
           fileList: []
         }
@@ -96,8 +115,23 @@ export const KnowledgeBaseNode = ({ id, data, selected }: { id: string; data: Kn
         data.clearValidationError(id, 'knowledgeBase', 'file');
       }
 
-      setUploadStatus('success');
-      setTimeout(() => setUploadStatus('idle'), 3000);
+      if (duplicates.length > 0) {
+        setDuplicateNote(
+          duplicates.length === 1
+            ? `${duplicates[0].filename} was already uploaded`
+            : `${duplicates.length} files were already uploaded`
+        );
+        setTimeout(() => setDuplicateNote(null), 5000);
+      }
+
+      if (uploaded.length < result.files.length) {
+        console.error('Some files failed to upload:', result.files.filter(file => file.status !== 'success' && file.status !== 'duplicate'));
+        setUploadStatus('error');
+        setTimeout(() => setUploadStatus('idle'), 5000);
+      } else {
+        setUploadStatus('success');
+        setTimeout(() => setUploadStatus('idle'), 3000);
+      }
 
     } catch (error) {
       console.error('File upload failed:', error);
@@ -209,6 +243,9 @@ export const KnowledgeBaseNode = ({ id, data, selected }: { id: string; data: Kn
               onChange={handleFileChange}
               disabled={isUploading}
             />
+            {duplicateNote && (
+              <div className="text-xs text-muted-foreground mt-1">{duplicateNote}</div>
+            )}
             {fileInputErrors.length > 0 && (
               <div id={`${id}-kb-file-error`} className="text-xs text-destructive mt-1">
                 {fileInputErrors.map((err: { error: string }, idx: number) => (
@@ -137,7 +137,7 @@ export const workflowService = {
     files: File[],
     embeddingModel: string,
     apiKey: string
-  ): Promise<{ message: string; files: Record<string, unknown>[] }> => {
+  ): Promise<{ message: string; files: Record<string, unknown>[]; stats: Record<string, unknown> }> => {
     const formData = new FormData();
     files.forEach(file => {
       formData.append('files', file);